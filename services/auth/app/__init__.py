@@ -1,9 +1,8 @@
 import os, sys, logging
 from flask import Flask
-from flask_mysqldb import MySQL
 
 from .routes import auth_bp
-from .extensions import mysql
+from .extensions import mysql_pool, user_cache, jwt_keys
 
 # Configure basic logging for the app (ensure this is done once, early)
 logging.basicConfig(
@@ -24,8 +23,27 @@ def create_app():
     app.config["MYSQL_PASSWORD"] = os.environ.get("MYSQL_PASSWORD")
     app.config["MYSQL_DB"] = os.environ.get("MYSQL_DB")
     app.config["MYSQL_PORT"] = int(os.environ.get("MYSQL_PORT"))
-
-    mysql.init_app(app)
+    app.config["MYSQL_CONNECT_TIMEOUT"] = int(os.environ.get("MYSQL_CONNECT_TIMEOUT", "5"))
+
+    # Pooled MySQL connections (replaces flask_mysqldb's connect-per-request)
+    app.config["MYSQL_POOL_SIZE"] = int(os.environ.get("MYSQL_POOL_SIZE", "8"))
+    app.config["MYSQL_POOL_TIMEOUT"] = float(os.environ.get("MYSQL_POOL_TIMEOUT", "5"))
+    app.config["MYSQL_POOL_RECYCLE"] = int(os.environ.get("MYSQL_POOL_RECYCLE", "3600"))
+    app.config["MYSQL_POOL_PING_AFTER"] = int(os.environ.get("MYSQL_POOL_PING_AFTER", "30"))
+
+    # Optional cache of user rows for /login (seconds; 0 disables)
+    app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", "0"))
+    app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+
+    # JWT signing: HS256 (shared JWT_SECRET) or RS256/EdDSA with rotating keys
+    app.config["JWT_ALGORITHM"] = os.environ.get("JWT_ALGORITHM", "HS256")
+    app.config["JWT_KEYS_DIR"] = os.environ.get("JWT_KEYS_DIR")
+    app.config["JWT_ACTIVE_KID"] = os.environ.get("JWT_ACTIVE_KID")
+    app.config["JWKS_MAX_AGE"] = int(os.environ.get("JWKS_MAX_AGE", "300"))
+
+    mysql_pool.init_app(app)
+    user_cache.init_app(app)
+    jwt_keys.init_app(app)
 
     # Register routes
     
@@ -0,0 +1,225 @@
+import os, time, queue, logging, threading
+from contextlib import contextmanager
+import MySQLdb
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long a changed or removed user row can still be served from the cache.
+USER_CACHE_MAX_TTL = 60
+
+
+class MySQLConnectionPool:
+    """
+    Process-wide, thread-safe pool of MySQL connections.
+
+    flask_mysqldb opens a new connection for every app context, so each login
+    paid for a TCP + auth handshake before its single query. Pooled connections
+    are checked out by one thread at a time and returned after the request.
+    Connections idle longer than MYSQL_POOL_PING_AFTER seconds are pinged before
+    reuse and connections older than MYSQL_POOL_RECYCLE seconds are replaced,
+    so server-side wait_timeout never hands out a dead socket.
+
+    Each connection is tagged with the pid that opened it. A MySQL session is
+    bound to its socket, so a gunicorn worker forked from a preloaded master
+    starts with an empty pool, and a connection from another process is closed
+    without touching this process's count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._pid = None
+        self.connect_args = None
+        self.pool_size = 8
+        self.acquire_timeout = 5.0
+        self.recycle = 3600
+        self.ping_after = 30
+
+    def init_app(self, app):
+        if not app.config.get("MYSQL_HOST"):
+            logger.critical("MYSQL_POOL: MySQL host not configured.")
+            raise ConnectionError("MySQL configuration missing.")
+
+        self.connect_args = {
+            "host": app.config["MYSQL_HOST"],
+            "user": app.config.get("MYSQL_USER"),
+            "password": app.config.get("MYSQL_PASSWORD"),
+            "database": app.config.get("MYSQL_DB"),
+            "port": app.config.get("MYSQL_PORT", 3306),
+            "connect_timeout": app.config.get("MYSQL_CONNECT_TIMEOUT", 5),
+            "autocommit": True,
+        }
+        self.pool_size = app.config.get("MYSQL_POOL_SIZE", 8)
+        self.acquire_timeout = app.config.get("MYSQL_POOL_TIMEOUT", 5.0)
+        self.recycle = app.config.get("MYSQL_POOL_RECYCLE", 3600)
+        self.ping_after = app.config.get("MYSQL_POOL_PING_AFTER", 30)
+        app.extensions["mysql_pool"] = self
+        logger.info(f"MYSQL_POOL: Configured for {self.connect_args['host']}:{self.connect_args['port']} with pool size {self.pool_size}.")
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out of the pool for the duration of the block.
+
+        A connection that raised a MySQL OperationalError (lost connection,
+        server gone away) is discarded instead of being returned to the pool.
+
+        Raises:
+            ConnectionError: No connection could be obtained within MYSQL_POOL_TIMEOUT.
+        """
+        entry = self._acquire()
+        try:
+            yield entry[0]
+        except MySQLdb.OperationalError:
+            self._discard(entry)
+            raise
+        except Exception:
+            self._release(entry)
+            raise
+        self._release(entry)
+
+    def close(self):
+        """Closes every idle pooled connection (e.g. on shutdown)."""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
+
+    def _reset_if_forked(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # Connections inherited from a parent process must never be reused.
+                self._idle = queue.LifoQueue()
+                self._created = 0
+                self._pid = pid
+
+    def _acquire(self):
+        if self.connect_args is None:
+            raise ConnectionError("MySQL connection pool is not initialized.")
+        self._reset_if_forked()
+
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                entry = None
+
+            if entry is None:
+                with self._lock:
+                    can_create = self._created < self.pool_size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    return self._connect()
+                try:
+                    entry = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise ConnectionError("MySQL connection pool exhausted.")
+
+            if self._is_usable(entry):
+                return entry
+            self._discard(entry)
+
+    def _connect(self):
+        try:
+            connection = MySQLdb.connect(**self.connect_args)
+        except Exception as e:
+            with self._lock:
+                self._created -= 1
+            logger.error(f"MYSQL_POOL: Failed to connect to MySQL at {self.connect_args['host']}:{self.connect_args['port']}: {e}", exc_info=True)
+            raise ConnectionError(f"MySQL connection failed: {e}")
+        logger.info(f"MYSQL_POOL: New pooled connection established. Conn ID: {id(connection)}")
+        now = time.monotonic()
+        # [connection, created_at, last_used, pid]
+        return [connection, now, now, os.getpid()]
+
+    def _is_usable(self, entry):
+        connection, created_at, last_used, _ = entry
+        now = time.monotonic()
+        if self.recycle and now - created_at >= self.recycle:
+            return False
+        if now - last_used >= self.ping_after:
+            try:
+                connection.ping()
+            except MySQLdb.Error:
+                return False
+        return True
+
+    def _release(self, entry):
+        if entry[3] != os.getpid():
+            self._discard(entry)
+            return
+        entry[2] = time.monotonic()
+        self._idle.put(entry)
+
+    def _discard(self, entry):
+        with self._lock:
+            # After a fork _created counts only this process's connections.
+            if entry[3] == os.getpid() and self._pid == entry[3]:
+                self._created -= 1
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+
+
+class UserCache:
+    """
+    Short-TTL, size-bounded cache of user rows keyed by email.
+
+    Only hits are cached, so a newly provisioned user can log in at once. No
+    service writes the user table (rows are provisioned in MySQL directly) and
+    each worker has its own cache, so there is no write path to invalidate
+    from: a changed password or removed user is instead picked up once the
+    entry expires. The TTL is therefore capped at USER_CACHE_MAX_TTL seconds.
+    Disabled when ttl is 0.
+    """
+
+    def __init__(self, ttl=0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        ttl = app.config.get("USER_CACHE_TTL", 0)
+        if ttl > USER_CACHE_MAX_TTL:
+            logger.warning(f"USER_CACHE: USER_CACHE_TTL={ttl} exceeds {USER_CACHE_MAX_TTL}s; using {USER_CACHE_MAX_TTL}s.")
+            ttl = USER_CACHE_MAX_TTL
+        self.ttl = ttl
+        self.max_size = app.config.get("USER_CACHE_SIZE", 10000)
+        app.extensions["user_cache"] = self
+
+    def get(self, email):
+        if not self.ttl:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[email]
+                return None
+            return user
+
+    def set(self, email, user):
+        if not self.ttl:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_size and email not in self._entries:
+                # Drop the oldest insertion (dicts keep insertion order).
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[email] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self, email):
+        """Drops one cached row (used by the login benchmark between runs)."""
+        with self._lock:
+            self._entries.pop(email, None)
+
@@ -1,3 +1,6 @@
-from flask_mysqldb import MySQL
+from .db import MySQLConnectionPool, UserCache
+from .keys import JWTKeyRing
 
-mysql = MySQL()
\ No newline at end of file
+mysql_pool = MySQLConnectionPool()
+user_cache = UserCache()
+jwt_keys = JWTKeyRing()
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os, logging
+import jwt
+from jwt.algorithms import RSAAlgorithm, OKPAlgorithm
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+
+# Get a logger for this module
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "EdDSA")
+
+
+class JWTKeyRing:
+    """
+    Holds the keys used to sign and verify JWTs.
+
+    With HS256 (the default) tokens are signed with the shared JWT_SECRET, as before.
+    With RS256 or EdDSA every "<kid>.pem" private key in JWT_KEYS_DIR is loaded;
+    JWT_ACTIVE_KID selects the one used for signing, while the public halves of all
+    of them are published as a JWKS. Rotating is therefore: add the new key file,
+    switch JWT_ACTIVE_KID, and delete the old file once its tokens have expired.
+    """
+
+    def __init__(self):
+        self.algorithm = "HS256"
+        self.active_kid = None
+        self.private_keys = {}
+        self.public_keys = {}
+
+    def init_app(self, app):
+        self.algorithm = app.config.get("JWT_ALGORITHM", "HS256")
+        self.private_keys = {}
+        self.public_keys = {}
+
+        if self.algorithm == "HS256":
+            logger.info("JWT key ring using shared-secret HS256 signing.")
+            app.extensions["jwt_keys"] = self
+            return
+
+        if self.algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported JWT_ALGORITHM '{self.algorithm}'. Use HS256, RS256 or EdDSA.")
+
+        keys_dir = app.config.get("JWT_KEYS_DIR")
+        if not keys_dir or not os.path.isdir(keys_dir):
+            raise ValueError(f"JWT_KEYS_DIR must point to a directory of <kid>.pem keys for {self.algorithm}.")
+
+        for filename in sorted(os.listdir(keys_dir)):
+            if not filename.endswith(".pem"):
+                continue
+            kid = filename[:-len(".pem")]
+            with open(os.path.join(keys_dir, filename), "rb") as f:
+                private_key = load_pem_private_key(f.read(), password=None)
+            if self.algorithm == "RS256" and not isinstance(private_key, rsa.RSAPrivateKey):
+                raise ValueError(f"Key '{kid}' is not an RSA key, required for RS256.")
+            if self.algorithm == "EdDSA" and not isinstance(private_key, ed25519.Ed25519PrivateKey):
+                raise ValueError(f"Key '{kid}' is not an Ed25519 key, required for EdDSA.")
+            self.private_keys[kid] = private_key
+            self.public_keys[kid] = private_key.public_key()
+
+        if not self.private_keys:
+            raise ValueError(f"No <kid>.pem keys found in JWT_KEYS_DIR '{keys_dir}'.")
+
+        self.active_kid = app.config.get("JWT_ACTIVE_KID") or sorted(self.private_keys)[-1]
+        if self.active_kid not in self.private_keys:
+            raise ValueError(f"JWT_ACTIVE_KID '{self.active_kid}' has no matching key in '{keys_dir}'.")
+
+        logger.info(f"JWT key ring using {self.algorithm}. Active kid: '{self.active_kid}', published kids: {sorted(self.public_keys)}")
+        app.extensions["jwt_keys"] = self
+
+    def sign(self, payload):
+        if self.algorithm == "HS256":
+            return jwt.encode(payload, os.environ.get("JWT_SECRET"), algorithm="HS256")
+        return jwt.encode(
+            payload,
+            self.private_keys[self.active_kid],
+            algorithm=self.algorithm,
+            headers={"kid": self.active_kid},
+        )
+
+    def verification_key(self, token):
+        """Returns the key a token must be verified with, selected by its 'kid' header."""
+        if self.algorithm == "HS256":
+            return os.getenv("JWT_SECRET")
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in self.public_keys:
+            raise jwt.InvalidKeyError(f"Unknown key id '{kid}'")
+        return self.public_keys[kid]
+
+    def jwks(self):
+        keys = []
+        for kid, public_key in sorted(self.public_keys.items()):
+            if self.algorithm == "RS256":
+                jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+            else:
+                jwk = OKPAlgorithm.to_jwk(public_key, as_dict=True)
+            jwk.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+            keys.append(jwk)
+        return {"keys": keys}
@@ -1,6 +1,6 @@
 import jwt, datetime, os, logging, json
 from flask import Blueprint, request, jsonify, current_app
-from .extensions import mysql
+from .extensions import mysql_pool, user_cache, jwt_keys
 
 # Get a logger for this module
 logger = logging.getLogger(__name__)
@@ -17,17 +17,47 @@ def login():
     if not auth:
         return jsonify({"error": "missing credentials"}), 401
 
-    cur = mysql.connection.cursor()
-    res = cur.execute("SELECT email, password FROM user WHERE email=%s", (auth.username,))
-    
-    if res > 0:
-        user = cur.fetchone()
+    try:
+        user = find_user(auth.username)
+    except ConnectionError as e:
+        logger.error(f"Login failed: database unavailable: {e}")
+        return jsonify({"error": "service unavailable"}), 503
+
+    if user:
         if auth.password != user[1]:
             return jsonify({"error": "invalid credentials"}), 401
-        token = create_jwt(user[0], os.environ.get("JWT_SECRET"), True)
+        token = create_jwt(user[0], True)
         return jsonify({"token": token}), 200
     return jsonify({"error": "invalid credentials"}), 401
 
+def find_user(email):
+    """Returns the (email, password) row for a user, or None. Served from the user cache when enabled."""
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    with mysql_pool.connection() as connection:
+        cur = connection.cursor()
+        try:
+            cur.execute("SELECT email, password FROM user WHERE email=%s", (email,))
+            user = cur.fetchone()
+        finally:
+            cur.close()
+
+    if user is not None:
+        user_cache.set(email, tuple(user))
+    return user
+
+@auth_bp.route("/.well-known/jwks.json", methods=["GET"])
+def jwks():
+    """
+    Publishes the public signing keys so other services can verify tokens locally.
+    Empty when the service signs with the shared HS256 secret.
+    """
+    response = jsonify(jwt_keys.jwks())
+    response.headers["Cache-Control"] = f"public, max-age={current_app.config.get('JWKS_MAX_AGE', 300)}"
+    return response, 200
+
 @auth_bp.route("/validate", methods=["POST"])
 def validate():
     """
@@ -59,9 +89,16 @@ def validate():
         return jsonify({"error": "Malformed Authorization header"}), 401
     
 
-    # --- 2. Retrieve JWT Secret ---
-    jwt_secret = os.getenv("JWT_SECRET")
-    if not jwt_secret:
+    # --- 2. Retrieve verification key (shared secret or public key selected by 'kid') ---
+    try:
+        verification_key = jwt_keys.verification_key(token)
+    except jwt.InvalidKeyError:
+        logger.warning(f"JWT validation failed: Unknown key id. Token start: {token[:10]}...")
+        return jsonify({"error": "Invalid token signature"}), 401
+    except jwt.DecodeError as e:
+        logger.warning(f"JWT validation failed: Decoding error. Error: {e}. Token start: {token[:10]}...")
+        return jsonify({"error": "Invalid token format or structure"}), 401
+    if not verification_key:
         logger.critical("JWT_SECRET environment variable is not set. Cannot validate tokens.")
         # This is a critical configuration error, not a client error.
         # It should ideally be caught at application startup.
@@ -69,7 +106,7 @@ def validate():
 
     # --- 3. Decode and Validate JWT ---
     try:
-        decoded = jwt.decode(token, jwt_secret, algorithms=["HS256"])
+        decoded = jwt.decode(token, verification_key, algorithms=[jwt_keys.algorithm])
         logger.info(f"JWT validated successfully for username: {decoded.get('username')}")
         return jsonify(decoded), 200
     except jwt.ExpiredSignatureError:
@@ -98,14 +135,12 @@ def validate():
         return jsonify({"error": "An unexpected server error occurred during token validation"}), 500
 
 
-def create_jwt(username, secret, authz):
-    return jwt.encode(
+def create_jwt(username, authz):
+    return jwt_keys.sign(
         {
             "username": username,
             "exp": datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=1),
-            "iat": datetime.datetime.utcnow(),
+            "iat": datetime.datetime.now(tz=datetime.timezone.utc),
             "admin": authz,
-        },
-        secret,
-        algorithm="HS256"
+        }
     )
@@ -0,0 +1,68 @@
+"""
+Sign/verify throughput per JWT algorithm.
+
+Times the calls JWTKeyRing.sign and the /validate route make for HS256, RS256
+(2048-bit) and EdDSA (Ed25519): jwt.encode with a 'kid' header, and jwt.decode
+pinned to the one algorithm. Keys are generated in memory; no database or app
+config is needed. Run from services/auth:
+
+    python -m bench.jwt_throughput --seconds 2
+"""
+
+import argparse
+import datetime
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+
+def _keys():
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+    secret = "bench-secret-0123456789abcdef0123456789abcdef"
+    return {
+        "HS256": (secret, secret),
+        "RS256": (rsa_key, rsa_key.public_key()),
+        "EdDSA": (ed_key, ed_key.public_key()),
+    }
+
+
+def _payload():
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return {"username": "bench@example.com", "exp": now + datetime.timedelta(days=1), "iat": now, "admin": False}
+
+
+def _rate(fn, seconds):
+    """Calls fn repeatedly for about `seconds`; returns (ops/sec, mean microseconds per op)."""
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(50):
+            fn()
+        count += 50
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+    elapsed = now - started
+    return count / elapsed, elapsed / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time per measurement")
+    args = parser.parse_args()
+
+    payload = _payload()
+    print(f"{'algorithm':<10}{'sign/s':>12}{'us/sign':>10}{'verify/s':>12}{'us/verify':>11}")
+    for algorithm, (signing_key, verification_key) in _keys().items():
+        headers = None if algorithm == "HS256" else {"kid": "bench"}
+        token = jwt.encode(payload, signing_key, algorithm=algorithm, headers=headers)
+        sign_rate, sign_us = _rate(lambda: jwt.encode(payload, signing_key, algorithm=algorithm, headers=headers), args.seconds)
+        verify_rate, verify_us = _rate(lambda: jwt.decode(token, verification_key, algorithms=[algorithm]), args.seconds)
+        print(f"{algorithm:<10}{sign_rate:>12.0f}{sign_us:>10.1f}{verify_rate:>12.0f}{verify_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Login-rate benchmark: POST /login with and without pooled MySQL connections.
+
+"per-request" reproduces the service before the pool (flask_mysqldb): every login
+opens a MySQL connection, runs its one query and closes it. "pooled" goes through
+MySQLConnectionPool, and "pooled+cache" also turns on the user cache
+(USER_CACHE_TTL), so repeated logins skip MySQL entirely. Requests go through the
+real app and route (Flask test client, HS256 tokens), so the numbers include the
+JWT signing that every login pays.
+
+Needs a reachable MySQL loaded with init.sql (MYSQL_* from the environment or
+.env); run from services/auth:
+
+    python -m bench.login_rate --logins 2000 --threads 1,4,8
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+import MySQLdb
+from dotenv import load_dotenv
+
+from app import create_app, routes
+from app.extensions import mysql_pool, user_cache
+
+
+class ConnectPerRequest:
+    """Drop-in for MySQLConnectionPool.connection() that connects and closes every time."""
+
+    def __init__(self, connect_args):
+        self.connect_args = connect_args
+
+    @contextmanager
+    def connection(self):
+        connection = MySQLdb.connect(**self.connect_args)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+def run(client, headers, logins, threads):
+    """Sends `logins` logins from `threads` threads; returns (elapsed seconds, latencies)."""
+    latencies = []
+    lock = threading.Lock()
+    remaining = [logins]
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = client.post("/login", headers=headers)
+            local.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise SystemExit(f"/login returned {response.status_code}: {response.get_data(as_text=True)}")
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(mode, threads, logins, elapsed, latencies):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{mode:<13} threads={threads:<3} {logins / elapsed:>9.1f} logins/s"
+        f"  p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--threads", default="1,4,8", help="comma-separated client thread counts")
+    parser.add_argument("--email", default="test@email.com", help="a user from init.sql")
+    parser.add_argument("--password", default="Admin123")
+    args = parser.parse_args()
+
+    load_dotenv()
+    os.environ.setdefault("JWT_SECRET", "bench-secret-0123456789abcdef0123456789abcdef")
+    os.environ["USER_CACHE_TTL"] = "0"
+    app = create_app()
+    try:
+        MySQLdb.connect(**mysql_pool.connect_args).close()
+    except MySQLdb.Error as e:
+        raise SystemExit(f"MySQL is not reachable at {mysql_pool.connect_args['host']}:{mysql_pool.connect_args['port']}: {e!r}")
+
+    client = app.test_client()
+    credentials = base64.b64encode(f"{args.email}:{args.password}".encode()).decode()
+    headers = {"Authorization": f"Basic {credentials}"}
+    per_request = ConnectPerRequest(mysql_pool.connect_args)
+
+    for threads in [int(t) for t in args.threads.split(",")]:
+        routes.mysql_pool = per_request
+        elapsed, latencies = run(client, headers, args.logins, threads)
+        report("per-request", threads, args.logins, elapsed, latencies)
+
+        routes.mysql_pool = mysql_pool
+        mysql_pool.pool_size = threads
+        client.post("/login", headers=headers)  # warm-up: open the first connection
+        elapsed, latencies = run(client, headers, args.logins, threads)
+        report("pooled", threads, args.logins, elapsed, latencies)
+        mysql_pool.close()
+
+        user_cache.ttl = 60
+        elapsed, latencies = run(client, headers, args.logins, threads)
+        report("pooled+cache", threads, args.logins, elapsed, latencies)
+        user_cache.ttl = 0
+        user_cache.invalidate(args.email)
+
+
+if __name__ == "__main__":
+    main()
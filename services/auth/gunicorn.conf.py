@@ -0,0 +1,50 @@
+# gunicorn.conf.py
+#
+# Production server for the auth service:  gunicorn -c gunicorn.conf.py main:app
+# Every setting can be overridden through the environment (or .env); `python main.py`
+# still starts the Flask development server for local work.
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- 1. Workers ---
+# /login is mostly a MySQL round trip and a password check, /validate is CPU-light, so a
+# few processes with a handful of threads each go a long way. The MySQL pool is per
+# process, so keep GUNICORN_THREADS <= MYSQL_POOL_SIZE or requests queue on it.
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000")) # gevent only
+# Recycle workers after this many requests (0 = never), with jitter so they don't all restart at once.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# --- 2. Preloading ---
+# The app (and its signing keys) is loaded once in the master and forked. No MySQL
+# connection is opened at startup, and the pool resets itself in each new process.
+preload_app = os.getenv("GUNICORN_PRELOAD", "True").lower() == "true"
+
+# --- 3. Timeouts ---
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Idle keep-alive; keep it above the ingress/load balancer's (and the gateway's
+# connection pool's) idle timeout, so the client side closes idle connections first.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+# --- 4. Graceful shutdown ---
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests.
+# Keep the pod's terminationGracePeriodSeconds above it.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+
+# --- 5. Logging ---
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "INFO").lower()
+
+
+def worker_exit(server, worker):
+    # Close pooled MySQL connections instead of leaving them to time out on the server.
+    from app.extensions import mysql_pool
+    mysql_pool.close()
@@ -4,5 +4,6 @@ load_dotenv()  # Load env vars from .env
 
 app = create_app()
 
+# Flask development server for local runs; the container runs gunicorn (gunicorn.conf.py).
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
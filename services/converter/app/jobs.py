@@ -0,0 +1,62 @@
+import datetime
+from pymongo.errors import PyMongoError
+
+# Must match the gateway's job_service.
+STATE_QUEUED = "queued"
+STATE_CONVERTING = "converting"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+class JobTracker:
+    """
+    Moves the gateway's job documents through their states as the converter works.
+
+    Every update is keyed by the message's job_id and skipped when there is none
+    (messages queued before jobs existed). A done job is never moved back, so a
+    duplicate delivery can't undo it; a failed job can still complete if its message
+    is replayed from the dead-letter queue. Mongo errors are logged and swallowed:
+    status tracking must never fail a conversion.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    def _update(self, job_id, fields, increment=None):
+        if self.collection is None or not job_id:
+            return
+        fields["updated_at"] = datetime.datetime.utcnow()
+        update = {"$set": fields}
+        if increment:
+            update["$inc"] = increment
+        query = {"_id": job_id}
+        if fields["state"] != STATE_DONE:
+            query["state"] = {"$ne": STATE_DONE}
+        try:
+            self.collection.update_one(query, update)
+        except PyMongoError as e:
+            print(f"Could not update job {job_id}: {e}")
+
+    def converting(self, job_id):
+        self._update(job_id, {"state": STATE_CONVERTING, "started_at": datetime.datetime.utcnow()}, increment={"attempts": 1})
+
+    def done(self, job_id, mp3_fid, stats=None):
+        fields = {"state": STATE_DONE, "mp3_fid": str(mp3_fid), "finished_at": datetime.datetime.utcnow(), "error": None}
+        if stats:
+            fields["conversion"] = stats["path"]
+            fields["timings"] = {
+                "total_seconds": round(stats["total_seconds"], 3),
+                "fetch_seconds": round(stats["fetch_seconds"], 3),
+                "transcode_seconds": round(stats["transcode_seconds"], 3),
+                "store_seconds": round(stats["store_seconds"], 3),
+                "media_seconds": stats.get("media_seconds"),
+            }
+        else:
+            fields["conversion"] = "reused"
+        self._update(job_id, fields)
+
+    def retrying(self, job_id, error):
+        self._update(job_id, {"state": STATE_QUEUED, "error": str(error)[:1000]})
+
+    def failed(self, job_id, error):
+        self._update(job_id, {"state": STATE_FAILED, "error": str(error)[:1000], "finished_at": datetime.datetime.utcnow()})
@@ -0,0 +1,137 @@
+import os, time
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Port for the Prometheus scrape endpoint (0 = disabled).
+CONVERTER_METRICS_PORT = int(os.environ.get("CONVERTER_METRICS_PORT", "9102"))
+# How often (seconds) the video queue depths are refreshed for the backlog gauge.
+CONVERTER_QUEUE_DEPTH_INTERVAL = float(os.environ.get("CONVERTER_QUEUE_DEPTH_INTERVAL", "10"))
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+SIZE_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(0, 14)) # 1 MB .. 8 GB
+RTF_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+JOB_SECONDS = Histogram(
+    "converter_job_duration_seconds",
+    "Wall time of a conversion in the worker, by conversion path.",
+    ["path"],
+    buckets=STAGE_BUCKETS,
+)
+# The fetch/transcode/store stages run as one pipeline, so fetch and store are the
+# cumulative time spent in GridFS reads and writes and overlap with transcode.
+STAGE_SECONDS = Histogram(
+    "converter_stage_duration_seconds",
+    "Time per job spent in each stage: GridFS fetch, ffmpeg transcode, GridFS store, result publish.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+INPUT_BYTES = Histogram("converter_input_bytes", "Size of converted videos.", buckets=SIZE_BUCKETS)
+OUTPUT_BYTES = Histogram("converter_output_bytes", "Size of produced MP3s.", buckets=SIZE_BUCKETS)
+REALTIME_FACTOR = Histogram(
+    "converter_realtime_factor",
+    "Media seconds converted per wall-clock second, per job.",
+    buckets=RTF_BUCKETS,
+)
+MEDIA_SECONDS = Counter("converter_media_seconds_total", "Media seconds converted.")
+JOBS = Counter(
+    "converter_jobs_total",
+    "Jobs by outcome: converted, reused (dedup hit), retried, dead_lettered, requeued (pool process died).",
+    ["outcome"],
+)
+POOL_RESTARTS = Counter("converter_pool_restarts_total", "Conversion process pools replaced after a pool process died.")
+QUEUE_DEPTH = Gauge("converter_queue_depth", "Messages ready in each video queue.", ["queue"])
+JOBS_RUNNING = Gauge("converter_jobs_running", "Conversions currently running.")
+JOBS_BUFFERED = Gauge("converter_jobs_buffered", "Deliveries received and waiting for a free slot.")
+UTILIZATION = Gauge("converter_utilization", "Fraction of conversion slots in use.")
+
+STAGE_FETCH = STAGE_SECONDS.labels(stage="fetch")
+STAGE_TRANSCODE = STAGE_SECONDS.labels(stage="transcode")
+STAGE_STORE = STAGE_SECONDS.labels(stage="store")
+STAGE_PUBLISH = STAGE_SECONDS.labels(stage="publish")
+
+
+class TimedStream:
+    """
+    Wraps a GridOut/GridIn and accumulates the time and bytes spent in read()/write(),
+    so GridFS time can be told apart from ffmpeg time inside the streaming pipeline.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def read(self, size=-1):
+        started = time.perf_counter()
+        data = self._stream.read(size)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+        return data
+
+    def write(self, data):
+        started = time.perf_counter()
+        self._stream.write(data)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def count_job(outcome):
+    JOBS.labels(outcome=outcome).inc()
+
+
+def record_job(stats):
+    """Records the stats dict returned by convert_video (runs in the consumer process)."""
+    JOB_SECONDS.labels(path=stats["path"]).observe(stats["total_seconds"])
+    STAGE_FETCH.observe(stats["fetch_seconds"])
+    STAGE_TRANSCODE.observe(stats["transcode_seconds"])
+    STAGE_STORE.observe(stats["store_seconds"])
+    INPUT_BYTES.observe(stats["input_bytes"])
+    OUTPUT_BYTES.observe(stats["output_bytes"])
+    media_seconds = stats.get("media_seconds")
+    if media_seconds:
+        MEDIA_SECONDS.inc(media_seconds)
+        if stats["total_seconds"] > 0:
+            REALTIME_FACTOR.observe(media_seconds / stats["total_seconds"])
+    JOBS.labels(outcome="converted").inc()
+
+
+def watch_scheduler(scheduler):
+    """
+    Exposes the scheduler's occupancy, read at scrape time. Scrapes run on the metrics
+    server's thread, so they only read the counters the connection thread keeps up to
+    date, never the scheduler's queues.
+    """
+    JOBS_RUNNING.set_function(lambda: scheduler.running)
+    JOBS_BUFFERED.set_function(lambda: scheduler.buffered)
+    UTILIZATION.set_function(lambda: scheduler.running / scheduler.capacity if scheduler.capacity else 0)
+
+
+def start_queue_depth_polling(connection, queues):
+    """
+    Refreshes the queue depth gauges every CONVERTER_QUEUE_DEPTH_INTERVAL seconds from the
+    connection thread (via call_later), on a channel of its own so a failed passive declare
+    can never close the consuming channel.
+    """
+    state = {"channel": None}
+
+    def refresh():
+        try:
+            if state["channel"] is None or state["channel"].is_closed:
+                state["channel"] = connection.channel()
+            for queue in queues:
+                result = state["channel"].queue_declare(queue=queue, passive=True)
+                QUEUE_DEPTH.labels(queue=queue).set(result.method.message_count)
+        except Exception as e:
+            print(f"Queue depth refresh failed: {e}")
+            state["channel"] = None
+        connection.call_later(CONVERTER_QUEUE_DEPTH_INTERVAL, refresh)
+
+    refresh()
+
+
+def start_metrics_server():
+    if CONVERTER_METRICS_PORT:
+        start_http_server(CONVERTER_METRICS_PORT)
+        print(f"Metrics exposed on :{CONVERTER_METRICS_PORT}/metrics")
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict, deque
+
+TIER_STANDARD = "standard"
+TIER_BULK = "bulk"
+
+
+class JobScheduler:
+    """
+    Chooses which buffered delivery runs next when a conversion slot frees up.
+
+    Deliveries from the standard queue always go first, so a multi-GB upload never
+    delays the small jobs behind it. A bulk job that has waited longer than
+    bulk_max_wait seconds jumps ahead, so big jobs can't starve either.
+
+    Within a tier, users are served round-robin, one job per turn, so a user with
+    hundreds of queued files gets the same share as a user with one. With
+    user_max_inflight set, a user never holds more than that many slots at once.
+
+    Not thread-safe: only used from the pika connection thread. The running and
+    buffered counters are plain ints, so the metrics thread may read them.
+    """
+
+    def __init__(self, capacity, bulk_max_wait=300, user_max_inflight=0, clock=time.monotonic):
+        self.capacity = capacity
+        self.bulk_max_wait = bulk_max_wait
+        self.user_max_inflight = user_max_inflight
+        self.running = 0
+        self.buffered = 0
+        self._running_by_user = {}
+        self._clock = clock
+        # tier -> OrderedDict(user -> deque of (enqueued_at, job)); dict order is the round-robin order.
+        self._pending = {TIER_STANDARD: OrderedDict(), TIER_BULK: OrderedDict()}
+
+    def add(self, tier, job, user=None):
+        self._pending[tier].setdefault(user, deque()).append((self._clock(), job))
+        self.buffered += 1
+
+    def _eligible(self, user):
+        return not self.user_max_inflight or self._running_by_user.get(user, 0) < self.user_max_inflight
+
+    def _oldest_wait(self, tier):
+        heads = [jobs[0][0] for user, jobs in self._pending[tier].items() if self._eligible(user)]
+        return self._clock() - min(heads) if heads else None
+
+    def _pick_user(self, tier):
+        for user in self._pending[tier]:
+            if self._eligible(user):
+                return user
+        return None
+
+    def next_job(self):
+        """Returns the next job to start, or None if no slot is free or nothing can run."""
+        if self.running >= self.capacity:
+            return None
+
+        bulk_wait = self._oldest_wait(TIER_BULK)
+        standard_user = self._pick_user(TIER_STANDARD)
+        if bulk_wait is not None and (standard_user is None or bulk_wait >= self.bulk_max_wait):
+            tier = TIER_BULK
+            if bulk_wait >= self.bulk_max_wait:
+                # Starvation guard: serve the longest-waiting bulk job, whoever owns it.
+                user = min(
+                    (u for u in self._pending[tier] if self._eligible(u)),
+                    key=lambda u: self._pending[tier][u][0][0],
+                )
+            else:
+                user = self._pick_user(tier)
+        elif standard_user is not None:
+            tier, user = TIER_STANDARD, standard_user
+        else:
+            return None
+
+        users = self._pending[tier]
+        _, job = users[user].popleft()
+        # Move the user to the back of the round-robin order (or drop them once drained).
+        jobs = users.pop(user)
+        if jobs:
+            users[user] = jobs
+
+        self.buffered -= 1
+        self.running += 1
+        self._running_by_user[user] = self._running_by_user.get(user, 0) + 1
+        return job
+
+    def done(self, user=None):
+        self.running -= 1
+        remaining = self._running_by_user.get(user, 0) - 1
+        if remaining > 0:
+            self._running_by_user[user] = remaining
+        else:
+            self._running_by_user.pop(user, None)
@@ -0,0 +1,62 @@
+import os, json, time, threading
+
+# Job spans are printed as one JSON object per line prefixed with "TRACE " (for the log
+# shipper), or appended to TRACE_FILE when set. TRACING_ENABLED=False turns them off.
+# The gateway puts the job id in the message body ("job_id") and these AMQP headers.
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "True").lower() == "true"
+TRACE_FILE = os.environ.get("TRACE_FILE")
+JOB_ID_HEADER = "x-job-id"
+PUBLISHED_AT_HEADER = "x-published-at"
+
+_file_lock = threading.Lock()
+
+
+def job_id_of(message, properties=None):
+    """The job id of a delivery: from the body, else from the AMQP headers."""
+    headers = (properties.headers or {}) if properties is not None else {}
+    return message.get("job_id") or headers.get(JOB_ID_HEADER)
+
+
+def published_at_of(properties):
+    headers = (properties.headers or {}) if properties is not None else {}
+    try:
+        return float(headers[PUBLISHED_AT_HEADER])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def amqp_headers(job_id):
+    """Headers for a message published on behalf of a job."""
+    return {JOB_ID_HEADER: job_id, PUBLISHED_AT_HEADER: time.time()} if job_id else {}
+
+
+def record_span(name, trace_id, start, end=None, **attributes):
+    """Emits one span (epoch-second start/end) for a job."""
+    if not TRACING_ENABLED or not trace_id:
+        return
+    end = time.time() if end is None else end
+    span = {
+        "trace_id": trace_id,
+        "span": name,
+        "service": "converter",
+        "start": round(start, 6),
+        "duration_ms": round((end - start) * 1000, 3),
+    }
+    span.update(attributes)
+    line = json.dumps(span, default=str)
+
+    if TRACE_FILE:
+        with _file_lock, open(TRACE_FILE, "a") as f:
+            f.write(line + "\n")
+    else:
+        print(f"TRACE {line}", flush=True)
+
+
+def record_queue_wait(name, trace_id, properties, received_at, **attributes):
+    """
+    Span from the publisher's x-published-at header to receipt. Publisher and consumer
+    clocks differ across hosts, so this is only as accurate as their NTP sync.
+    """
+    published_at = published_at_of(properties)
+    if published_at is not None:
+        record_span(name, trace_id, published_at, received_at, **attributes)
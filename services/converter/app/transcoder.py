@@ -0,0 +1,283 @@
+import os, json, subprocess, threading, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# ffmpeg binary (installed in the converter image) and the pipe block size.
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.environ.get("FFPROBE_BIN", "ffprobe")
+PIPE_BLOCK_SIZE = 255 * 1024
+
+# How much of the input ffprobe gets to identify the audio codec.
+PROBE_BYTES = int(os.environ.get("PROBE_BYTES", str(8 * 1024 * 1024)))
+
+# Audio codecs that can go into the MP3 output untouched. AAC et al. can't be muxed into
+# an .mp3 stream, so only MP3 audio qualifies for the copy path.
+COPY_CODECS = {c.strip() for c in os.environ.get("COPY_AUDIO_CODECS", "mp3").split(",") if c.strip()}
+MP3_COPY_ARGS = ["-vn", "-acodec", "copy", "-f", "mp3"]
+
+# Inputs at least this long (seconds) are split into segments transcoded in parallel (0 = never).
+SEGMENT_MIN_DURATION = float(os.environ.get("SEGMENT_MIN_DURATION", "1800"))
+# Concurrent ffmpeg processes per segmented job (1 = never segment). The default shares the CPUs
+# between the CONVERTER_POOL_SIZE pool processes, but is at least 2: with the default pool (one
+# process per CPU) the share would be 1, turning segmenting off. With every pool process on a
+# long input at once, up to CONVERTER_POOL_SIZE x SEGMENT_PARALLELISM ffmpeg processes share the
+# CPUs, which costs some context switching but leaves no CPU idle; long inputs are rare next to
+# short ones, so usually only one job is segmented while the others transcode in a single pass.
+_POOL_SIZE = max(int(os.environ.get("CONVERTER_POOL_SIZE", str(os.cpu_count() or 1))), 1)
+SEGMENT_PARALLELISM = int(os.environ.get("SEGMENT_PARALLELISM") or max((os.cpu_count() or 1) // _POOL_SIZE, 2))
+# Segments are encoded CBR without Xing/ID3 headers so their frames concatenate into one valid MP3.
+#
+# Trade-offs of the segmented path, compared with the single-pass MP3_ENCODE_ARGS:
+# - Bitrate: segments use a constant SEGMENT_BITRATE (192k by default) instead of the VBR
+#   "-q:a 2" (~170-210k). VBR frames would need a Xing header per segment for players to
+#   seek and show the duration, and those headers can't be merged, so the joined file uses CBR.
+# - Boundaries: LAME adds encoder delay (~1105 samples) at the start of each segment and pads
+#   the last frame. Without a Xing/LAME header to tell the decoder to trim them, each boundary
+#   plays up to ~50 ms of silence (about 2 frames at 44.1 kHz). That's inaudible for speech and
+#   most lectures, but noticeable in continuous music. Set SEGMENT_MIN_DURATION=0 for gapless output.
+SEGMENT_ENCODE_ARGS = ["-vn", "-acodec", "libmp3lame", "-b:a", os.environ.get("SEGMENT_BITRATE", "192k"),
+                       "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3"]
+
+# Conversion paths recorded on each job
+PATH_COPY = "copy"
+PATH_TRANSCODE = "transcode"
+PATH_SEGMENTED = "segmented"
+
+# Re-encode settings used when the audio has to be transcoded.
+MP3_ENCODE_ARGS = ["-vn", "-acodec", "libmp3lame", "-q:a", os.environ.get("MP3_QUALITY", "2"), "-f", "mp3"]
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg fails; carries the tail of its stderr and how much output it produced."""
+
+    def __init__(self, message, bytes_out=0):
+        super().__init__(message)
+        self.bytes_out = bytes_out
+
+
+def _pump(source, sink, errors):
+    """
+    Copies GridOut-style chunks from source into a pipe, then closes it.
+
+    A failed read (e.g. AutoReconnect, CorruptGridFile) is appended to errors for
+    run_ffmpeg to re-raise: closing stdin looks like a normal EOF to ffmpeg, which
+    would otherwise happily produce a truncated MP3.
+    """
+    try:
+        while True:
+            try:
+                data = source.read(PIPE_BLOCK_SIZE)
+            except Exception as e:
+                errors.append(e)
+                break
+            if not data:
+                break
+            sink.write(data)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg stopped reading (it failed or has all it needs); its exit code tells us which.
+        pass
+    finally:
+        try:
+            sink.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+
+def _collect_stderr(stream, tail):
+    for line in stream:
+        tail.append(line)
+        del tail[:-20]
+
+
+def run_ffmpeg(input_args, output_args, source=None, sink=None):
+    """
+    Runs ffmpeg with both ends streamed.
+
+    If source is given its bytes are fed to ffmpeg's stdin from a helper thread
+    (input_args should then read from pipe:0); ffmpeg's stdout is copied into sink
+    block by block. Memory use is bounded by the pipe block size whatever the file size.
+    An error reading source is re-raised here once ffmpeg has exited.
+
+    Returns:
+        int: number of bytes written to sink.
+    """
+    command = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error"]
+    if source is None:
+        command.append("-nostdin")
+    command += input_args + output_args + ["pipe:1"]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if source is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    stderr_tail = []
+    source_errors = []
+    helpers = [threading.Thread(target=_collect_stderr, args=(process.stderr, stderr_tail), daemon=True)]
+    if source is not None:
+        helpers.append(threading.Thread(target=_pump, args=(source, process.stdin, source_errors), daemon=True))
+    for helper in helpers:
+        helper.start()
+
+    bytes_out = 0
+    try:
+        while True:
+            data = process.stdout.read(PIPE_BLOCK_SIZE)
+            if not data:
+                break
+            if sink is not None:
+                sink.write(data)
+            bytes_out += len(data)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        for helper in helpers:
+            helper.join()
+
+    if source_errors:
+        # The input was cut short, so whatever ffmpeg made of it is incomplete.
+        raise source_errors[0]
+    if returncode != 0:
+        error = b"".join(stderr_tail).decode("utf-8", "replace").strip()
+        raise TranscodeError(f"ffmpeg exited with {returncode}: {error}", bytes_out)
+    return bytes_out
+
+
+def _spool_to_file(source):
+    """Copies a GridOut to a temp file chunk by chunk and returns its path."""
+    source.seek(0)
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    with tf:
+        while True:
+            data = source.read(PIPE_BLOCK_SIZE)
+            if not data:
+                break
+            tf.write(data)
+    return tf.name
+
+
+def transcode_to_mp3(grid_out, grid_in):
+    """
+    Streams a GridFS video through ffmpeg into a GridFS MP3.
+
+    The video is piped to ffmpeg's stdin, so nothing is buffered in full or written
+    to disk. Containers that can't be demuxed from a pipe (e.g. MP4 with the 'moov'
+    atom at the end) are retried once from a temp-file copy of the input.
+
+    Returns:
+        int: size of the MP3 in bytes.
+    """
+    try:
+        return run_ffmpeg(["-i", "pipe:0"], MP3_ENCODE_ARGS, source=grid_out, sink=grid_in)
+    except TranscodeError as e:
+        if e.bytes_out:
+            # Output was already produced, so the input was readable; it's a real failure.
+            raise
+        print(f"Streaming transcode failed, retrying from a seekable copy: {e}")
+
+    path = _spool_to_file(grid_out)
+    try:
+        return run_ffmpeg(["-i", path], MP3_ENCODE_ARGS, sink=grid_in)
+    finally:
+        os.remove(path)
+
+
+def probe_media(grid_out):
+    """
+    Probes the head of a video for its first audio codec (e.g. "mp3", "aac") and its
+    duration in seconds. Either is None if it can't be determined from the head of
+    the file. Rewinds grid_out afterwards.
+    """
+    head = grid_out.read(PROBE_BYTES)
+    grid_out.seek(0)
+    try:
+        result = subprocess.run(
+            [FFPROBE_BIN, "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "stream=codec_name:format=duration", "-of", "json", "pipe:0"],
+            input=head,
+            capture_output=True,
+            timeout=30,
+        )
+        probed = json.loads(result.stdout or b"{}") if result.returncode == 0 else {}
+    except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+        print(f"ffprobe failed: {e}")
+        return None, None
+
+    streams = probed.get("streams") or [{}]
+    codec = streams[0].get("codec_name")
+    try:
+        duration = float(probed.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return codec, duration
+
+
+def transcode_segmented(grid_out, grid_in, duration):
+    """
+    Splits a long video into SEGMENT_PARALLELISM time ranges, transcodes them with
+    concurrent ffmpeg processes and concatenates the results, in order, into grid_in.
+
+    Seeking needs a seekable input, so the video is first copied chunk-wise to a
+    temp file; each segment's MP3 frames also go to a temp file until all are done.
+
+    Returns:
+        int: size of the MP3 in bytes.
+    """
+    segment_count = max(SEGMENT_PARALLELISM, 2)
+    segment_length = duration / segment_count
+    source_path = _spool_to_file(grid_out)
+    segment_paths = [f"{source_path}.{i}.mp3" for i in range(segment_count)]
+
+    def transcode_segment(i):
+        input_args = ["-ss", f"{i * segment_length:.3f}"]
+        if i < segment_count - 1:
+            # The last segment runs to the end, whatever the probed duration said.
+            input_args += ["-t", f"{segment_length:.3f}"]
+        with open(segment_paths[i], "wb") as sink:
+            return run_ffmpeg(input_args + ["-i", source_path], SEGMENT_ENCODE_ARGS, sink=sink)
+
+    try:
+        with ThreadPoolExecutor(max_workers=segment_count) as executor:
+            # list() re-raises the first segment failure, if any.
+            list(executor.map(transcode_segment, range(segment_count)))
+
+        bytes_out = 0
+        for path in segment_paths:
+            with open(path, "rb") as segment:
+                while True:
+                    data = segment.read(PIPE_BLOCK_SIZE)
+                    if not data:
+                        break
+                    grid_in.write(data)
+                    bytes_out += len(data)
+        return bytes_out
+    finally:
+        for path in [source_path] + segment_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def convert_to_mp3(grid_out, grid_in):
+    """
+    Produces the MP3 for a video: remuxes the audio when it is already MP3, transcodes
+    long inputs in parallel segments, and transcodes everything else in a single pass.
+
+    Returns:
+        tuple: (size of the MP3 in bytes, PATH_COPY, PATH_SEGMENTED or PATH_TRANSCODE,
+                probed media duration in seconds or None).
+    """
+    codec, duration = probe_media(grid_out)
+    if codec in COPY_CODECS:
+        try:
+            return run_ffmpeg(["-i", "pipe:0"], MP3_COPY_ARGS, source=grid_out, sink=grid_in), PATH_COPY, duration
+        except TranscodeError as e:
+            if e.bytes_out:
+                raise
+            print(f"Stream copy of {codec} audio failed, falling back to transcoding: {e}")
+            grid_out.seek(0)
+
+    if SEGMENT_MIN_DURATION and duration and duration >= SEGMENT_MIN_DURATION and SEGMENT_PARALLELISM > 1:
+        print(f"Input is {duration:.0f}s long, transcoding in {SEGMENT_PARALLELISM} parallel segments")
+        return transcode_segmented(grid_out, grid_in, duration), PATH_SEGMENTED, duration
+
+    return transcode_to_mp3(grid_out, grid_in), PATH_TRANSCODE, duration
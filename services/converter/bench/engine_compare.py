@@ -0,0 +1,188 @@
+"""
+Per-job latency and peak RSS: the ffmpeg pipe engine vs the MoviePy temp-file engine.
+
+Generates synthetic test videos (H.264 + AAC in MP4) with ffmpeg, then converts
+each one with worker.convert_video, once per engine, every job in a fresh
+process. GridFS is replaced by file-backed stand-ins: the video is read from
+disk in chunks like a GridOut, and the MP3 is counted, not stored. So the numbers
+exclude Mongo network time and measure only the engine. Peak RSS is sampled every
+20 ms and reported above the worker's footprint before the job (after imports), for
+the Python process alone and for it plus its ffmpeg children. Linux only (/proc).
+
+Run from services/converter (needs ffmpeg on PATH; ffprobe optional):
+
+    python -m bench.engine_compare --durations 60,600
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bson.objectid import ObjectId
+
+CHUNK_SIZE = 255 * 1024
+
+
+class FileGridOut:
+    """Reads a file on disk the way a GridOut reads chunks from Mongo."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self.length = os.path.getsize(path)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, position):
+        self._file.seek(position)
+
+    def close(self):
+        self._file.close()
+
+
+class CountingGridIn:
+    """Accepts the MP3 like a GridIn but only counts its bytes."""
+
+    def __init__(self):
+        self._id = ObjectId()
+        self.length = 0
+
+    def write(self, data):
+        self.length += len(data)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class VideoFS:
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, fid):
+        return FileGridOut(self.path)
+
+
+class Mp3FS:
+    def new_file(self, **kwargs):
+        return CountingGridIn()
+
+    def put(self, data):
+        return ObjectId()
+
+
+def make_video(path, seconds):
+    subprocess.run(
+        [os.environ.get("FFMPEG_BIN", "ffmpeg"), "-hide_banner", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-b:a", "128k",
+         "-movflags", "+faststart", "-shortest", path],
+        check=True,
+    )
+
+
+def _rss(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0  # the process already exited
+
+
+def _children(pid):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(c) for c in f.read().split()]
+    except OSError:
+        pass
+    return children
+
+
+def _tree_rss(pid):
+    return _rss(pid) + sum(_tree_rss(child) for child in _children(pid))
+
+
+class PeakRSS:
+    """Samples this process's RSS, alone and with its descendants, until stopped."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.baseline = _rss(os.getpid())
+        self.own_peak = self.tree_peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stop.is_set():
+            self.own_peak = max(self.own_peak, _rss(pid))
+            self.tree_peak = max(self.tree_peak, _tree_rss(pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_one(engine, path):
+    """Child mode: one conversion in this process; prints its measurements as JSON."""
+    from app import worker
+    worker.CONVERTER_ENGINE = engine
+
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        _, stats = worker.convert_video(VideoFS(path), Mp3FS(), str(ObjectId()))
+        elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "seconds": elapsed,
+        "path": stats["path"],
+        "output_bytes": stats["output_bytes"],
+        "python_rss_mb": (rss.own_peak - rss.baseline) / 2**20,
+        "total_rss_mb": (rss.tree_peak - rss.baseline) / 2**20,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", default="60,600", help="comma-separated test video lengths in seconds")
+    parser.add_argument("--engines", default="ffmpeg,moviepy")
+    parser.add_argument("--run", nargs=2, metavar=("ENGINE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(*args.run)
+        return
+
+    print(f"{'video':>8} {'size MB':>8} {'engine':<8} {'path':<10} {'seconds':>8} {'+python RSS MB':>15} {'+total RSS MB':>14}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for seconds in [int(d) for d in args.durations.split(",")]:
+            path = os.path.join(workdir, f"test-{seconds}s.mp4")
+            make_video(path, seconds)
+            size_mb = os.path.getsize(path) / 2**20
+            for engine in args.engines.split(","):
+                result = subprocess.run(
+                    [sys.executable, "-m", "bench.engine_compare", "--run", engine, path],
+                    capture_output=True, text=True, check=True,
+                )
+                # Engines print progress; the measurements are the last line.
+                r = json.loads(result.stdout.strip().splitlines()[-1])
+                print(f"{seconds:>7}s {size_mb:>8.1f} {engine:<8} {r['path']:<10} {r['seconds']:>8.2f} "
+                      f"{r['python_rss_mb']:>15.1f} {r['total_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
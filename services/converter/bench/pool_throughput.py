@@ -0,0 +1,81 @@
+"""
+Conversion throughput (jobs/s) by CONVERTER_POOL_SIZE.
+
+Converts the same synthetic test video (see engine_compare) --jobs times through a
+spawn ProcessPoolExecutor of each size, the way the worker does: every pool process
+gets its GridFS handles from an initializer and runs worker._convert_in_pool. GridFS
+is replaced by the file-backed stand-ins from engine_compare, so Mongo network time
+is excluded and the pool scales on CPU alone; with real Mongo, pool sizes above the
+core count still help while conversions wait on GridFS. Pool start-up is not timed.
+
+Run from services/converter (needs ffmpeg on PATH):
+
+    python -m bench.pool_throughput --sizes 1,2,4 --jobs 16 --duration 60
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from bson.objectid import ObjectId
+
+from bench.engine_compare import Mp3FS, VideoFS, make_video
+
+
+def _init_bench_process(path):
+    """Pool initializer: file-backed stand-ins instead of the MongoClient from _init_pool_process."""
+    from app import worker
+    worker._pool_fs_videos = VideoFS(path)
+    worker._pool_fs_mp3s = Mp3FS()
+
+
+def _noop():
+    pass
+
+
+def run(size, path, jobs):
+    from app import worker
+
+    pool = ProcessPoolExecutor(
+        max_workers=size,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_bench_process,
+        initargs=(path,),
+    )
+    try:
+        # Start every process (spawn + imports) before the clock starts.
+        wait([pool.submit(_noop) for _ in range(size)])
+        started = time.perf_counter()
+        futures = [pool.submit(worker._convert_in_pool, str(ObjectId())) for _ in range(jobs)]
+        results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.shutdown()
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,2,4", help="comma-separated pool sizes")
+    parser.add_argument("--jobs", type=int, default=16, help="conversions per pool size")
+    parser.add_argument("--duration", type=int, default=60, help="test video length in seconds")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.jobs} jobs of a {args.duration}s video per pool size")
+    print(f"{'pool size':>9} {'seconds':>8} {'jobs/s':>7} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, f"test-{args.duration}s.mp4")
+        make_video(path, args.duration)
+        baseline = None
+        for size in [int(s) for s in args.sizes.split(",")]:
+            elapsed, _ = run(size, path, args.jobs)
+            rate = args.jobs / elapsed
+            baseline = baseline or rate
+            print(f"{size:>9} {elapsed:>8.2f} {rate:>7.2f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import io
+import os
+import shutil
+
+import pytest
+
+from app import transcoder
+
+FFMPEG = shutil.which(os.environ.get("FFMPEG_BIN", "ffmpeg"))
+needs_ffmpeg = pytest.mark.skipif(FFMPEG is None, reason="needs ffmpeg on PATH (or FFMPEG_BIN)")
+
+
+class FileGridOut:
+    """GridOut stand-in over an in-memory file: read/seek/close and a length."""
+
+    def __init__(self, data):
+        self._buffer = io.BytesIO(data)
+        self.length = len(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+    def seek(self, position):
+        self._buffer.seek(position)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    monkeypatch.setattr(transcoder, "FFMPEG_BIN", FFMPEG)
+    return FFMPEG
+
+
+@pytest.fixture
+def wav_bytes(ffmpeg):
+    """Five seconds of a 440 Hz tone as WAV, generated by ffmpeg itself."""
+    sink = io.BytesIO()
+    transcoder.run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=5"], ["-f", "wav"], sink=sink)
+    return sink.getvalue()
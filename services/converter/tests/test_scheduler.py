@@ -0,0 +1,135 @@
+import heapq
+from collections import deque
+
+from app.scheduler import JobScheduler, TIER_BULK, TIER_STANDARD
+
+
+class Simulation:
+    """
+    Discrete-event model of the worker: one FIFO queue per shard, a consumer per queue on
+    one channel limited to `prefetch` unacked deliveries in all (global_qos; the broker
+    hands free credit to the queues in turn), and the JobScheduler (on a simulated clock)
+    choosing what runs on `capacity` slots. A delivery is acked when its job finishes.
+    """
+
+    def __init__(self, capacity, shards=1, prefetch=None, user_max_inflight=0, bulk_max_wait=300):
+        self.now = 0.0
+        self.scheduler = JobScheduler(capacity, bulk_max_wait=bulk_max_wait,
+                                      user_max_inflight=user_max_inflight, clock=lambda: self.now)
+        self.queues = {(tier, shard): deque() for tier in (TIER_STANDARD, TIER_BULK) for shard in range(shards)}
+        self.unacked = 0
+        self.prefetch = prefetch or 2 * capacity  # the worker's CONVERTER_PREFETCH default
+        self._next_queue = 0
+        self.shards = shards
+        self.events = []
+        self.finished = {}  # user -> finish time of their last job
+        self.busy_seconds = 0.0
+
+    def publish(self, user, jobs, seconds=1.0, tier=TIER_STANDARD, shard=0):
+        for _ in range(jobs):
+            self.queues[(tier, shard % self.shards)].append((user, seconds))
+
+    def _deliver(self):
+        keys = list(self.queues)
+        while self.unacked < self.prefetch and any(self.queues.values()):
+            key = keys[self._next_queue % len(keys)]
+            self._next_queue += 1
+            if self.queues[key]:
+                user, seconds = self.queues[key].popleft()
+                self.unacked += 1
+                self.scheduler.add(key[0], (key, user, seconds), user=user)
+
+    def _dispatch(self):
+        while (job := self.scheduler.next_job()) is not None:
+            self.check_counters()
+            key, user, seconds = job
+            self.busy_seconds += seconds
+            heapq.heappush(self.events, (self.now + seconds, id(job), job))
+
+    def run(self):
+        self._deliver()
+        self._dispatch()
+        while self.events:
+            self.now, _, (key, user, _) = heapq.heappop(self.events)
+            self.scheduler.done(user)
+            self.unacked -= 1
+            self.finished[user] = self.now
+            self._deliver()
+            self._dispatch()
+        assert self.scheduler.buffered == self.scheduler.running == 0
+        return self.now
+
+    def check_counters(self):
+        # The metrics thread reads only these counters; they must match the queues.
+        queued = sum(len(jobs) for users in self.scheduler._pending.values() for jobs in users.values())
+        assert self.scheduler.buffered == queued
+        assert self.scheduler.running == len(self.events) + 1
+
+    def utilization(self):
+        return self.busy_seconds / (self.now * self.scheduler.capacity)
+
+
+def test_user_cap_without_shards_idles_the_pool():
+    # Why the worker ignores CONVERTER_USER_MAX_INFLIGHT unless VIDEO_QUEUE_SHARDS > 1:
+    # the prefetch window holds only the bursting user's jobs, and the cap lets one run.
+    sim = Simulation(capacity=4, user_max_inflight=1)
+    sim.publish("burst", 40)
+    sim.publish("light", 4)
+
+    assert sim.run() == 40
+    assert sim.utilization() < 0.3
+    assert sim.finished["light"] == 37
+
+
+def test_without_the_cap_one_queue_keeps_the_pool_full():
+    sim = Simulation(capacity=4)
+    sim.publish("burst", 40)
+    sim.publish("light", 4)
+
+    assert sim.run() == 11
+    assert sim.utilization() == 1.0
+
+
+def _sharded(user_max_inflight):
+    sim = Simulation(capacity=4, shards=4, user_max_inflight=user_max_inflight)
+    sim.publish("burst", 40, shard=0)
+    sim.publish("light-1", 4, shard=1)
+    sim.publish("light-2", 4, shard=2)
+    return sim.run(), sim
+
+
+def test_shards_keep_light_users_fast_with_or_without_the_cap():
+    for user_max_inflight in (0, 2):
+        _, sim = _sharded(user_max_inflight)
+        # Instead of waiting ~10s behind the burst, as with a single queue.
+        assert sim.finished["light-1"] == sim.finished["light-2"] == 3
+
+
+def test_sharded_cap_leaves_slots_idle_once_only_the_burst_is_left():
+    uncapped, _ = _sharded(0)
+    capped, sim = _sharded(2)
+
+    assert uncapped == 12
+    # The cap isn't work-conserving: the burst keeps its two slots even with two idle.
+    assert capped == 21
+    assert sim.utilization() < 0.6
+
+
+def test_round_robin_between_users_of_one_tier():
+    sim = Simulation(capacity=1, prefetch=20)
+    sim.publish("a", 10)
+    sim.publish("b", 2)
+    sim.run()
+
+    assert sim.finished["b"] == 4
+
+
+def test_bulk_jobs_run_after_standard_ones_until_they_wait_too_long():
+    sim = Simulation(capacity=1, prefetch=20, bulk_max_wait=5)
+    sim.publish("big", 1, seconds=10, tier=TIER_BULK)
+    sim.publish("small", 10)
+    sim.run()
+
+    # The bulk job is picked once it has waited 5s, then the small jobs resume.
+    assert sim.finished["big"] == 15
+    assert sim.finished["small"] == 20
@@ -0,0 +1,64 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from gridfs.errors import CorruptGridFile
+from pymongo.errors import AutoReconnect
+
+from app import transcoder
+from tests.conftest import FileGridOut, needs_ffmpeg
+
+
+class FailingGridOut(FileGridOut):
+    """Serves the first `fail_after` bytes, then fails the way a dropped Mongo connection does."""
+
+    def __init__(self, data, fail_after, error):
+        super().__init__(data)
+        self.fail_after = fail_after
+        self.error = error
+
+    def read(self, size=-1):
+        if self._buffer.tell() >= self.fail_after:
+            raise self.error
+        return super().read(min(size, self.fail_after - self._buffer.tell()))
+
+
+@needs_ffmpeg
+def test_streaming_transcode_produces_mp3(wav_bytes):
+    sink = io.BytesIO()
+    size = transcoder.transcode_to_mp3(FileGridOut(wav_bytes), sink)
+    assert size == len(sink.getvalue()) > 0
+    assert sink.getvalue()[:3] in (b"ID3", b"\xff\xfb", b"\xff\xf3")
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("error", [AutoReconnect("connection reset"), CorruptGridFile("no chunk #3")])
+def test_source_read_error_fails_the_transcode(wav_bytes, error):
+    source = FailingGridOut(wav_bytes, fail_after=len(wav_bytes) // 2, error=error)
+    with pytest.raises(type(error)):
+        transcoder.run_ffmpeg(["-i", "pipe:0"], transcoder.MP3_ENCODE_ARGS, source=source, sink=io.BytesIO())
+
+
+@needs_ffmpeg
+def test_source_read_error_is_not_retried_from_a_temp_copy(wav_bytes):
+    # The temp-file fallback is for undemuxable pipes; a broken source must fail the job instead.
+    source = FailingGridOut(wav_bytes, fail_after=transcoder.PIPE_BLOCK_SIZE, error=AutoReconnect("gone"))
+    with pytest.raises(AutoReconnect):
+        transcoder.transcode_to_mp3(source, io.BytesIO())
+
+
+@pytest.mark.parametrize("env, parallelism", [
+    ({}, 2),  # default pool: one process per CPU
+    ({"CONVERTER_POOL_SIZE": "1"}, max(os.cpu_count() or 1, 2)),
+    ({"SEGMENT_PARALLELISM": "1"}, 1),
+])
+def test_segment_parallelism_default_keeps_segmenting_on(env, parallelism):
+    # Module-level settings, so each is read in a fresh interpreter.
+    env = {k: v for k, v in os.environ.items() if k not in ("CONVERTER_POOL_SIZE", "SEGMENT_PARALLELISM")} | env
+    out = subprocess.run(
+        [sys.executable, "-c", "from app import transcoder; print(transcoder.SEGMENT_PARALLELISM)"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert int(out) == parallelism
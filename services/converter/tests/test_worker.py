@@ -0,0 +1,242 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import pika
+import pytest
+from bson.objectid import ObjectId
+
+from app import worker
+from app.transcoder import TranscodeError
+
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+        self.acked = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties))
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+
+@pytest.mark.parametrize("body, expected", [
+    (b'{"video_fid": "abc"}', {"video_fid": "abc"}),
+    (b"not json", {"raw_body": "not json"}),
+    (b"[1, 2]", {"raw_body": [1, 2]}),
+    (b"null", {"raw_body": None}),
+])
+def test_permanent_failure_dead_letters_any_body(body, expected):
+    channel = FakeChannel()
+    method = SimpleNamespace(delivery_tag=7)
+
+    worker.handle_failure(channel, method, pika.BasicProperties(), body, TypeError("bad message"),
+                          permanent=True, video_queue="video")
+
+    routing_key, published, _ = channel.published[0]
+    assert routing_key == "video.dead"
+    assert json.loads(published) == dict(expected, error="bad message", retries=0)
+    assert channel.acked == [7]
+
+
+def _open_video(video_fid):
+    return ObjectId(video_fid)
+
+
+@pytest.mark.parametrize("video_fid, permanent", [("not-an-object-id", True), (12345, True)])
+def test_pool_and_inline_failures_are_classified_alike(video_fid, permanent):
+    with pytest.raises(Exception) as inline:
+        _open_video(video_fid)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pooled = pool.submit(_open_video, video_fid).exception()
+
+    assert type(pooled) is type(inline.value)
+    assert worker.is_permanent(pooled) == worker.is_permanent(inline.value) == permanent
+
+
+@pytest.mark.parametrize("error, permanent", [
+    (gridfs.NoFile("no file"), True),
+    (KeyError("video_fid"), True),
+    (TranscodeError("ffmpeg exited with 1"), False),
+    (ConnectionError("mongo down"), False),
+])
+def test_is_permanent(error, permanent):
+    assert worker.is_permanent(error) == permanent
+
+
+class FakeBroker:
+    """
+    Stands in for pika's BlockingConnection and its channel: start_consuming() delivers the
+    queued messages to the consumers, and a nack with requeue=True delivers that one again.
+    """
+
+    def __init__(self, messages):
+        self.pending = list(messages)  # (queue, body)
+        self.consumers = {}
+        self.published = []
+        self.acked = []
+        self.nacked = []
+        self.fail_publishes = 0
+        self._tag = 0
+
+    def __call__(self, parameters):
+        return self
+
+    def channel(self):
+        return self
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def queue_declare(self, queue, **kwargs):
+        pass
+
+    def basic_qos(self, **kwargs):
+        self.qos = kwargs
+
+    def basic_consume(self, queue, on_message_callback):
+        self.consumers[queue] = on_message_callback
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        if self.fail_publishes and routing_key == "mp3":
+            self.fail_publishes -= 1
+            raise pika.exceptions.UnroutableError([])
+        self.published.append((routing_key, json.loads(body)))
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacked.append(delivery_tag)
+        if requeue:
+            self.pending.append(self._delivered[delivery_tag])
+
+    def start_consuming(self):
+        self._delivered = {}
+        while self.pending:
+            queue, body = self.pending.pop(0)
+            self._tag += 1
+            self._delivered[self._tag] = (queue, body)
+            method = SimpleNamespace(delivery_tag=self._tag, redelivered=self._tag > 1)
+            self.consumers[queue](self, method, pika.BasicProperties(headers={}), body)
+
+    def published_to(self, queue):
+        return [message for routing_key, message in self.published if routing_key == queue]
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    mongomock.gridfs.enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(worker, "MongoClient", lambda *args, **kwargs: client)
+    return client
+
+
+@pytest.fixture
+def run_worker(mongo, monkeypatch):
+    """Runs start_worker inline (CONVERTER_POOL_SIZE=0) against a FakeBroker and mongomock."""
+    monkeypatch.setenv("MP3_QUEUE", "mp3")
+    monkeypatch.setattr(worker, "CONVERTER_POOL_SIZE", 0)
+    for name in ("watch_scheduler", "start_queue_depth_polling", "start_metrics_server"):
+        monkeypatch.setattr(worker.metrics, name, lambda *args, **kwargs: None)
+    conversions = []
+
+    def convert_video(fs_videos, fs_mp3s, video_fid):
+        conversions.append(video_fid)
+        stats = {"path": "transcode", "started_at": 0.0, "total_seconds": 1.0, "fetch_seconds": 0.1,
+                 "transcode_seconds": 0.8, "store_seconds": 0.1, "input_bytes": 10, "output_bytes": 5,
+                 "media_seconds": 2.0}
+        return fs_mp3s.put(b"mp3"), stats
+
+    monkeypatch.setattr(worker, "convert_video", convert_video)
+
+    def run(broker):
+        monkeypatch.setattr(worker.pika, "BlockingConnection", broker)
+        worker.start_worker()
+        return conversions
+
+    return run
+
+
+def _video(mongo):
+    return str(gridfs.GridFS(mongo.videos).put(b"video"))
+
+
+def test_failed_result_publish_requeues_without_converting_again(mongo, run_worker):
+    video_fid = _video(mongo)
+    broker = FakeBroker([("video", json.dumps({"video_fid": video_fid, "content_hash": "abc"}))])
+    broker.fail_publishes = 1
+
+    conversions = run_worker(broker)
+
+    assert conversions == [video_fid]
+    assert broker.nacked == [1] and broker.acked == [2]
+    [notification] = broker.published_to("mp3")
+    assert mongo.mp3s.fs.files.count_documents({}) == 1
+    assert notification["mp3_fid"] == str(mongo.mp3s.fs.files.find_one()["_id"])
+    assert broker.published_to("video.retry.1") == broker.published_to("video.dead") == []
+
+
+def _unavailable(*args, **kwargs):
+    raise OSError("sink unavailable")
+
+
+@pytest.mark.parametrize("broken", ["video_hashes", "record_span", "record_queue_wait", "record_job", "job_tracker"])
+def test_bookkeeping_errors_after_the_conversion_do_not_fail_the_job(mongo, run_worker, monkeypatch, broken):
+    if broken == "video_hashes":
+        update_one = mongomock.collection.Collection.update_one
+        monkeypatch.setattr(mongomock.collection.Collection, "update_one", lambda self, *args, **kwargs: (
+            _unavailable() if self.name == "video_hashes" else update_one(self, *args, **kwargs)
+        ))
+    elif broken == "record_job":
+        monkeypatch.setattr(worker.metrics, "record_job", _unavailable)
+    elif broken == "job_tracker":
+        # Not a PyMongoError, so JobTracker's own handling doesn't catch it.
+        monkeypatch.setattr(worker.job_tracker, "_update", _unavailable)
+    else:
+        monkeypatch.setattr(worker.tracing, broken, _unavailable)
+    video_fid = _video(mongo)
+    broker = FakeBroker([("video", json.dumps({"video_fid": video_fid, "content_hash": "abc", "job_id": "job-1"}))])
+
+    conversions = run_worker(broker)
+
+    assert conversions == [video_fid]
+    assert broker.acked == [1] and broker.nacked == []
+    assert len(broker.published_to("mp3")) == 1
+    assert broker.published_to("video.retry.1") == []
+
+
+def test_instrumentation_errors_do_not_fail_a_reused_job(mongo, run_worker, monkeypatch):
+    video_fid = _video(mongo)
+    job = {"video_fid": video_fid, "content_hash": "abc"}
+    broker = FakeBroker([("video", json.dumps(dict(job, job_id="job-1"))), ("video", json.dumps(dict(job, job_id="job-2")))])
+    converted = []
+    record_span = worker.tracing.record_span
+    monkeypatch.setattr(worker.metrics, "count_job", _unavailable)
+    # The first job converts normally; from then on every span fails.
+    monkeypatch.setattr(worker.tracing, "record_span", lambda *args, **kwargs: (
+        _unavailable() if converted else record_span(*args, **kwargs)
+    ))
+    monkeypatch.setattr(worker.metrics, "record_job", lambda stats: converted.append(stats))
+
+    assert run_worker(broker) == [video_fid]
+    assert broker.acked == [1, 2] and broker.nacked == []
+    assert [m["mp3_fid"] for m in broker.published_to("mp3")] == [str(mongo.mp3s.fs.files.find_one()["_id"])] * 2
+    assert broker.published_to("video.retry.1") == broker.published_to("video.dead") == []
+
+
+def test_sharded_worker_still_drains_the_base_queue(mongo, run_worker, monkeypatch):
+    monkeypatch.setattr(worker, "VIDEO_QUEUE_SHARDS", 2)
+    video_fid = _video(mongo)
+    # Published before the shards existed, or by a gateway that isn't sharded yet.
+    broker = FakeBroker([("video", json.dumps({"video_fid": video_fid}))])
+
+    assert run_worker(broker) == [video_fid]
+    assert set(broker.consumers) == {"video", "video.0", "video.1", "video.bulk", "video.bulk.0", "video.bulk.1"}
+    # One unacked limit for the channel, not one per consumer.
+    assert broker.qos == {"prefetch_count": worker.CONVERTER_PREFETCH, "global_qos": True}
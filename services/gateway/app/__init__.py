@@ -3,8 +3,8 @@ import os
 from flask import Flask
 from dotenv import load_dotenv # Still here if you use .env for local dev
 import logging
-from . import extensions
-from .routes import auth_routes, upload_routes, download_routes, health_routes
+from . import extensions, metrics, tracing
+from .routes import auth_routes, upload_routes, resumable_upload_routes, download_routes, health_routes, job_routes
 
 # Configure basic logging for the app (ensure this is done once, early)
 logging.basicConfig(
@@ -30,6 +30,40 @@ def create_app():
     # Add queue names to app config
     server.config["VIDEO_QUEUE"] = os.getenv("VIDEO_QUEUE", "video").strip()
     server.config["MP3_QUEUE"] = os.getenv("MP3_QUEUE", "mp3").strip()
+    # Uploads of at least VIDEO_BULK_BYTES are routed to the bulk tier queue (0 = single tier)
+    server.config["VIDEO_BULK_QUEUE"] = os.getenv("VIDEO_BULK_QUEUE", f"{server.config['VIDEO_QUEUE']}.bulk").strip()
+    server.config["VIDEO_BULK_BYTES"] = int(os.getenv("VIDEO_BULK_BYTES", str(512 * 1024 * 1024)))
+    # Users are hashed onto this many sub-queues per tier for fair scheduling (1 = no sharding)
+    server.config["VIDEO_QUEUE_SHARDS"] = int(os.getenv("VIDEO_QUEUE_SHARDS", "1"))
+    # Long-lived publisher connections per worker process
+    server.config["RABBITMQ_POOL_SIZE"] = int(os.getenv("RABBITMQ_POOL_SIZE", "4"))
+    server.config["RABBITMQ_POOL_TIMEOUT"] = float(os.getenv("RABBITMQ_POOL_TIMEOUT", "5"))
+    # Uploads: "stream" writes the body straight into GridFS, "buffered" uses request.files
+    server.config["UPLOAD_MODE"] = os.getenv("UPLOAD_MODE", "stream").strip().lower()
+    server.config["UPLOAD_CHUNK_SIZE"] = int(os.getenv("UPLOAD_CHUNK_SIZE", str(255 * 1024)))
+    server.config["UPLOAD_MAX_BYTES"] = int(os.getenv("UPLOAD_MAX_BYTES", "0")) # 0 = no limit
+    # Skip storing/converting content that was uploaded before (sha256 of the video)
+    server.config["DEDUP_ENABLED"] = os.getenv("DEDUP_ENABLED", "True").lower() == "true"
+    # Admission control: reject uploads with 503 + Retry-After while this many jobs wait (0 = off)
+    server.config["QUEUE_DEPTH_LIMIT"] = int(os.getenv("QUEUE_DEPTH_LIMIT", "0"))
+    server.config["QUEUE_DEPTH_REFRESH"] = float(os.getenv("QUEUE_DEPTH_REFRESH", "5"))
+    server.config["QUEUE_DEPTH_RETRY_AFTER"] = int(os.getenv("QUEUE_DEPTH_RETRY_AFTER", "60"))
+    # Resumable uploads: one GridFS chunk per PUT (must stay below Mongo's 16 MB document limit)
+    server.config["RESUMABLE_CHUNK_SIZE"] = int(os.getenv("RESUMABLE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    server.config["RESUMABLE_SESSION_TTL"] = int(os.getenv("RESUMABLE_SESSION_TTL", "86400"))
+    # A finalize claim older than this (its gateway worker died mid-finalize) can be taken over
+    server.config["RESUMABLE_FINALIZE_TIMEOUT"] = int(os.getenv("RESUMABLE_FINALIZE_TIMEOUT", "300"))
+    # Job status API: longest a GET /jobs/<id>?wait= long poll is held, how often it re-reads the job,
+    # and how long job documents are kept (0 = forever)
+    server.config["JOBS_MAX_WAIT"] = float(os.getenv("JOBS_MAX_WAIT", "30"))
+    server.config["JOBS_POLL_INTERVAL"] = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+    server.config["JOBS_TTL"] = int(os.getenv("JOBS_TTL", str(30 * 24 * 3600)))
+    # Long polls held at once per worker process; each holds a thread, so keep it well below
+    # GUNICORN_THREADS (see gunicorn.conf.py). Further ?wait= requests get 429 + Retry-After.
+    server.config["JOBS_MAX_WAITERS"] = int(os.getenv("JOBS_MAX_WAITERS", "4"))
+    # Prometheus metrics are served on this separate port, which the Service and ingress don't
+    # expose (0 = /metrics on the app port)
+    server.config["METRICS_PORT"] = int(os.getenv("METRICS_PORT", "9101"))
 
 
     # --- Debug: Log the loaded config values ---
@@ -41,9 +75,13 @@ def create_app():
     logger.info(f"App Config: DEBUG = {server.config['DEBUG']}")
     logger.info(f"App Config: VIDEO_QUEUE = '{server.config['VIDEO_QUEUE']}'")
     logger.info(f"App Config: MP3_QUEUE = '{server.config['MP3_QUEUE']}'")
+    logger.info(f"App Config: VIDEO_BULK_QUEUE = '{server.config['VIDEO_BULK_QUEUE']}' (>= {server.config['VIDEO_BULK_BYTES']} bytes)")
+    logger.info(f"App Config: RABBITMQ_POOL_SIZE = {server.config['RABBITMQ_POOL_SIZE']}")
+    logger.info(f"App Config: UPLOAD_MODE = '{server.config['UPLOAD_MODE']}'")
+    logger.info(f"App Config: UPLOAD_MAX_BYTES = {server.config['UPLOAD_MAX_BYTES']}")
 
 
-    # Initialize Flask extensions (PyMongo) and setup RabbitMQ connection management
+    # Initialize Flask extensions (PyMongo) and the pooled RabbitMQ publisher
     try:
         extensions.init_extensions(server)
         logger.info("Extensions initialized successfully.")
@@ -51,10 +89,17 @@ def create_app():
         logger.critical(f"Failed to initialize application extensions: {e}", exc_info=True)
         raise # Re-raise to crash early and visibly
 
+    # Request/stage latency metrics, exposed on /metrics
+    metrics.init_metrics(server)
+    # Per-job spans (job id carried through the queues to the converter and notifier)
+    tracing.init_tracing(server)
+
     # Register blueprints
     server.register_blueprint(health_routes.health_bp)
     server.register_blueprint(auth_routes.auth_bp)
     server.register_blueprint(upload_routes.upload_bp)
+    server.register_blueprint(resumable_upload_routes.resumable_upload_bp)
     server.register_blueprint(download_routes.download_bp)
+    server.register_blueprint(job_routes.job_bp)
 
     return server
\ No newline at end of file
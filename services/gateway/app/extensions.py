@@ -2,11 +2,12 @@
 
 import logging
 import os
+import queue
+import threading
+import time
 import pika
-from flask import g, current_app
 from flask_pymongo import PyMongo
-import pika
-import gridfs # Import gridfs here
+from app import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +26,13 @@ def init_extensions(app):
     mongo_video_uri = app.config.get('MONGO_URI_VIDEO')
     mongo_mp3_uri = app.config.get('MONGO_URI_MP3')
 
-    # Initialize PyMongo extensions
+    # Initialize PyMongo extensions. connect=False: no socket or monitor thread until first
+    # use; with GUNICORN_PRELOAD, reset_mongo_clients() then replaces them in each worker.
     try:
-        mongo_video.init_app(app, uri=mongo_video_uri)
+        mongo_video.init_app(app, uri=mongo_video_uri, connect=False)
         logger.info(f"INIT_EXTENSIONS: PyMongo for video initialized with app. DB name: {mongo_video_uri.split('/')[-1].split('?')[0]}")
 
-        mongo_mp3.init_app(app, uri=mongo_mp3_uri)
+        mongo_mp3.init_app(app, uri=mongo_mp3_uri, connect=False)
         logger.info(f"INIT_EXTENSIONS: PyMongo for MP3 initialized with app. DB name: {mongo_mp3_uri.split('/')[-1].split('?')[0]}")
 
         # PyMongo handles connection pooling and lifecycle.
@@ -52,77 +54,304 @@ def init_extensions(app):
         # Re-raise to prevent app startup with broken DB config
         raise
 
-    # --- RabbitMQ Connection Management ---
-    # We'll manage RabbitMQ connection/channel per-request using Flask's `g` object.
-    # Register a teardown function for the request context.
-    @app.teardown_appcontext
-    def close_rabbitmq_connection_on_teardown(exception=None):
-        """
-        Closes the RabbitMQ connection stored in Flask's `g` object for the current request.
-        """
-        if 'rabbitmq_connection' in g and g.rabbitmq_connection and not g.rabbitmq_connection.is_closed:
-            try:
-                g.rabbitmq_connection.close()
-                logger.info(f"TEARDOWN: RabbitMQ connection (ID: {id(g.rabbitmq_connection)}) closed for request context.")
-            except Exception as e:
-                logger.error(f"TEARDOWN: Error closing RabbitMQ connection (ID: {id(g.rabbitmq_connection)}): {e}")
-        else:
-            logger.debug("TEARDOWN: No RabbitMQ connection to close for this request context.")
+    # --- RabbitMQ Publisher Pool ---
+    # A single process-wide pool of long-lived publishing channels replaces the
+    # old per-request connection, so an upload only pays for the publish itself.
+    rabbitmq_publisher.init_app(app)
+
+    # --- Video Queue Depth (admission control) ---
+    queue_depth_monitor.init_app(app)
 
     logger.info("INIT_EXTENSIONS: All extensions initialized successfully.")
 
 
-def get_rabbitmq_channel():
+def reset_mongo_clients(app):
+    """
+    Gives this process its own MongoClients. With GUNICORN_PRELOAD the app is created in
+    the gunicorn master, and with it the clients; each worker calls this right after the
+    fork (post_fork), before serving, so no client is ever shared across processes.
+    Every caller reads mongo_video.db / mongo_mp3.db at use, so nothing keeps the old ones.
+    """
+    mongo_video.init_app(app, uri=app.config.get('MONGO_URI_VIDEO'), connect=False)
+    mongo_mp3.init_app(app, uri=app.config.get('MONGO_URI_MP3'), connect=False)
+    logger.info(f"INIT_EXTENSIONS: MongoDB clients recreated in process {os.getpid()}.")
+
+
+def video_queue_names(config):
+    """
+    Every queue conversion jobs can be published to: both tiers, split into
+    per-user shards when VIDEO_QUEUE_SHARDS > 1.
+    """
+    video_queues = (config.get("VIDEO_QUEUE", "video"), config.get("VIDEO_BULK_QUEUE", "video.bulk"))
+    shards = config.get("VIDEO_QUEUE_SHARDS", 1)
+    if shards > 1:
+        video_queues = tuple(f"{queue_name}.{shard}" for queue_name in video_queues for shard in range(shards))
+    return video_queues
+
+
+class RabbitMQPublisherPool:
     """
-    Provides a RabbitMQ channel for the current request.
-    It will create a new connection/channel if one doesn't exist for this request.
+    Process-wide, thread-safe pool of RabbitMQ publishing channels.
+
+    pika's BlockingConnection is not thread-safe, so each pooled entry is a
+    (connection, channel) pair that is checked out by exactly one thread for the
+    duration of a publish. Channels are put in confirm mode, so basic_publish
+    only returns once the broker has accepted the message. Queues are declared
+    once per process instead of on every request. The pool is reset after a
+    fork so that pre-forking servers never share sockets between workers.
     """
-    if 'rabbitmq_channel' not in g or g.rabbitmq_channel is None or g.rabbitmq_channel.is_closed:
-        logger.info("RABBITMQ_GET: Establishing new RabbitMQ connection and channel for current request.")
-        rabbitmq_host = current_app.config.get("RABBITMQ_HOST")
-        rabbitmq_port = current_app.config.get("RABBITMQ_PORT")
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._pid = None
+        self._queues_declared = False
+        self.parameters = None
+        self.queues = ()
+        self.pool_size = 4
+        self.acquire_timeout = 5.0
+
+    def init_app(self, app):
+        rabbitmq_host = app.config.get("RABBITMQ_HOST")
+        rabbitmq_port = app.config.get("RABBITMQ_PORT")
         if not rabbitmq_host or not rabbitmq_port:
-            logger.critical("RABBITMQ_GET: RabbitMQ host or port not configured. Cannot establish connection.")
+            logger.critical("RABBITMQ_POOL: RabbitMQ host or port not configured.")
             raise ConnectionError("RabbitMQ configuration missing.")
 
+        self.parameters = pika.ConnectionParameters(
+            host=rabbitmq_host,
+            port=rabbitmq_port,
+            heartbeat=600, # Recommended for long-lived connections
+            blocked_connection_timeout=300 # Timeout for blocked connections
+        )
+        self.queues = video_queue_names(app.config) + (app.config.get("MP3_QUEUE", "mp3"),)
+        self.pool_size = app.config.get("RABBITMQ_POOL_SIZE", 4)
+        self.acquire_timeout = app.config.get("RABBITMQ_POOL_TIMEOUT", 5.0)
+        app.extensions["rabbitmq_publisher"] = self
+        logger.info(f"RABBITMQ_POOL: Configured for {rabbitmq_host}:{rabbitmq_port} with pool size {self.pool_size}.")
+
+    def publish(self, routing_key, body, properties=None):
+        """
+        Publishes a message on the default exchange and waits for the broker confirm.
+
+        A dead connection is discarded and the publish retried once on a fresh one.
+
+        Raises:
+            pika.exceptions.UnroutableError / NackError: The broker refused the message.
+            ConnectionError: No usable connection to RabbitMQ could be obtained.
+        """
+        for attempt in (1, 2):
+            connection, channel = self._acquire()
+            try:
+                started = time.perf_counter()
+                channel.basic_publish(
+                    exchange="",
+                    routing_key=routing_key,
+                    body=body,
+                    properties=properties,
+                    mandatory=True,
+                )
+                metrics.RABBITMQ_PUBLISH.observe(time.perf_counter() - started)
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError):
+                # The channel itself is still healthy, only this message was refused.
+                self._release(connection, channel)
+                raise
+            except pika.exceptions.AMQPError as e:
+                self._discard(connection)
+                if attempt == 2:
+                    raise ConnectionError(f"RabbitMQ publish failed: {e}")
+                logger.warning(f"RABBITMQ_POOL: Publish failed on a stale connection, reconnecting: {e}")
+                continue
+            except BaseException:
+                # Anything else (a socket error pika didn't wrap, bad properties, ...) leaves the
+                # channel in an unknown state; drop it so its pool slot is given back.
+                self._discard(connection)
+                raise
+            self._release(connection, channel)
+            return
+
+    def close(self):
+        """Closes every idle pooled connection (e.g. on shutdown)."""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+    def _reset_if_forked(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # Connections inherited from a parent process must never be reused.
+                self._idle = queue.LifoQueue()
+                self._created = 0
+                self._queues_declared = False
+                self._pid = pid
+
+    def _acquire(self):
+        if self.parameters is None:
+            raise ConnectionError("RabbitMQ publisher pool is not initialized.")
+        self._reset_if_forked()
+
+        while True:
+            try:
+                connection, channel = self._idle.get_nowait()
+            except queue.Empty:
+                connection = None
+
+            if connection is None:
+                with self._lock:
+                    can_create = self._created < self.pool_size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    return self._connect()
+                try:
+                    connection, channel = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise ConnectionError("RabbitMQ publisher pool exhausted.")
+
+            if self._is_usable(connection, channel):
+                return connection, channel
+            self._discard(connection)
+
+    def _connect(self):
         try:
-            # Create a new connection for this request context
-            connection = pika.BlockingConnection(pika.ConnectionParameters(
-                host=rabbitmq_host,
-                port=rabbitmq_port,
-                heartbeat=600, # Recommended for long-lived connections
-                blocked_connection_timeout=300 # Timeout for blocked connections
-            ))
+            started = time.perf_counter()
+            connection = pika.BlockingConnection(self.parameters)
             channel = connection.channel()
-            logger.info(f"RABBITMQ_GET: RabbitMQ connection established to {rabbitmq_host}:{rabbitmq_port}. Conn ID: {id(connection)}, Channel ID: {id(channel)}")
-
-            # Store in Flask's g object for the duration of the request
-            g.rabbitmq_connection = connection
-            g.rabbitmq_channel = channel
-
-            # Declare queues (idempotent operation, safe to call on each new channel)
-            video_queue = current_app.config.get("VIDEO_QUEUE", "video")
-            mp3_queue = current_app.config.get("MP3_QUEUE", "mp3")
-            channel.queue_declare(queue=video_queue, durable=True)
-            channel.queue_declare(queue=mp3_queue, durable=True)
-            logger.info(f"RABBITMQ_GET: Queues '{video_queue}' and '{mp3_queue}' declared.")
-
-        except (pika.exceptions.AMQPConnectionError, pika.exceptions.ChannelClosedByBroker) as e:
-            logger.error(f"RABBITMQ_GET: Failed to connect to RabbitMQ at {rabbitmq_host}:{rabbitmq_port}: {e}", exc_info=True)
-            # Ensure any partially created connection/channel is cleaned up
-            if 'rabbitmq_connection' in g and g.rabbitmq_connection and not g.rabbitmq_connection.is_closed:
-                g.rabbitmq_connection.close()
-            g.rabbitmq_connection = None
-            g.rabbitmq_channel = None
+            channel.confirm_delivery()
+            metrics.RABBITMQ_CONNECT.observe(time.perf_counter() - started)
+            if not self._queues_declared:
+                for queue_name in self.queues:
+                    channel.queue_declare(queue=queue_name, durable=True)
+                self._queues_declared = True
+                logger.info(f"RABBITMQ_POOL: Queues {list(self.queues)} declared.")
+        except Exception as e:
+            with self._lock:
+                self._created -= 1
+            logger.error(f"RABBITMQ_POOL: Failed to connect to RabbitMQ at {self.parameters.host}:{self.parameters.port}: {e}", exc_info=True)
             raise ConnectionError(f"RabbitMQ connection failed: {e}")
+        logger.info(f"RABBITMQ_POOL: New pooled connection established. Conn ID: {id(connection)}, Channel ID: {id(channel)}")
+        return connection, channel
+
+    @staticmethod
+    def _is_usable(connection, channel):
+        if connection.is_closed or channel.is_closed:
+            return False
+        try:
+            # Services heartbeats accumulated while the connection sat idle in the pool.
+            connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            return False
+        return True
+
+    def _release(self, connection, channel):
+        if self._pid == os.getpid():
+            self._idle.put((connection, channel))
+
+    def _discard(self, connection):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._created -= 1
+        try:
+            if connection.is_open:
+                connection.close()
         except Exception as e:
-            logger.critical(f"RABBITMQ_GET: An unexpected error occurred during RabbitMQ connection: {e}", exc_info=True)
-            # Ensure any partially created connection/channel is cleaned up
-            if 'rabbitmq_connection' in g and g.rabbitmq_connection and not g.rabbitmq_connection.is_closed:
-                g.rabbitmq_connection.close()
-            g.rabbitmq_connection = None
-            g.rabbitmq_channel = None
-            raise ConnectionError(f"Unexpected RabbitMQ connection error: {e}")
-
-    return g.rabbitmq_channel
\ No newline at end of file
+            logger.debug(f"RABBITMQ_POOL: Error closing discarded connection (ID: {id(connection)}): {e}")
+
+
+rabbitmq_publisher = RabbitMQPublisherPool()
+
+
+class QueueDepthMonitor:
+    """
+    Keeps a cached total of the messages waiting in the video queues.
+
+    A daemon thread (started lazily in each worker process) refreshes the total
+    every `refresh_interval` seconds with passive queue_declare calls on its own
+    connection, so request handlers only read a number. If the broker can't be
+    reached the cached value goes stale and depth() returns None: admission
+    control then fails open rather than rejecting every upload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._depth = None
+        self._updated_at = 0.0
+        self.parameters = None
+        self.queues = ()
+        self.refresh_interval = 5.0
+
+    def init_app(self, app):
+        self.parameters = pika.ConnectionParameters(
+            host=app.config.get("RABBITMQ_HOST"),
+            port=app.config.get("RABBITMQ_PORT"),
+            heartbeat=60,
+        )
+        self.queues = video_queue_names(app.config)
+        self.refresh_interval = app.config.get("QUEUE_DEPTH_REFRESH", 5.0)
+        app.extensions["queue_depth_monitor"] = self
+
+    def depth(self):
+        """Returns the cached number of waiting conversion jobs, or None if unknown/stale."""
+        self._ensure_started()
+        if time.monotonic() - self._updated_at > 3 * self.refresh_interval:
+            return None
+        return self._depth
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid or self.parameters is None:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # Threads don't survive a fork, so every worker process starts its own.
+                self._pid = pid
+                self._depth = None
+                self._updated_at = 0.0
+                threading.Thread(target=self._run, name="queue-depth-monitor", daemon=True).start()
+
+    def _run(self):
+        connection = channel = None
+        while True:
+            try:
+                if connection is None or connection.is_closed:
+                    connection = pika.BlockingConnection(self.parameters)
+                    channel = None
+                if channel is None or channel.is_closed:
+                    channel = connection.channel()
+                total = 0
+                for queue_name in self.queues:
+                    total += channel.queue_declare(queue=queue_name, passive=True).method.message_count
+                self._depth = total
+                self._updated_at = time.monotonic()
+            except pika.exceptions.ChannelClosedByBroker as e:
+                # A queue doesn't exist yet (nothing declared it); a new channel is opened next round.
+                logger.debug(f"QUEUE_DEPTH: Passive declare failed: {e}")
+            except Exception as e:
+                logger.warning(f"QUEUE_DEPTH: Failed to refresh video queue depth: {e}")
+                try:
+                    if connection is not None and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+                connection = None
+
+            try:
+                if connection is not None and connection.is_open:
+                    # Sleeping through the connection keeps its heartbeats serviced.
+                    connection.sleep(self.refresh_interval)
+                else:
+                    time.sleep(self.refresh_interval)
+            except Exception:
+                connection = None
+                time.sleep(self.refresh_interval)
+
+
+queue_depth_monitor = QueueDepthMonitor()
@@ -0,0 +1,133 @@
+# app/metrics.py
+
+import os
+import time
+import logging
+from flask import Blueprint, Response, request, g
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets from sub-millisecond (cache hits, publishes) up to multi-minute uploads.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_SECONDS = Histogram(
+    "gateway_request_duration_seconds",
+    "Total request time, including streaming the response body.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+AUTH_VALIDATE_SECONDS = Histogram(
+    "gateway_auth_validate_duration_seconds",
+    "Token validation time by path (cache, local verification or remote auth service call).",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+GRIDFS_SECONDS = Histogram(
+    "gateway_gridfs_duration_seconds",
+    "Time spent in GridFS reads and writes per request (one observation per upload or download).",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+RABBITMQ_SECONDS = Histogram(
+    "gateway_rabbitmq_duration_seconds",
+    "RabbitMQ connection setup and confirmed publish time.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+BYTES_IN = Counter("gateway_request_bytes_total", "Request body bytes received.", ["route"])
+BYTES_OUT = Counter("gateway_response_bytes_total", "Response body bytes sent.", ["route"])
+
+# Label children are resolved once here so the hot paths only pay for an observe().
+AUTH_CACHE = AUTH_VALIDATE_SECONDS.labels(mode="cache")
+AUTH_LOCAL = AUTH_VALIDATE_SECONDS.labels(mode="local")
+AUTH_REMOTE = AUTH_VALIDATE_SECONDS.labels(mode="remote")
+GRIDFS_PUT = GRIDFS_SECONDS.labels(operation="put")
+GRIDFS_GET = GRIDFS_SECONDS.labels(operation="get")
+RABBITMQ_CONNECT = RABBITMQ_SECONDS.labels(operation="connect")
+RABBITMQ_PUBLISH = RABBITMQ_SECONDS.labels(operation="publish")
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Pre-forked workers each write their own files; merge them on every scrape.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Exposes every gateway metric in the Prometheus text format."""
+    return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def start_metrics_server(port):
+    """
+    Serves /metrics on its own port, which the Service and ingress don't expose.
+    Started once per server: by the gunicorn master (gunicorn.conf.py) or by main.py.
+    """
+    start_http_server(port, registry=_registry())
+    logger.info(f"METRICS: Exposed on :{port}/metrics")
+
+
+def _route_label():
+    # The URL rule, not the raw path, so ids in paths don't create new series.
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+
+    route = _route_label()
+    method = request.method
+    status = str(response.status_code)
+    bytes_in = g.pop("metrics_bytes_in", None)
+    if bytes_in is None:
+        bytes_in = request.content_length or 0
+    if bytes_in:
+        BYTES_IN.labels(route=route).inc(bytes_in)
+    bytes_out = response.content_length or 0
+
+    def observe():
+        # Runs once the body has been fully sent, so streamed downloads are timed end to end.
+        REQUEST_SECONDS.labels(route=route, method=method, status=status).observe(time.perf_counter() - start)
+        if bytes_out:
+            BYTES_OUT.labels(route=route).inc(bytes_out)
+
+    response.call_on_close(observe)
+    return response
+
+
+def record_bytes_in(count):
+    """Overrides the request's byte count for bodies without a Content-Length (chunked uploads)."""
+    g.metrics_bytes_in = count
+
+
+def init_metrics(app):
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    if app.config.get("METRICS_PORT"):
+        logger.info(f"METRICS: Request instrumentation enabled, exposed on :{app.config['METRICS_PORT']}/metrics.")
+    else:
+        # METRICS_PORT=0: on the public port, so keep /metrics out of the ingress some other way.
+        app.register_blueprint(metrics_bp)
+        logger.info("METRICS: Request instrumentation enabled, exposed on /metrics.")
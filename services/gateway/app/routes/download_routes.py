@@ -1,9 +1,11 @@
+import datetime
 import json
 import logging
-import io
 import os # Keep os for other potential env vars, though not directly used for mongo_auth_db here
+import time
 
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
+from app import metrics
 from app.services import auth_service
 from bson.objectid import ObjectId, InvalidId
 import gridfs
@@ -67,38 +69,113 @@ def download():
         logger.critical(f"DOWNLOAD FUNCTION: Unexpected error accessing MongoDB/GridFS: {e}", exc_info=True)
         return jsonify({"error": "Internal server error during storage access"}), 500
 
-    # --- 5. Retrieve File from GridFS and Serve ---
+    # --- 5. Retrieve File from GridFS and Stream It ---
     try:
-        # Use the GridFS instance to get the file.
-        # 'out' will be a GridOut object, which is a file-like object.
+        # 'out' is a GridOut: only the file document is fetched here, chunks are read lazily.
+        started = time.perf_counter()
         out = fs_mp3s_instance.get(fid_obj)
-        
-        # --- DEBUGGING STEP: Read into BytesIO and check size ---
-        # Read the entire content of the GridOut object into an in-memory BytesIO buffer.
-        # This ensures the full file is read from MongoDB before sending.
-        file_buffer = io.BytesIO(out.read())
-        
-        # Get the size of the data in the buffer
-        buffer_size = file_buffer.getbuffer().nbytes
-        
-        logger.info(f"Retrieved MP3 with FID: {fid_str}. GridFS reported length: {out.length} bytes. "
-                    f"BytesIO buffer size: {buffer_size} bytes. Serving file.")
-        
-        # IMPORTANT: Seek the buffer back to the beginning before sending it
-        file_buffer.seek(0)
-        # --- END DEBUGGING STEP ---
-        
+        get_seconds = time.perf_counter() - started
+        logger.info(f"Retrieved MP3 with FID: {fid_str}. GridFS reported length: {out.length} bytes. Streaming file.")
+
         # Determine the download filename.
         # GridOut objects often have a 'filename' attribute if stored with one.
-        # If your converter worker doesn't set a filename during fs_mp3s.put(),
-        # consider adding `filename=f"{video_fid}.mp3"` there for better download names.
         download_filename = out.filename if hasattr(out, 'filename') and out.filename else f"{fid_str}.mp3"
-        
-        # Pass the BytesIO buffer to send_file
-        return send_file(file_buffer, download_name=download_filename, mimetype="audio/mpeg")
+
+        return _stream_grid_out(out, download_filename, get_seconds)
     except gridfs.NoFile:
         logger.warning(f"Download attempt: MP3 file with FID '{fid_str}' not found in GridFS.")
         return jsonify({"error": "File not found"}), 404 # Not Found
     except Exception as e:
         logger.error(f"DOWNLOAD FUNCTION: An unexpected error occurred while retrieving or sending file '{fid_str}': {e}", exc_info=True)
         return jsonify({"error": "Internal server error during file download"}), 500
+
+
+def _grid_out_etag(out):
+    """
+    Builds a strong ETag for a GridFS file: its md5 when the writer stored one,
+    otherwise the id, upload date and length, which are immutable for a GridFS file.
+    """
+    md5 = getattr(out, "md5", None)
+    if md5:
+        return md5
+    return f"{out._id}-{int(out.upload_date.timestamp() * 1000)}-{out.length}"
+
+
+def _if_range_matches(etag, last_modified):
+    """
+    If-Range: the range is only served while the client's copy is still current,
+    i.e. the ETag or (at HTTP's one-second resolution) the Last-Modified date matches.
+    """
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        if last_modified.tzinfo is None:
+            # pymongo returns naive UTC datetimes unless the client is tz_aware.
+            last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+        return int(if_range.date.timestamp()) == int(last_modified.timestamp())
+    return True
+
+
+def _stream_grid_out(out, download_filename, gridfs_seconds=0.0):
+    """
+    Serves a GridOut as a streamed response, one GridFS chunk at a time.
+
+    Honours If-None-Match (304), a single-range Range header (206/416) and If-Range,
+    so players can seek and interrupted downloads can resume. Multi-range requests
+    are answered with the whole file (200), which RFC 9110 allows.
+
+    gridfs_seconds (the time spent opening the GridOut) and the chunk reads are
+    recorded as a single GRIDFS_GET observation once the response is done.
+    """
+    etag = _grid_out_etag(out)
+    total_length = out.length
+
+    # --- Conditional request: the client already has this exact file ---
+    if request.if_none_match.contains_weak(etag):
+        out.close()
+        metrics.GRIDFS_GET.observe(gridfs_seconds)
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # --- Range request: ignored when If-Range no longer matches the current file ---
+    byte_range = None
+    if request.range and len(request.range.ranges) == 1 and _if_range_matches(etag, out.upload_date):
+        byte_range = request.range.range_for_length(total_length)
+        if byte_range is None:
+            out.close()
+            metrics.GRIDFS_GET.observe(gridfs_seconds)
+            response = Response(status=416)
+            response.headers["Content-Range"] = f"bytes */{total_length}"
+            return response
+
+    start, stop = byte_range if byte_range else (0, total_length)
+    out.seek(start)
+
+    def generate():
+        # Only the chunk reads are timed; waiting on the client to drain the socket is not GridFS time.
+        remaining = stop - start
+        read_seconds = gridfs_seconds
+        try:
+            while remaining > 0:
+                started = time.perf_counter()
+                chunk = out.read(min(out.chunk_size, remaining))
+                read_seconds += time.perf_counter() - started
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            out.close()
+            metrics.GRIDFS_GET.observe(read_seconds)
+
+    response = Response(generate(), status=206 if byte_range else 200, mimetype="audio/mpeg", direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = "bytes"
+    response.set_etag(etag)
+    response.last_modified = out.upload_date
+    response.headers.set("Content-Disposition", "inline", filename=download_filename)
+    if byte_range:
+        response.content_range = f"bytes {start}-{stop - 1}/{total_length}"
+    return response
@@ -0,0 +1,57 @@
+from flask import Blueprint, request, jsonify, current_app
+from app.services import auth_service as validate, job_service as jobs
+import logging
+
+logger = logging.getLogger(__name__)
+
+job_bp = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def _respond(result, status_code):
+    if isinstance(result, str):
+        return jsonify({"error": result}), status_code
+    return jsonify(result), status_code
+
+
+@job_bp.route("/", methods=["GET"])
+def list_jobs():
+    """
+    Lists the caller's conversion jobs, newest first.
+    Query parameters: 'state', 'limit' (max 100) and 'before' (the previous page's next_before).
+    """
+    access_payload, error_response = validate.validate_token_and_get_payload(request)
+    if error_response:
+        logger.warning(f"Job listing failed due to token validation: {error_response}")
+        return error_response
+
+    return _respond(*jobs.list_jobs(
+        access_payload,
+        state=request.args.get("state"),
+        limit=request.args.get("limit", 20, type=int),
+        before=request.args.get("before"),
+    ))
+
+
+@job_bp.route("/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Returns one job. With 'wait=<seconds>' the request is held until the job's state
+    changes from 'state' (default: its current state), so clients can follow a job
+    with one request per transition instead of polling.
+    """
+    access_payload, error_response = validate.validate_token_and_get_payload(request)
+    if error_response:
+        logger.warning(f"Job lookup failed due to token validation: {error_response}")
+        return error_response
+
+    result, status_code = jobs.get_job(
+        job_id,
+        access_payload,
+        wait=request.args.get("wait", 0, type=float),
+        seen_state=request.args.get("state"),
+    )
+    if status_code == 429:
+        # Every long-poll slot is taken; a plain GET (no wait) still answers immediately.
+        retry_after = max(int(current_app.config.get("JOBS_POLL_INTERVAL", 1)), 1)
+        return jsonify({"error": result}), status_code, {"Retry-After": str(retry_after)}
+    return _respond(result, status_code)
@@ -0,0 +1,88 @@
+from flask import Blueprint, request, jsonify
+from app.services import auth_service as validate, storage_service as storage, upload_session_service as sessions
+import logging
+
+logger = logging.getLogger(__name__)
+
+resumable_upload_bp = Blueprint("resumable_upload", __name__, url_prefix="/upload/sessions")
+
+
+def _authorize():
+    """
+    Returns (access_payload, None) for an admin token, or (None, error_response).
+    """
+    access_payload, error_response = validate.validate_token_and_get_payload(request)
+    if error_response:
+        logger.warning(f"Resumable upload attempt failed due to token validation: {error_response}")
+        return None, error_response
+    if not access_payload.get("admin"):
+        logger.warning(f"Resumable upload attempt by non-admin user: {access_payload.get('username')}")
+        return None, (jsonify({"error": "Not authorized: Admin privileges required"}), 403)
+    return access_payload, None
+
+
+def _respond(result, status_code):
+    if isinstance(result, str):
+        return jsonify({"error": result}), status_code
+    return jsonify(result), status_code
+
+
+@resumable_upload_bp.route("/", methods=["POST"])
+def create_session():
+    """
+    Opens a resumable upload. Body: {"filename": "...", "size": <total bytes>}.
+    """
+    access_payload, error_response = _authorize()
+    if error_response:
+        return error_response
+
+    # Only new sessions are shed; chunks of sessions already admitted keep flowing.
+    rejection = storage.check_admission()
+    if rejection:
+        response_message, status_code, retry_after = rejection
+        return jsonify({"error": response_message}), status_code, {"Retry-After": str(retry_after)}
+
+    body = request.get_json(silent=True) or {}
+    return _respond(*sessions.create_session(access_payload, body.get("filename"), body.get("size")))
+
+
+@resumable_upload_bp.route("/<session_id>", methods=["GET"])
+def get_session(session_id):
+    """
+    Reports which chunks have been received, so an interrupted client knows what to resend.
+    """
+    access_payload, error_response = _authorize()
+    if error_response:
+        return error_response
+    return _respond(*sessions.get_session(session_id, access_payload))
+
+
+@resumable_upload_bp.route("/<session_id>", methods=["PUT"])
+def put_chunk(session_id):
+    """
+    Uploads one chunk as the raw request body. Query parameter 'offset' is the byte offset.
+    """
+    access_payload, error_response = _authorize()
+    if error_response:
+        return error_response
+
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"error": "'offset' query parameter is required"}), 400
+    return _respond(*sessions.write_chunk(session_id, access_payload, offset, request.stream, request.content_length))
+
+
+@resumable_upload_bp.route("/<session_id>/finalize", methods=["POST"])
+def finalize(session_id):
+    access_payload, error_response = _authorize()
+    if error_response:
+        return error_response
+    return _respond(*sessions.finalize(session_id, access_payload))
+
+
+@resumable_upload_bp.route("/<session_id>", methods=["DELETE"])
+def abort(session_id):
+    access_payload, error_response = _authorize()
+    if error_response:
+        return error_response
+    return _respond(*sessions.abort(session_id, access_payload))
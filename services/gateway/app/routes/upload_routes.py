@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify 
+from flask import Blueprint, request, jsonify, current_app
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from app import tracing
 from app.services import auth_service as validate, storage_service as storage
 import json
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,6 +12,7 @@ upload_bp = Blueprint("upload", __name__, url_prefix="/upload")
 
 @upload_bp.route("/", methods=["POST"])
 def upload():
+    received_at = time.time()
 
     # --- 1. Token Validation ---
     # Assuming auth_service.token returns (decoded_payload, error_response_tuple)
@@ -16,14 +20,27 @@ def upload():
     access_payload, error_response  = validate.validate_token_and_get_payload(request)
     if error_response :
         logger.warning(f"Upload attempt failed due to token validation: {error_response}")
-        return error_response # This already contains jsonify and status code 
+        return error_response # This already contains jsonify and status code
 
     # --- 2. Authorization Check (Admin Privileges) ---
     if not access_payload.get("admin"):
         logger.warning(f"Upload attempt by non-admin user: {access_payload.get('username')}")
         return jsonify({"error": "Not authorized: Admin privileges required"}), 403 # 403 Forbidden
 
-    # --- 3. File Count Validation ---
+    # --- 3. Admission Control (before any of the body is read) ---
+    rejection = storage.check_admission()
+    if rejection:
+        response_message, status_code, retry_after = rejection
+        return jsonify({"error": response_message}), status_code, {"Retry-After": str(retry_after)}
+
+    # Only an accepted upload becomes a job; its trace still starts when the request arrived.
+    tracing.start_job(started_at=received_at)
+
+    # --- 4. Streaming mode: the body goes straight into GridFS without being parsed first ---
+    if current_app.config.get("UPLOAD_MODE", "stream") == "stream":
+        return _streaming_upload(access_payload)
+
+    # --- 5. File Count Validation ---
     if len(request.files) == 0:
         logger.warning("Upload attempt: No file provided.")
         return jsonify({"error": "No file provided"}), 400 # Bad Request
@@ -31,21 +48,121 @@ def upload():
         logger.warning(f"Upload attempt: Exactly 1 file required, but {len(request.files)} received.")
         return jsonify({"error": "Exactly one file is required per upload"}), 400 # Bad Request
 
-    # --- 4. Process Uploaded File(s) ---
+    # --- 6. Process Uploaded File(s) ---
      # Iterate through files (though we expect only one based on validation)
     for filename, f_stream in request.files.items():
         logger.info(f"Received file '{filename}' from user '{access_payload.get('username')}'")
         # Call storage_service.upload without fs_videos and channel
         # storage_service.upload now internally accesses current_app for these resources
-        response_message, status_code = storage.upload(f_stream, access_payload)
-        # storage_service.upload now returns (message, status_code)
+        response_message, status_code, video_fid = storage.upload(f_stream, access_payload)
+        # storage_service.upload now returns (message, status_code, video_fid)
         if status_code != 202: # Check for non-202 status codes (indicating an error)
             logger.error(f"Storage service upload failed for file '{filename}': {response_message} (Status: {status_code})")
             return jsonify({"error": response_message}), status_code
         else:
             logger.info(f"File '{filename}' successfully queued for processing.")
-            # If you want to return specific info about the uploaded file, you can
-            # modify storage_service.upload to return fid or other metadata.
-            # For now, we'll return a generic success for the single file.
 
-    return jsonify({"message": "File uploaded and queued successfully!"}), 202 # 202 Accepted
+    return jsonify({"message": "File uploaded and queued successfully!", "video_fid": video_fid, "job_id": tracing.job_id()}), 202 # 202 Accepted
+
+
+def _streaming_upload(access_payload):
+    """
+    Streams a raw or multipart/form-data request body into GridFS in constant memory.
+
+    Raw bodies take their filename from the 'filename' query parameter or the
+    X-Filename header; multipart bodies must contain exactly one file part.
+    """
+    max_bytes = current_app.config.get("UPLOAD_MAX_BYTES", 0)
+    if max_bytes and request.content_length and request.content_length > max_bytes:
+        logger.warning(f"Upload attempt: Content-Length {request.content_length} exceeds limit of {max_bytes} bytes.")
+        return jsonify({"error": f"File exceeds the maximum upload size of {max_bytes} bytes"}), 413
+
+    block_size = current_app.config.get("UPLOAD_CHUNK_SIZE", 255 * 1024)
+
+    if request.mimetype == "multipart/form-data":
+        boundary = request.mimetype_params.get("boundary")
+        if not boundary:
+            logger.warning("Upload attempt: multipart body without boundary.")
+            return jsonify({"error": "Malformed multipart body: missing boundary"}), 400
+        reader = MultipartFileReader(request.stream, boundary, block_size)
+        try:
+            filename, content_type = reader.open()
+        except ValueError as e:
+            logger.warning(f"Upload attempt: {e}")
+            return jsonify({"error": str(e)}), 400
+        chunks = reader
+    else:
+        filename = request.args.get("filename") or request.headers.get("X-Filename")
+        content_type = request.mimetype or None
+        chunks = _iter_stream(request.stream, block_size)
+
+    logger.info(f"Streaming file '{filename}' from user '{access_payload.get('username')}'")
+    response_message, status_code, video_fid = storage.upload_stream(chunks, access_payload, filename, content_type)
+    if status_code != 202:
+        logger.error(f"Storage service streaming upload failed for file '{filename}': {response_message} (Status: {status_code})")
+        return jsonify({"error": response_message}), status_code
+
+    logger.info(f"File '{filename}' successfully queued for processing.")
+    return jsonify({"message": "File uploaded and queued successfully!", "video_fid": video_fid, "job_id": tracing.job_id()}), 202 # 202 Accepted
+
+
+def _iter_stream(stream, block_size):
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            return
+        yield data
+
+
+class MultipartFileReader:
+    """
+    Incrementally pulls the single file part out of a multipart/form-data stream.
+
+    open() consumes the body up to the start of the file part; iterating then
+    yields the file's bytes as they are read. Non-file form fields are skipped.
+    A second file part raises ValueError.
+    """
+
+    def __init__(self, stream, boundary, block_size):
+        self._stream = stream
+        self._block_size = block_size
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"))
+        self._ended = False
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            if self._ended:
+                raise ValueError("Malformed multipart body: unexpected end of data")
+            data = self._stream.read(self._block_size)
+            if data:
+                self._decoder.receive_data(data)
+            else:
+                self._ended = True
+                self._decoder.receive_data(None)
+
+    def open(self):
+        while True:
+            event = self._next_event()
+            if isinstance(event, File):
+                return event.filename, event.headers.get("Content-Type")
+            if isinstance(event, Epilogue):
+                raise ValueError("No file provided")
+
+    def __iter__(self):
+        in_file = True
+        while True:
+            event = self._next_event()
+            if isinstance(event, Data):
+                if in_file and event.data:
+                    yield event.data
+                if not event.more_data:
+                    in_file = False
+            elif isinstance(event, File):
+                raise ValueError("Exactly one file is required per upload")
+            elif isinstance(event, Field):
+                in_file = False
+            elif isinstance(event, Epilogue):
+                return
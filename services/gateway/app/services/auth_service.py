@@ -1,20 +1,192 @@
 import os
 import logging
 import json # For parsing JSON responses from the auth service
+import functools
+import threading
+import time
+from collections import OrderedDict
+import jwt # For verifying tokens locally when a verification key is configured
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 import requests # For making HTTP requests to the auth service
 from flask import request, jsonify # Assuming these are used elsewhere in the module
+from app import metrics
 
 logger = logging.getLogger(__name__)
 
+# Reused across requests so calls to the auth service keep their TCP connections alive.
+_auth_http = requests.Session()
+
+
+class TokenCache:
+    """
+    Thread-safe LRU cache of validated token payloads.
+
+    Each entry expires after `ttl` seconds or at the token's own `exp` claim,
+    whichever comes first, so a cached token is never accepted past its expiry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return payload
+
+    def put(self, token, payload):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[token] = (payload, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# Fetches and caches the auth service's public keys when JWT_JWKS_URL is configured.
+_jwks_client = None
+_jwks_lock = threading.Lock()
+# A token with an unknown 'kid' forces a JWKS re-fetch at most this often (seconds), so
+# forged kids can't turn every request into a call to the auth service.
+_jwks_refreshed_at = 0.0
+
+
+def _get_jwks_client(jwks_url):
+    global _jwks_client
+    with _jwks_lock:
+        if _jwks_client is None or _jwks_client.uri != jwks_url:
+            _jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=int(os.getenv("JWKS_CACHE_TTL", "300")))
+        return _jwks_client
+
+
+def _jwks_signing_key(jwks_url, token):
+    """
+    Returns the JWKS key matching the token's 'kid', or None when there is none.
+    Raises jwt.PyJWKClientError when the JWKS can't be fetched.
+    """
+    global _jwks_refreshed_at
+    kid = jwt.get_unverified_header(token).get("kid")
+    client = _get_jwks_client(jwks_url)
+    signing_key = client.match_kid(client.get_signing_keys(), kid)
+    if signing_key is None:
+        min_interval = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+        with _jwks_lock:
+            refresh = time.monotonic() - _jwks_refreshed_at >= min_interval
+            if refresh:
+                _jwks_refreshed_at = time.monotonic()
+        if refresh:
+            # The auth service may have rotated in a new key since the keys were cached.
+            signing_key = client.match_kid(client.get_signing_keys(refresh=True), kid)
+    return signing_key
+
+
+@functools.lru_cache(maxsize=8)
+def _key_and_algorithm(verification_key):
+    """
+    Resolves a configured JWT_PUBLIC_KEY (PEM) or JWT_SECRET to the key object and the
+    one algorithm it can verify, so a token can't pick a different one in its header.
+    """
+    if verification_key.lstrip().startswith("-----BEGIN"):
+        public_key = load_pem_public_key(verification_key.encode())
+        if isinstance(public_key, rsa.RSAPublicKey):
+            return public_key, "RS256"
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            return public_key, "EdDSA"
+        raise ValueError(f"Unsupported JWT_PUBLIC_KEY type: {type(public_key).__name__}")
+    return verification_key, "HS256"
+
+
+token_cache = TokenCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("AUTH_CACHE_TTL", "300")),
+)
+
+
+def _get_bearer_token(auth_header):
+    parts = auth_header.split(" ")
+    if len(parts) != 2 or parts[0] != "Bearer" or not parts[1]:
+        return None
+    return parts[1]
+
+
+def _verify_locally(token, verification_key):
+    """
+    Verifies a JWT in-process, mirroring the checks done by the auth service's /validate route.
+    The algorithm is fixed by the key (the JWKS entry's 'alg', the PEM key type, or HS256 for
+    a shared secret) and must also be listed in JWT_ALGORITHMS.
+
+    Returns:
+        tuple: (decoded_payload_dict, None) or (None, (error_message_dict, status_code)).
+    """
+    allowed = [a.strip() for a in os.getenv("JWT_ALGORITHMS", "HS256").split(",") if a.strip()]
+    try:
+        if verification_key.startswith(("http://", "https://")):
+            # JWKS URL: pick the public key matching the token's 'kid' header.
+            signing_key = _jwks_signing_key(verification_key, token)
+            if signing_key is None:
+                logger.warning(f"Local token validation failed: Unknown key id. Token start: {token[:10]}...")
+                return None, (jsonify({"error": "Invalid token signature"}), 401)
+            key, algorithm = signing_key.key, signing_key.algorithm_name
+        else:
+            try:
+                key, algorithm = _key_and_algorithm(verification_key)
+            except ValueError as e:
+                logger.critical(f"Local token validation failed: Invalid JWT_PUBLIC_KEY: {e}")
+                return None, (jsonify({"error": "Server configuration error: Invalid verification key"}), 500)
+        if algorithm not in allowed:
+            logger.warning(f"Local token validation failed: Key algorithm {algorithm} is not in JWT_ALGORITHMS. Token start: {token[:10]}...")
+            return None, (jsonify({"error": "Invalid token algorithm"}), 401)
+        decoded = jwt.decode(token, key, algorithms=[algorithm])
+        logger.info(f"Token validated locally for username: {decoded.get('username')}")
+        return decoded, None
+    except jwt.ExpiredSignatureError:
+        logger.warning(f"Local token validation failed: Token expired. Token start: {token[:10]}...")
+        return None, (jsonify({"error": "Token has expired"}), 401)
+    except jwt.InvalidSignatureError:
+        logger.warning(f"Local token validation failed: Invalid signature. Token start: {token[:10]}...")
+        return None, (jsonify({"error": "Invalid token signature"}), 401)
+    except jwt.InvalidAlgorithmError:
+        logger.warning(f"Local token validation failed: Invalid algorithm. Token start: {token[:10]}...")
+        return None, (jsonify({"error": "Invalid token algorithm"}), 401)
+    except jwt.PyJWKClientError as e:
+        logger.error(f"Local token validation failed: Could not fetch signing keys from JWKS: {e}")
+        return None, (jsonify({"error": "Authentication keys unavailable"}), 503)
+    except jwt.PyJWTError as e:
+        # Any other malformed, mis-signed or mismatched token (including InvalidKeyError).
+        logger.warning(f"Local token validation failed: {e}. Token start: {token[:10]}...")
+        return None, (jsonify({"error": "Invalid token format or structure"}), 401)
+
+
 def validate_token_and_get_payload(request):
     """
-    Validates a JWT token by calling an external authentication service.
+    Validates a JWT token and returns its payload.
+
+    Recently validated tokens are served from an in-process cache. Otherwise the token
+    is verified locally when AUTH_MODE is "local" (the default) and a verification key
+    (JWT_JWKS_URL, JWT_PUBLIC_KEY or JWT_SECRET) is configured; in "remote" mode, or without a key,
+    it falls back to calling the external authentication service.
 
     Args:
         request (flask.request): The Flask request object containing the Authorization header.
 
     Returns:
-        tuple: (decoded_payload_dict, None) on successful validation (200 OK from auth service),
+        tuple: (decoded_payload_dict, None) on successful validation,
                (None, (error_message_dict, status_code)) on validation failure or error.
     """
     # --- 1. Retrieve Authorization header ---
@@ -23,7 +195,29 @@ def validate_token_and_get_payload(request):
         logger.warning("Token validation attempt: Missing Authorization header.")
         return None, (jsonify({"error": "Authorization header is missing"}), 401)
 
-    # --- 2. Get Auth Service Address ---
+    token = _get_bearer_token(auth_header)
+    if token:
+        started = time.perf_counter()
+        cached_payload = token_cache.get(token)
+        if cached_payload is not None:
+            metrics.AUTH_CACHE.observe(time.perf_counter() - started)
+            logger.debug(f"Token served from validation cache for username: {cached_payload.get('username')}")
+            return cached_payload, None
+
+    # --- 2. Local verification when a key is available ---
+    verification_key = os.getenv("JWT_JWKS_URL") or os.getenv("JWT_PUBLIC_KEY") or os.getenv("JWT_SECRET")
+    if os.getenv("AUTH_MODE", "local").lower() == "local" and verification_key:
+        if not token:
+            logger.warning("Token validation attempt: Invalid Authorization header format.")
+            return None, (jsonify({"error": "Invalid Authorization header format. Must be 'Bearer <token>'"}), 401)
+        started = time.perf_counter()
+        decoded_payload, error = _verify_locally(token, verification_key)
+        metrics.AUTH_LOCAL.observe(time.perf_counter() - started)
+        if decoded_payload is not None:
+            token_cache.put(token, decoded_payload)
+        return decoded_payload, error
+
+    # --- 3. Get Auth Service Address ---
     auth_svc_address = os.getenv("AUTH_SVC_ADDRESS")
     if not auth_svc_address:
         logger.critical("AUTH_SVC_ADDRESS environment variable is not set. Cannot validate tokens externally.")
@@ -31,21 +225,27 @@ def validate_token_and_get_payload(request):
 
     auth_svc_url = f"http://{os.environ.get('AUTH_SVC_ADDRESS')}/validate"
 
-    # --- 3. Call External Authentication Service ---
+    # --- 4. Call External Authentication Service ---
     try:
         logger.info(f"Calling external auth service at {auth_svc_url} for token validation.")
-        response = requests.post(
-            auth_svc_url,
-            headers={"Authorization": auth_header}, # Forward the original Authorization header
-            timeout=5 # Set a reasonable timeout for the external call
-        )
+        started = time.perf_counter()
+        try:
+            response = _auth_http.post(
+                auth_svc_url,
+                headers={"Authorization": auth_header}, # Forward the original Authorization header
+                timeout=5 # Set a reasonable timeout for the external call
+            )
+        finally:
+            metrics.AUTH_REMOTE.observe(time.perf_counter() - started)
 
-        # --- 4. Process Response from Auth Service ---
+        # --- 5. Process Response from Auth Service ---
         if response.status_code == 200:
             try:
                 # The auth service should return a JSON payload on success
                 decoded_payload = response.json()
                 logger.info(f"Token validated successfully by auth service for username: {decoded_payload.get('username')}")
+                if token:
+                    token_cache.put(token, decoded_payload)
                 return decoded_payload, None # Success: return payload, no error
             except json.JSONDecodeError as e:
                 logger.error(f"Auth service returned 200 OK but response body is not valid JSON. Response: '{response.text[:100]}...'. Error: {e}", exc_info=True)
@@ -83,7 +283,7 @@ def login(request):
 
     basicAuth = (auth.username, auth.password)
 
-    response = requests.post(
+    response = _auth_http.post(
         f"http://{os.environ.get('AUTH_SVC_ADDRESS')}/login", auth=basicAuth
     )
 
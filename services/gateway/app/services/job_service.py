@@ -0,0 +1,196 @@
+# app/services/job_service.py
+
+import datetime
+import logging
+import threading
+import time
+from flask import current_app
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from app.extensions import mongo_video
+
+logger = logging.getLogger(__name__)
+
+# One document per conversion job, keyed by the job id that travels with the queue
+# messages. The gateway creates it when the job is queued; the converter moves it
+# through the states below and fills in mp3_fid, timings and errors.
+JOBS_COLLECTION = "jobs"
+STATE_QUEUED = "queued"
+STATE_CONVERTING = "converting"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+TERMINAL_STATES = (STATE_DONE, STATE_FAILED)
+
+_indexes_ready = False
+# Bounds the long polls held at once by this process (JOBS_MAX_WAITERS), created on first use.
+_waiters = None
+_waiters_lock = threading.Lock()
+
+
+def _jobs():
+    global _indexes_ready
+    collection = mongo_video.db[JOBS_COLLECTION]
+    if not _indexes_ready:
+        # Per-user listing, newest first (ties broken by _id), optionally filtered by state.
+        collection.create_index([("username", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+        collection.create_index([("username", ASCENDING), ("state", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+        ttl = current_app.config.get("JOBS_TTL", 0)
+        if ttl:
+            collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=ttl)
+        _indexes_ready = True
+    return collection
+
+
+def _waiter_slots():
+    global _waiters
+    with _waiters_lock:
+        if _waiters is None:
+            _waiters = threading.BoundedSemaphore(max(current_app.config.get("JOBS_MAX_WAITERS", 4), 1))
+        return _waiters
+
+
+def _public_view(job):
+    view = {
+        "job_id": job["_id"],
+        "state": job["state"],
+        "video_fid": job.get("video_fid"),
+        "mp3_fid": job.get("mp3_fid"),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "conversion": job.get("conversion"),
+        "timings": job.get("timings", {}),
+    }
+    for field in ("created_at", "updated_at", "started_at", "finished_at"):
+        value = job.get(field)
+        view[field] = value.isoformat() if value else None
+    return view
+
+
+def create_job(job_id, access, video_fid, queue=None, size=None, mp3_fid=None):
+    """
+    Records a newly queued job (or, with mp3_fid, one satisfied straight from an existing MP3).
+    Failures are logged and swallowed: job tracking must never fail an upload.
+    """
+    now = datetime.datetime.utcnow()
+    job = {
+        "_id": job_id,
+        "username": access.get("username"),
+        "state": STATE_DONE if mp3_fid else STATE_QUEUED,
+        "video_fid": str(video_fid),
+        "mp3_fid": str(mp3_fid) if mp3_fid else None,
+        "queue": queue,
+        "size": size,
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if mp3_fid:
+        job["finished_at"] = now
+        job["conversion"] = "reused"
+    try:
+        _jobs().insert_one(job)
+    except PyMongoError as e:
+        logger.error(f"JOBS: Failed to record job {job_id}: {e}")
+
+
+def mark_failed(job_id, error):
+    try:
+        now = datetime.datetime.utcnow()
+        _jobs().update_one(
+            {"_id": job_id},
+            {"$set": {"state": STATE_FAILED, "error": error, "updated_at": now, "finished_at": now}},
+        )
+    except PyMongoError as e:
+        logger.error(f"JOBS: Failed to mark job {job_id} as failed: {e}")
+
+
+def get_job(job_id, access, wait=0, seen_state=None):
+    """
+    Returns a job owned by the caller. With wait > 0 this is a long poll: the call returns
+    as soon as the state differs from seen_state (default: the state at the start of the
+    call) or the job is finished, and otherwise after `wait` seconds with the unchanged job.
+
+    Each long poll holds a server thread, so at most JOBS_MAX_WAITERS run at once per
+    process; beyond that the call returns 429 at once and the client should retry.
+
+    Returns:
+        tuple: (job_view_dict, 200) or (error_message, HTTP_status_code).
+    """
+    try:
+        job = _jobs().find_one({"_id": job_id})
+        if job is None or job.get("username") != access.get("username"):
+            return "Job not found", 404
+
+        wait = min(max(wait, 0), current_app.config.get("JOBS_MAX_WAIT", 30))
+        seen_state = seen_state or job["state"]
+        if wait > 0 and job["state"] == seen_state and job["state"] not in TERMINAL_STATES:
+            slots = _waiter_slots()
+            if not slots.acquire(blocking=False):
+                return "Too many requests waiting on jobs, retry shortly", 429
+            try:
+                job = _wait_for_change(job_id, job, seen_state, wait)
+            finally:
+                slots.release()
+            if job is None:
+                return "Job not found", 404
+    except PyMongoError as e:
+        logger.error(f"JOBS: Failed to load job {job_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to load job", 500
+
+    return _public_view(job), 200
+
+
+def _wait_for_change(job_id, job, seen_state, wait):
+    """Re-reads the job until its state leaves seen_state or it finishes; None if it was deleted."""
+    projection = {"username": 1, "state": 1}
+    interval = current_app.config.get("JOBS_POLL_INTERVAL", 1.0)
+    deadline = time.monotonic() + wait
+    # Only the indexed _id and state are re-read while waiting; the full job once it changes.
+    while job["state"] == seen_state and job["state"] not in TERMINAL_STATES and time.monotonic() < deadline:
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+        state = _jobs().find_one({"_id": job_id}, projection)
+        if state is None:
+            return None
+        if state["state"] != job["state"]:
+            job = _jobs().find_one({"_id": job_id}) or job
+    return job
+
+
+def _page_cursor(job):
+    return f"{job['created_at']},{job['job_id']}"
+
+
+def list_jobs(access, state=None, limit=20, before=None):
+    """
+    Lists the caller's jobs, newest first. 'before' is the previous page's next_before:
+    the created_at (ISO 8601) and job id of its last job. Jobs created in the same
+    millisecond are ordered by job id, so a page boundary between them skips or repeats
+    nothing. A bare ISO 8601 timestamp is still accepted and returns older jobs only.
+
+    Returns:
+        tuple: ({"jobs": [...], "next_before": ...}, 200) or (error_message, HTTP_status_code).
+    """
+    query = {"username": access.get("username")}
+    if state:
+        query["state"] = state
+    if before:
+        created_at, _, before_id = before.partition(",")
+        try:
+            created_at = datetime.datetime.fromisoformat(created_at)
+        except ValueError:
+            return "'before' must be a next_before cursor or an ISO 8601 timestamp", 400
+        if before_id:
+            query["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": before_id}}]
+        else:
+            query["created_at"] = {"$lt": created_at}
+    limit = min(max(limit, 1), 100)
+
+    try:
+        cursor = _jobs().find(query).sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+        jobs = [_public_view(job) for job in cursor]
+    except PyMongoError as e:
+        logger.error(f"JOBS: Failed to list jobs for '{access.get('username')}': {e}", exc_info=True)
+        return "Internal server error: Failed to list jobs", 500
+
+    next_before = _page_cursor(jobs[-1]) if len(jobs) == limit else None
+    return {"jobs": jobs, "next_before": next_before}, 200
@@ -1,16 +1,64 @@
 # app/services/storage_service.py
 
+import datetime
+import hashlib
 import json
+import zlib
 import logging
 import os
-from flask import current_app 
-from pymongo.errors import PyMongoError
+import time
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import pika
-import gridfs 
-from app.extensions import get_rabbitmq_channel, mongo_video
+import gridfs
+from app import metrics, tracing
+from app.extensions import rabbitmq_publisher, queue_depth_monitor, mongo_video, mongo_mp3
+from app.services import job_service
+
+# sha256 of the video content -> {video_fid, mp3_fid}; the converter fills in mp3_fid.
+VIDEO_HASHES_COLLECTION = "video_hashes"
 
 logger = logging.getLogger(__name__)
 
+def get_video_fs():
+    """
+    Returns a GridFS instance for the video database, or None if storage is not initialized.
+    """
+    # mongo_video is already initialized via init_app in extensions.py
+    mongo_video_db = mongo_video.db
+
+    if mongo_video_db is None:
+        logger.critical("UPLOAD FUNCTION: MongoDB video database object (mongo_video_db) is None. Check MongoDB connection setup.")
+        return None
+
+    # Create GridFS instance per request (or per function call)
+    # This is lightweight and ensures it's tied to the current connection context
+    fs = gridfs.GridFS(mongo_video_db)
+    logger.info(f"UPLOAD FUNCTION: GridFS instance created for this request. ID: {id(fs)}")
+    return fs
+
+
+def check_admission():
+    """
+    Sheds uploads while the conversion backlog is above QUEUE_DEPTH_LIMIT.
+
+    Reads the cached video queue depth only, so it costs nothing per request and can
+    run before the body is read. Fails open when the depth is unknown.
+
+    Returns:
+        tuple or None: None to admit, else (response_message, HTTP_status_code, retry_after_seconds).
+    """
+    limit = current_app.config.get("QUEUE_DEPTH_LIMIT", 0)
+    if not limit:
+        return None
+    depth = queue_depth_monitor.depth()
+    if depth is None or depth < limit:
+        return None
+    logger.warning(f"UPLOAD FUNCTION: Rejecting upload, {depth} conversion jobs waiting (limit {limit}).")
+    return "Conversion backlog is full, please retry later", 503, current_app.config.get("QUEUE_DEPTH_RETRY_AFTER", 60)
+
+
 def upload(f, access):
     """
     Handles the upload of a video file to MongoDB GridFS and publishes a message to RabbitMQ.
@@ -20,87 +68,305 @@ def upload(f, access):
         access (dict): Dictionary containing user access information (e.g., {"username": "user1"}).
 
     Returns:
-        tuple: A tuple containing (response_message, HTTP_status_code).
+        tuple: A tuple containing (response_message, HTTP_status_code, video_fid_or_None).
     """
     logger.info(f"UPLOAD FUNCTION: Request received. App ID: {id(current_app)}")
-    
-    # mongo_video is already initialized via init_app in extensions.py
-    mongo_video_db = mongo_video.db
-    
-    if mongo_video_db is None:
-        logger.critical("UPLOAD FUNCTION: MongoDB video database object (mongo_video_db) is None. Check MongoDB connection setup.")
-        return "Internal server error: Storage not initialized", 500
 
-    # Create GridFS instance per request (or per function call)
-    # This is lightweight and ensures it's tied to the current connection context
-    fs = gridfs.GridFS(mongo_video_db)
-    logger.info(f"UPLOAD FUNCTION: GridFS instance created for this request. ID: {id(fs)}")
+    # --- 1. Upload file to MongoDB GridFS (same path as streamed uploads, so it is hashed too) ---
+    block_size = current_app.config.get("UPLOAD_CHUNK_SIZE", 255 * 1024)
+    chunks = iter(lambda: f.read(block_size), b"")
+    return upload_stream(chunks, access, getattr(f, "filename", None), getattr(f, "mimetype", None))
 
-    # --- Get RabbitMQ Channel for this request ---
+
+def upload_stream(chunks, access, filename=None, content_type=None):
+    """
+    Streams a video straight into a GridFS file and publishes a message to RabbitMQ.
+
+    Chunks are written to a GridIn as they arrive, so memory use is bounded by the
+    GridFS chunk size and nothing is spooled to local disk. The write is aborted
+    (and its chunks removed) if the body exceeds UPLOAD_MAX_BYTES or cannot be read.
+
+    Args:
+        chunks (iterable of bytes): The video body, in arrival order.
+        access (dict): Dictionary containing user access information (e.g., {"username": "user1"}).
+        filename (str): Optional original filename to store with the video.
+        content_type (str): Optional content type to store with the video.
+
+    Returns:
+        tuple: A tuple containing (response_message, HTTP_status_code, video_fid_or_None).
+    """
+    logger.info(f"UPLOAD_STREAM FUNCTION: Request received for file '{filename}'.")
+
+    fs = get_video_fs()
+    if fs is None:
+        return "Internal server error: Storage not initialized", 500, None
+
+    max_bytes = current_app.config.get("UPLOAD_MAX_BYTES", 0)
+    grid_in = fs.new_file(
+        filename=filename,
+        content_type=content_type,
+        chunk_size=current_app.config.get("UPLOAD_CHUNK_SIZE", 255 * 1024),
+    )
+
+    # --- 1. Stream the body into GridFS, hashing it on the way ---
+    # Only the GridFS writes are timed; waiting on the client's body is not GridFS time.
+    bytes_written = 0
+    gridfs_seconds = 0.0
+    content_hash = hashlib.sha256()
     try:
-        channel = get_rabbitmq_channel() 
-    except ConnectionError as e:
-        logger.critical(f"UPLOAD FUNCTION: Failed to get RabbitMQ channel: {e}")
-        return "Internal server error: Messaging not initialized", 500
-    
-    # --- CRITICAL DEBUG: Log state of resources ---
-    logger.info(f"UPLOAD FUNCTION: Request received. App ID: {id(current_app)}")
-    logger.info(f"UPLOAD FUNCTION: mongo_video_db state: {mongo_video_db} (ID: {id(mongo_video_db)})")
-    logger.info(f"UPLOAD FUNCTION: channel state: {channel} (ID: {id(channel)})")
+        for chunk in chunks:
+            bytes_written += len(chunk)
+            if max_bytes and bytes_written > max_bytes:
+                grid_in.abort()
+                logger.warning(f"UPLOAD_STREAM FUNCTION: Upload '{filename}' exceeded the {max_bytes} byte limit. Aborted.")
+                return f"File exceeds the maximum upload size of {max_bytes} bytes", 413, None
+            content_hash.update(chunk)
+            started = time.perf_counter()
+            grid_in.write(chunk)
+            gridfs_seconds += time.perf_counter() - started
+
+        if bytes_written == 0:
+            grid_in.abort()
+            logger.warning("UPLOAD_STREAM FUNCTION: Empty upload body.")
+            return "No file provided", 400, None
+
+        started = time.perf_counter()
+        grid_in.close()
+        gridfs_seconds += time.perf_counter() - started
+    except ValueError as e:
+        grid_in.abort()
+        logger.warning(f"UPLOAD_STREAM FUNCTION: Malformed upload body for '{filename}': {e}")
+        return f"Malformed upload: {e}", 400, None
+    except PyMongoError as e:
+        grid_in.abort()
+        logger.error(f"UPLOAD_STREAM FUNCTION: GridFS write failed for '{filename}': {e}", exc_info=True)
+        return "Internal server error: Failed to store video", 500, None
+    except Exception:
+        # e.g. the client disconnected mid-upload; never leave orphaned chunks behind.
+        grid_in.abort()
+        raise
+    finally:
+        metrics.record_bytes_in(bytes_written)
+
+    metrics.GRIDFS_PUT.observe(gridfs_seconds)
+    logger.info(f"UPLOAD_STREAM FUNCTION: Stored {bytes_written} bytes in GridFS. FID: {grid_in._id}")
+
+    return queue_upload(fs, grid_in._id, access, bytes_written, content_hash.hexdigest())
 
-    fid = None
 
-    # --- 1. Upload file to MongoDB GridFS ---
-    print(mongo_video_db)
-    fid = fs.put(f)
+def queue_upload(fs, fid, access, size, content_hash, delete_on_failure=True):
+    """
+    Queues a freshly stored video for conversion, reusing an earlier upload of the same
+    content instead when DEDUP_ENABLED. The content hash is recorded only once this
+    upload's job is confirmed by the broker, so no other upload can be deduplicated
+    against a video that is still about to be deleted because its publish failed.
+
+    Returns:
+        tuple: A tuple containing (response_message, HTTP_status_code, video_fid_or_None).
+    """
+    dedup = current_app.config.get("DEDUP_ENABLED", True) and content_hash
+    if dedup:
+        duplicate_result = _deduplicate(fs, fid, content_hash, access, size, delete_on_failure)
+        if duplicate_result is not None:
+            return duplicate_result
+
+    result = queue_video(fs, fid, access, size=size, delete_on_failure=delete_on_failure, content_hash=content_hash)
+    if dedup and result[1] == 202:
+        _record_hash(fs, fid, content_hash)
+    return result
+
+
+def _deduplicate(fs, fid, content_hash, access, size, delete_on_failure=True):
+    """
+    Looks up a freshly stored video by content hash.
+
+    If the same content was uploaded (and queued) before, the existing video is reused:
+    when its MP3 already exists the job goes straight to the MP3 (notification) queue,
+    otherwise the existing video is queued again and the converter reuses whichever
+    conversion finishes first. The new copy is deleted once that publish succeeds, or
+    when it fails and delete_on_failure is set. For new content None is returned so
+    the caller queues the upload as usual.
+
+    Returns:
+        tuple or None: (response_message, HTTP_status_code, video_fid_or_None).
+    """
+    try:
+        existing = mongo_video.db[VIDEO_HASHES_COLLECTION].find_one({"_id": content_hash})
+        if existing is None or existing["video_fid"] == fid or not fs.exists(existing["video_fid"]):
+            # New content, a retried finalize of the recorded upload itself, or a stale record
+            # (the original video was removed, _record_hash replaces it).
+            return None
+    except PyMongoError as e:
+        logger.error(f"UPLOAD FUNCTION: Dedup lookup failed for FID {fid}, queuing normally: {e}")
+        return None
+
+    existing_fid = existing["video_fid"]
+    mp3_fid = existing.get("mp3_fid")
+    if mp3_fid and gridfs.GridFS(mongo_mp3.db).exists(ObjectId(mp3_fid)):
+        result = queue_mp3(existing_fid, mp3_fid, access)
+    else:
+        # Same content hash, so the existing video has the same size.
+        result = queue_video(fs, existing_fid, access, size=size, delete_on_failure=False, content_hash=content_hash)
+
+    if result[1] == 202 or delete_on_failure:
+        try:
+            fs.delete(fid)
+            logger.info(f"UPLOAD FUNCTION: Upload {fid} duplicates video {existing_fid} (sha256 {content_hash[:12]}...). Deleted new copy.")
+        except PyMongoError as e:
+            logger.error(f"UPLOAD FUNCTION: Failed to delete duplicate upload {fid}: {e}")
+    return result
+
+
+def _record_hash(fs, fid, content_hash):
+    """
+    Records a queued video as the copy later uploads of its content are deduplicated
+    against. An existing record is only replaced when its video no longer exists, and
+    only if it still names that video, so two concurrent uploads can't overwrite each other.
+    """
+    hashes = mongo_video.db[VIDEO_HASHES_COLLECTION]
+    record = {"_id": content_hash, "video_fid": fid, "mp3_fid": None, "created_at": datetime.datetime.utcnow()}
+    try:
+        hashes.insert_one(record)
+    except DuplicateKeyError:
+        try:
+            existing = hashes.find_one({"_id": content_hash})
+            if existing is not None and not fs.exists(existing["video_fid"]):
+                hashes.replace_one({"_id": content_hash, "video_fid": existing["video_fid"]}, record)
+        except PyMongoError as e:
+            logger.error(f"UPLOAD FUNCTION: Failed to replace stale hash record for FID {fid}: {e}")
+    except PyMongoError as e:
+        # Only deduplication of later uploads is lost.
+        logger.error(f"UPLOAD FUNCTION: Failed to record content hash for FID {fid}: {e}")
+
+
+def _select_tier(size):
+    """
+    Picks the queue for a conversion job from the video's size: uploads of at least
+    VIDEO_BULK_BYTES go to the bulk queue, so one huge file doesn't hold up every
+    small job behind it. The converter drains both, favouring the standard queue.
+    An unknown size (None) goes to the standard queue.
+    """
+    video_queue = current_app.config.get("VIDEO_QUEUE", "video")
+    bulk_bytes = current_app.config.get("VIDEO_BULK_BYTES", 0)
+    if bulk_bytes and size is not None and size >= bulk_bytes:
+        return current_app.config.get("VIDEO_BULK_QUEUE", f"{video_queue}.bulk")
+    return video_queue
 
+
+def shard_queue(base_queue, username):
+    """
+    Maps a user onto one of VIDEO_QUEUE_SHARDS sub-queues of a tier. The converter drains
+    every sub-queue round-robin, so one user's bulk upload only backs up their own shard.
+    """
+    shards = current_app.config.get("VIDEO_QUEUE_SHARDS", 1)
+    if shards <= 1:
+        return base_queue
+    # crc32 rather than hash(): it must be stable across processes and replicas.
+    return f"{base_queue}.{zlib.crc32((username or '').encode('utf-8')) % shards}"
+
+
+def queue_mp3(video_fid, mp3_fid, access):
+    """
+    Publishes an already converted video straight to the MP3 (notification) queue.
+
+    Returns:
+        tuple: A tuple containing (response_message, HTTP_status_code, video_fid_or_None).
+    """
+    message = {
+        "video_fid": str(video_fid),
+        "mp3_fid": str(mp3_fid),
+        "username": access.get("username"),
+        "job_id": tracing.job_id(),
+    }
+    try:
+        published_at = time.time()
+        rabbitmq_publisher.publish(
+            current_app.config.get("MP3_QUEUE", "mp3"),
+            json.dumps(message).encode('utf-8'),
+            pika.BasicProperties(
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+                headers=tracing.amqp_headers(message["job_id"]),
+            ),
+        )
+        tracing.record_span("gateway.publish", message["job_id"], published_at, queue=current_app.config.get("MP3_QUEUE", "mp3"))
+    except (ConnectionError, pika.exceptions.AMQPError) as e:
+        logger.error(f"UPLOAD FUNCTION: RabbitMQ publish of existing MP3 {mp3_fid} failed: {e}", exc_info=True)
+        return "Failed to queue notification (RabbitMQ error)", 503, None
+    # The job is complete from the start: the MP3 already exists.
+    job_service.create_job(message["job_id"], access, video_fid, mp3_fid=mp3_fid)
+    logger.info(f"UPLOAD FUNCTION: Reused MP3 {mp3_fid} for video {video_fid}; notification queued.")
+    return "File already converted; notification queued", 202, str(video_fid)
+
+
+def queue_video(fs, fid, access, size=None, delete_on_failure=True, content_hash=None):
+    """
+    Publishes the conversion job for a stored video, deleting the video if that fails
+    (unless delete_on_failure is False, e.g. when the caller can retry the publish).
+    The caller passes the video's size, which it knows from writing it, to pick the tier.
+
+    Returns:
+        tuple: A tuple containing (response_message, HTTP_status_code, video_fid_or_None).
+    """
     # --- 2. Prepare message for RabbitMQ ---
     message = {
         "video_fid": str(fid),
         "mp3_fid": None,
         "username": access.get("username"),
+        "job_id": tracing.job_id(),
     }
+    if content_hash:
+        message["content_hash"] = content_hash
+
+    video_queue = shard_queue(_select_tier(size), message["username"])
+    message["size"] = size
 
     if not message["username"]:
         logger.warning(f"UPLOAD FUNCTION: Message prepared without username for FID: {fid}. Access info: {access}")
 
-    # --- 3. Publish message to RabbitMQ ---
+    # Recorded before publishing, so the converter's first update always finds the job.
+    job_service.create_job(message["job_id"], access, fid, queue=video_queue, size=size)
+
+    # --- 3. Publish message to RabbitMQ (pooled channel, waits for publisher confirm) ---
     try:
-        video_queue = current_app.config.get("VIDEO_QUEUE", "video")
-        channel.basic_publish(
-            exchange="",
-            routing_key=video_queue,
-            body=json.dumps(message).encode('utf-8'),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
+        published_at = time.time()
+        rabbitmq_publisher.publish(
+            video_queue,
+            json.dumps(message).encode('utf-8'),
+            pika.BasicProperties(
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+                headers=tracing.amqp_headers(message["job_id"]),
             ),
         )
-        logger.info(f"UPLOAD FUNCTION: Message published to RabbitMQ for FID: {fid}")
-        return "File uploaded and queued for processing", 202
-    except (pika.exceptions.AMQPConnectionError, pika.exceptions.ChannelClosedByBroker) as e:
+        tracing.record_span("gateway.publish", message["job_id"], published_at, queue=video_queue, size=size)
+        logger.info(f"UPLOAD FUNCTION: Message published to RabbitMQ queue '{video_queue}' for FID: {fid}")
+        return "File uploaded and queued for processing", 202, str(fid)
+    except (ConnectionError, pika.exceptions.AMQPError) as e:
         logger.error(f"UPLOAD FUNCTION: RabbitMQ publish failed for FID {fid}: {e}", exc_info=True)
-        if fid:
+        if fid and delete_on_failure:
             try:
                 fs.delete(fid)
                 logger.warning(f"UPLOAD FUNCTION: Deleted video {fid} from GridFS due to RabbitMQ publish failure.")
             except PyMongoError as delete_err:
                 logger.error(f"UPLOAD FUNCTION: Failed to delete video {fid} from GridFS after RabbitMQ publish failure: {delete_err}")
-        return "Failed to queue video for processing (RabbitMQ error)", 503
-    except json.JSONEncodeError as e:
+        job_service.mark_failed(message["job_id"], "Failed to queue video for processing")
+        return "Failed to queue video for processing (RabbitMQ error)", 503, None
+    except (TypeError, ValueError) as e:
         logger.error(f"UPLOAD FUNCTION: Failed to encode message to JSON for FID {fid}: {e}", exc_info=True)
-        if fid:
+        if fid and delete_on_failure:
             try:
                 fs.delete(fid)
                 logger.warning(f"UPLOAD FUNCTION: Deleted video {fid} from GridFS due to JSON encoding failure.")
             except PyMongoError as delete_err:
                 logger.error(f"UPLOAD FUNCTION: Failed to delete video {fid} from GridFS after JSON encoding failure: {delete_err}")
-        return "Internal server error: Message serialization failed", 500
+        job_service.mark_failed(message["job_id"], "Message serialization failed")
+        return "Internal server error: Message serialization failed", 500, None
     except Exception as e:
         logger.error(f"UPLOAD FUNCTION: An unexpected error occurred during RabbitMQ publish for FID {fid}: {e}", exc_info=True)
-        if fid:
+        if fid and delete_on_failure:
             try:
                 fs.delete(fid)
                 logger.warning(f"UPLOAD FUNCTION: Deleted video {fid} from GridFS due to unexpected publish error.")
             except PyMongoError as delete_err:
                 logger.error(f"UPLOAD FUNCTION: Failed to delete video {fid} from GridFS after unexpected publish error: {delete_err}")
-        return "Internal server error during message queuing", 500
\ No newline at end of file
+        job_service.mark_failed(message["job_id"], "Unexpected error while queuing")
+        return "Internal server error during message queuing", 500, None
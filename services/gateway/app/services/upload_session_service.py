@@ -0,0 +1,354 @@
+# app/services/upload_session_service.py
+
+import datetime
+import hashlib
+import logging
+import time
+from bson.binary import Binary
+from bson.objectid import ObjectId, InvalidId
+from flask import current_app
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+from app import metrics, tracing
+from app.extensions import mongo_video
+from app.services import storage_service
+
+logger = logging.getLogger(__name__)
+
+# Resumable upload protocol:
+#   1. create_session  -> pre-allocates the GridFS file id and fixes the chunk size
+#   2. write_chunk     -> one GridFS chunk per PUT, at any offset, in any order, retryable
+#   3. finalize        -> checks every chunk is present, writes the fs.files document,
+#                         hashes the assembled file for deduplication and only then
+#                         publishes the job to the video queue
+# Chunks are written straight into the GridFS chunks collection and the session lives
+# in Mongo, so any gateway replica can serve any step. A finalize claim records when it
+# was taken; if its worker dies mid-finalize, the claim can be taken over (by finalize or
+# abort) once it is older than RESUMABLE_FINALIZE_TIMEOUT.
+
+SESSIONS_COLLECTION = "upload_sessions"
+STATE_OPEN = "open"
+STATE_FINALIZING = "finalizing"
+STATE_COMPLETE = "complete"
+
+_indexes_ready = False
+
+
+def _sessions():
+    global _indexes_ready
+    collection = mongo_video.db[SESSIONS_COLLECTION]
+    if not _indexes_ready:
+        collection.create_index([("username", ASCENDING), ("state", ASCENDING)])
+        collection.create_index([("expires_at", ASCENDING)])
+        # GridFS normally creates this on first write; parallel chunk upserts rely on it.
+        _chunks().create_index([("files_id", ASCENDING), ("n", ASCENDING)], unique=True)
+        _indexes_ready = True
+    return collection
+
+
+def _chunks():
+    # Same collection (and unique files_id/n index) GridFS itself writes to.
+    return mongo_video.db["fs.chunks"]
+
+
+def _expected_chunks(session):
+    return (session["size"] + session["chunk_size"] - 1) // session["chunk_size"]
+
+
+def _public_view(session):
+    received = sorted(session.get("received", []))
+    missing = sorted(set(range(_expected_chunks(session))) - set(received))
+    return {
+        "session_id": str(session["_id"]),
+        "video_fid": str(session["file_id"]),
+        "filename": session.get("filename"),
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "state": session["state"],
+        "received_chunks": received,
+        "missing_chunks": missing,
+        "expires_at": session["expires_at"].isoformat(),
+    }
+
+
+def _load_session(session_id, access):
+    """Returns (session, None) or (None, (message, status_code))."""
+    try:
+        oid = ObjectId(session_id)
+    except (InvalidId, TypeError):
+        return None, ("Invalid upload session ID format", 400)
+    try:
+        session = _sessions().find_one({"_id": oid})
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to load session {session_id}: {e}", exc_info=True)
+        return None, ("Internal server error: Failed to load upload session", 500)
+    if session is None or session.get("username") != access.get("username"):
+        return None, ("Upload session not found", 404)
+    if session["expires_at"] < datetime.datetime.utcnow() and session["state"] != STATE_COMPLETE:
+        return None, ("Upload session has expired", 410)
+    return session, None
+
+
+def _claimable(session_id):
+    """
+    Query for a session that can be claimed: open, or stuck in finalizing behind a claim
+    older than RESUMABLE_FINALIZE_TIMEOUT (claims without a timestamp count as stale).
+    """
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=current_app.config.get("RESUMABLE_FINALIZE_TIMEOUT", 300)
+    )
+    return {
+        "_id": session_id,
+        "$or": [
+            {"state": STATE_OPEN},
+            {"state": STATE_FINALIZING, "finalizing_since": {"$not": {"$gte": stale_before}}},
+        ],
+    }
+
+
+def _content_hash(session):
+    """sha256 of the assembled upload, read back chunk by chunk in order."""
+    content_hash = hashlib.sha256()
+    # Two chunks per batch keeps at most ~2 x RESUMABLE_CHUNK_SIZE in memory.
+    for chunk in _chunks().find({"files_id": session["file_id"]}, {"data": 1}).sort("n", ASCENDING).batch_size(2):
+        content_hash.update(chunk["data"])
+    return content_hash.hexdigest()
+
+
+def _release_claim(session):
+    """Reopens a claimed session; if even that fails, the claim simply goes stale."""
+    try:
+        _sessions().update_one({"_id": session["_id"]}, {"$set": {"state": STATE_OPEN}, "$unset": {"finalizing_since": ""}})
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to reopen session {session['_id']}: {e}", exc_info=True)
+
+
+def purge_expired_sessions(limit=100):
+    """
+    Removes expired, unfinished sessions together with the chunks they had written.
+    Called opportunistically when new sessions are created.
+    """
+    now = datetime.datetime.utcnow()
+    expired = _sessions().find(
+        {"expires_at": {"$lt": now}, "state": {"$ne": STATE_COMPLETE}},
+        {"file_id": 1},
+    ).limit(limit)
+    for session in expired:
+        _chunks().delete_many({"files_id": session["file_id"]})
+        _sessions().delete_one({"_id": session["_id"]})
+        logger.info(f"UPLOAD_SESSION: Purged expired session {session['_id']}.")
+
+
+def create_session(access, filename, size):
+    """
+    Opens a resumable upload session.
+
+    Returns:
+        tuple: (session_view_dict, 201) or (error_message, HTTP_status_code).
+    """
+    if not isinstance(size, int) or size <= 0:
+        return "'size' must be a positive integer number of bytes", 400
+    max_bytes = current_app.config.get("UPLOAD_MAX_BYTES", 0)
+    if max_bytes and size > max_bytes:
+        return f"File exceeds the maximum upload size of {max_bytes} bytes", 413
+
+    now = datetime.datetime.utcnow()
+    session = {
+        "_id": ObjectId(),
+        "file_id": ObjectId(),
+        "username": access.get("username"),
+        "filename": filename,
+        "size": size,
+        "chunk_size": current_app.config.get("RESUMABLE_CHUNK_SIZE", 8 * 1024 * 1024),
+        "state": STATE_OPEN,
+        "received": [],
+        "created_at": now,
+        "expires_at": now + datetime.timedelta(seconds=current_app.config.get("RESUMABLE_SESSION_TTL", 86400)),
+    }
+    try:
+        purge_expired_sessions()
+        _sessions().insert_one(session)
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to create session: {e}", exc_info=True)
+        return "Internal server error: Failed to create upload session", 500
+
+    logger.info(f"UPLOAD_SESSION: Created session {session['_id']} for '{filename}' ({size} bytes) by user '{session['username']}'.")
+    return _public_view(session), 201
+
+
+def get_session(session_id, access):
+    """
+    Returns:
+        tuple: (session_view_dict, 200) or (error_message, HTTP_status_code).
+    """
+    session, error = _load_session(session_id, access)
+    if error:
+        return error
+    return _public_view(session), 200
+
+
+def write_chunk(session_id, access, offset, stream, content_length):
+    """
+    Stores one chunk of a session. Offsets must be aligned to the session chunk size
+    and every chunk but the last must be exactly chunk_size bytes. Re-sending a chunk
+    simply overwrites it, so clients can retry freely and upload chunks in parallel.
+
+    Returns:
+        tuple: (session_progress_dict, 200) or (error_message, HTTP_status_code).
+    """
+    session, error = _load_session(session_id, access)
+    if error:
+        return error
+    if session["state"] != STATE_OPEN:
+        return f"Upload session is {session['state']}", 409
+
+    chunk_size = session["chunk_size"]
+    if offset < 0 or offset >= session["size"] or offset % chunk_size:
+        return f"'offset' must be a multiple of {chunk_size} below {session['size']}", 400
+    expected_length = min(chunk_size, session["size"] - offset)
+    if content_length is not None and content_length != expected_length:
+        return f"Chunk at offset {offset} must be exactly {expected_length} bytes", 400
+
+    data = stream.read(expected_length + 1)
+    if len(data) != expected_length:
+        return f"Chunk at offset {offset} must be exactly {expected_length} bytes", 400
+
+    n = offset // chunk_size
+    try:
+        started = time.perf_counter()
+        _chunks().update_one(
+            {"files_id": session["file_id"], "n": n},
+            {"$set": {"data": Binary(data)}},
+            upsert=True,
+        )
+        metrics.GRIDFS_PUT.observe(time.perf_counter() - started)
+        session = _sessions().find_one_and_update(
+            {"_id": session["_id"]},
+            {"$addToSet": {"received": n}},
+            return_document=ReturnDocument.AFTER,
+        )
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to store chunk {n} of session {session_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to store chunk", 500
+
+    logger.info(f"UPLOAD_SESSION: Stored chunk {n} ({len(data)} bytes) for session {session_id}.")
+    view = _public_view(session)
+    return {"received_chunks": len(view["received_chunks"]), "missing_chunks": view["missing_chunks"]}, 200
+
+
+def finalize(session_id, access):
+    """
+    Completes a session: turns the stored chunks into a GridFS file and queues it for conversion.
+
+    Returns:
+        tuple: (result_dict, 202) or (error_message, HTTP_status_code).
+    """
+    session, error = _load_session(session_id, access)
+    if error:
+        return error
+    if session["state"] == STATE_COMPLETE:
+        video_fid = session.get("video_fid") or str(session["file_id"])
+        return {"message": "File uploaded and queued successfully!", "video_fid": video_fid, "job_id": session.get("job_id")}, 202
+
+    # Claim the session atomically so concurrent finalize calls publish only once.
+    try:
+        session = _sessions().find_one_and_update(
+            _claimable(session["_id"]),
+            {"$set": {"state": STATE_FINALIZING, "finalizing_since": datetime.datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to claim session {session_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to finalize upload", 500
+    if session is None:
+        return "Upload session is already being finalized", 409
+
+    expected = _expected_chunks(session)
+    try:
+        stored = _chunks().count_documents({"files_id": session["file_id"]})
+    except PyMongoError as e:
+        _release_claim(session)
+        logger.error(f"UPLOAD_SESSION: Failed to count chunks of session {session_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to finalize upload", 500
+    if stored != expected:
+        _release_claim(session)
+        return {"error": "Upload is incomplete", "missing_chunks": _public_view(session)["missing_chunks"]}, 409
+
+    fs = storage_service.get_video_fs()
+    if fs is None:
+        _release_claim(session)
+        return "Internal server error: Storage not initialized", 500
+
+    try:
+        mongo_video.db["fs.files"].replace_one(
+            {"_id": session["file_id"]},
+            {
+                "_id": session["file_id"],
+                "length": session["size"],
+                "chunkSize": session["chunk_size"],
+                "uploadDate": datetime.datetime.utcnow(),
+                "filename": session.get("filename"),
+            },
+            upsert=True,
+        )
+        # Reading the file back costs one pass over it, but resumable uploads are the large
+        # ones, where a duplicate saves the most. Chunks arrive in any order and can be
+        # rewritten, so the hash can't be kept as they come in.
+        content_hash = _content_hash(session) if current_app.config.get("DEDUP_ENABLED", True) else None
+    except PyMongoError as e:
+        _release_claim(session)
+        logger.error(f"UPLOAD_SESSION: Failed to write file document for session {session_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to store video", 500
+
+    # Keep the chunks on publish failure so the client can simply retry finalize. A duplicate
+    # of an earlier upload is deleted once the earlier video is queued instead.
+    response_message, status_code, video_fid = storage_service.queue_upload(
+        fs, session["file_id"], access, session["size"], content_hash, delete_on_failure=False
+    )
+    if status_code != 202:
+        try:
+            mongo_video.db["fs.files"].delete_one({"_id": session["file_id"]})
+        except PyMongoError as e:
+            logger.error(f"UPLOAD_SESSION: Failed to remove file document of session {session_id}: {e}", exc_info=True)
+        _release_claim(session)
+        return response_message, status_code
+
+    job_id = tracing.job_id()
+    try:
+        _sessions().update_one(
+            {"_id": session["_id"]},
+            {"$set": {"state": STATE_COMPLETE, "job_id": job_id, "video_fid": video_fid}, "$unset": {"finalizing_since": ""}},
+        )
+    except PyMongoError as e:
+        # The job is already queued, so report success. The claim goes stale, so a retried
+        # finalize could queue the video a second time: a duplicate conversion, nothing lost.
+        logger.error(f"UPLOAD_SESSION: Failed to mark session {session_id} complete: {e}", exc_info=True)
+    logger.info(f"UPLOAD_SESSION: Session {session_id} finalized as video {video_fid}.")
+    return {"message": "File uploaded and queued successfully!", "video_fid": video_fid, "job_id": job_id}, 202
+
+
+def abort(session_id, access):
+    """
+    Cancels an unfinished session and deletes its chunks.
+
+    Returns:
+        tuple: (result_dict, 200) or (error_message, HTTP_status_code).
+    """
+    session, error = _load_session(session_id, access)
+    if error:
+        return error
+    if session["state"] == STATE_COMPLETE:
+        return f"Upload session is {STATE_COMPLETE}", 409
+    # Same claim rule as finalize, so an abort can't race a finalize that is still running.
+    try:
+        deleted = _sessions().delete_one(_claimable(session["_id"])).deleted_count
+        if deleted:
+            _chunks().delete_many({"files_id": session["file_id"]})
+    except PyMongoError as e:
+        logger.error(f"UPLOAD_SESSION: Failed to abort session {session_id}: {e}", exc_info=True)
+        return "Internal server error: Failed to abort upload session", 500
+    if not deleted:
+        return "Upload session is being finalized", 409
+
+    logger.info(f"UPLOAD_SESSION: Session {session_id} aborted.")
+    return {"message": "Upload session aborted"}, 200
@@ -0,0 +1,84 @@
+# app/tracing.py
+
+import os
+import json
+import time
+import uuid
+import threading
+from flask import g, request, has_request_context
+
+# Job spans are printed as one JSON object per line prefixed with "TRACE " (for the log
+# shipper), or appended to TRACE_FILE when set. TRACING_ENABLED=False turns them off.
+# The converter and notifier write the same lines, so one parser handles all three.
+# The job id travels in the message body ("job_id") and these AMQP headers, so the
+# converter and notifier can attach their spans and measure time spent in each queue.
+JOB_ID_HEADER = "x-job-id"
+PUBLISHED_AT_HEADER = "x-published-at"
+
+_file_lock = threading.Lock()
+
+
+def _enabled():
+    return os.getenv("TRACING_ENABLED", "True").lower() == "true"
+
+
+def start_job(started_at=None):
+    """Assigns a new job id to the current request and starts its clock (at started_at if given)."""
+    g.job_id = uuid.uuid4().hex
+    g.job_started = time.time() if started_at is None else started_at
+    return g.job_id
+
+
+def job_id():
+    """The current request's job id, assigned on first use (e.g. resumable finalize)."""
+    if not has_request_context():
+        return uuid.uuid4().hex
+    if "job_id" not in g:
+        start_job()
+    return g.job_id
+
+
+def amqp_headers(trace_id):
+    """Headers to publish with a job message: its id and the publish time for queue-wait spans."""
+    return {JOB_ID_HEADER: trace_id, PUBLISHED_AT_HEADER: time.time()}
+
+
+def record_span(name, trace_id, start, end=None, **attributes):
+    """Emits one span (epoch-second start/end) for a job."""
+    if not _enabled() or not trace_id:
+        return
+    end = time.time() if end is None else end
+    span = {
+        "trace_id": trace_id,
+        "span": name,
+        "service": "gateway",
+        "start": round(start, 6),
+        "duration_ms": round((end - start) * 1000, 3),
+    }
+    span.update(attributes)
+    line = json.dumps(span, default=str)
+
+    trace_file = os.getenv("TRACE_FILE")
+    if trace_file:
+        with _file_lock, open(trace_file, "a") as f:
+            f.write(line + "\n")
+    else:
+        # Not through logging: its format would put a timestamp and level before "TRACE".
+        print(f"TRACE {line}", flush=True)
+
+
+def _finish_request(response):
+    # Every request that started (or published) a job gets one span covering the whole request.
+    if "job_started" in g:
+        record_span(
+            "gateway.request",
+            g.job_id,
+            g.job_started,
+            route=request.url_rule.rule if request.url_rule else request.path,
+            status=response.status_code,
+        )
+    return response
+
+
+def init_tracing(app):
+    app.after_request(_finish_request)
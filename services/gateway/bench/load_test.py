@@ -0,0 +1,135 @@
+"""
+HTTP load test: requests/s and latency against the gateway under gunicorn, by worker count.
+
+For each --workers value, starts `gunicorn -c gunicorn.conf.py main:server` on a local
+port with that many workers (GUNICORN_THREADS from --threads, preload as configured),
+waits for it to answer, then keeps --clients keep-alive connections busy for --seconds
+and reports throughput with p50/p99 latency. With --url, the running server at that
+URL is measured instead (e.g. the ingress of a full deployment).
+
+The default path, /healthz, needs no MongoDB, RabbitMQ or auth service, so it measures
+the server and Flask overhead only; point --path at /jobs/ or /download/?fid=... with
+--token on a full stack to include the backends. The clients share this process's GIL,
+so on a small machine the client side can become the bottleneck; compare runs on the
+same machine only.
+
+Run from services/gateway:
+
+    python -m bench.load_test --workers 1,2,4 --clients 16 --seconds 10
+"""
+
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+
+def _get(connection, path, headers):
+    connection.request("GET", path, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_until_up(host, port, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            _get(connection, path, {})
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Gateway did not come up on {host}:{port}")
+
+
+def run(host, port, path, headers, clients, seconds):
+    """Keeps `clients` connections busy for `seconds`; returns (requests, errors, latencies)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        local, failed = [], 0
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status = _get(connection, path, headers)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                failed += 1
+                continue
+            local.append(time.perf_counter() - started)
+            if status >= 500:
+                failed += 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(latencies), errors[0], latencies
+
+
+def report(label, requests, errors, latencies, seconds):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    p50 = statistics.median(latencies) if latencies else 0
+    print(
+        f"{label:<12} {requests / seconds:>9.1f} req/s  p50={p50 * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms"
+        f"  errors={errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated gunicorn worker counts to start")
+    parser.add_argument("--threads", type=int, default=8, help="GUNICORN_THREADS for started servers")
+    parser.add_argument("--url", help="measure this running server instead of starting gunicorn")
+    parser.add_argument("--path", default="/healthz")
+    parser.add_argument("--token", help="sent as 'Authorization: Bearer <token>'")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent keep-alive connections")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=18080, help="port for started servers")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    print(f"GET {args.path} from {args.clients} clients for {args.seconds:.0f}s, {os.cpu_count()} CPUs")
+
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        requests, errors, latencies = run(url.hostname, url.port or 80, args.path, headers, args.clients, args.seconds)
+        report(url.netloc, requests, errors, latencies, args.seconds)
+        return
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        env = dict(os.environ, PORT=str(args.port), METRICS_PORT="0", GUNICORN_WORKERS=str(workers),
+                   GUNICORN_THREADS=str(args.threads), GUNICORN_ACCESS_LOG="", LOG_LEVEL="WARNING")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:server"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up("127.0.0.1", args.port, args.path)
+            requests, errors, latencies = run("127.0.0.1", args.port, args.path, headers, args.clients, args.seconds)
+            report(f"workers={workers}", requests, errors, latencies, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
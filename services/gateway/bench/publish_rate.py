@@ -0,0 +1,122 @@
+"""
+Publish-rate benchmark: pooled confirm-mode channels vs a connection per publish.
+
+"per-request" reproduces the gateway before the pool: every publish opens a
+BlockingConnection, declares the queues, publishes and closes. "pooled" goes
+through RabbitMQPublisherPool, i.e. one confirmed publish on a long-lived channel.
+
+Needs a reachable RabbitMQ; run from services/gateway:
+
+    RABBITMQ_HOST=localhost python -m bench.publish_rate --messages 2000 --threads 1,4,8
+
+Messages go to a throwaway "bench.publish" queue that is deleted afterwards.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+import pika
+from flask import Flask
+
+from app.extensions import RabbitMQPublisherPool
+
+BENCH_QUEUE = "bench.publish"
+BODY = json.dumps({"video_fid": "0" * 24, "mp3_fid": None, "username": "bench@example.com"})
+PROPERTIES = pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE)
+
+
+def publish_per_request(parameters):
+    connection = pika.BlockingConnection(parameters)
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=BENCH_QUEUE, durable=True)
+        channel.queue_declare(queue=f"{BENCH_QUEUE}.mp3", durable=True)
+        channel.basic_publish(exchange="", routing_key=BENCH_QUEUE, body=BODY, properties=PROPERTIES)
+    finally:
+        connection.close()
+
+
+def make_pool(host, port, size):
+    app = Flask("publish-bench")
+    app.config.update(RABBITMQ_HOST=host, RABBITMQ_PORT=port, RABBITMQ_POOL_SIZE=size, RABBITMQ_POOL_TIMEOUT=30.0)
+    pool = RabbitMQPublisherPool()
+    pool.init_app(app)
+    pool.queues = (BENCH_QUEUE,)
+    return pool
+
+
+def run(publish, messages, threads):
+    """Publishes `messages` messages from `threads` threads; returns (elapsed seconds, latencies)."""
+    latencies = []
+    lock = threading.Lock()
+    remaining = [messages]
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            publish()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(mode, threads, messages, elapsed, latencies):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{mode:<12} threads={threads:<3} {messages / elapsed:>9.1f} msg/s"
+        f"  p50={statistics.median(latencies) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=None, help="RabbitMQ host (default: $RABBITMQ_HOST or localhost)")
+    parser.add_argument("--port", type=int, default=5672)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--threads", default="1,4,8", help="comma-separated publisher thread counts")
+    args = parser.parse_args()
+
+    host = args.host or os.getenv("RABBITMQ_HOST", "localhost")
+    parameters = pika.ConnectionParameters(host=host, port=args.port)
+    try:
+        pika.BlockingConnection(parameters).close()
+    except pika.exceptions.AMQPConnectionError as e:
+        raise SystemExit(f"RabbitMQ is not reachable at {host}:{args.port}: {e!r}")
+
+    for threads in [int(t) for t in args.threads.split(",")]:
+        elapsed, latencies = run(lambda: publish_per_request(parameters), args.messages, threads)
+        report("per-request", threads, args.messages, elapsed, latencies)
+
+        pool = make_pool(host, args.port, size=threads)
+        pool.publish(BENCH_QUEUE, BODY, PROPERTIES)  # warm-up: connect and declare once
+        elapsed, latencies = run(lambda: pool.publish(BENCH_QUEUE, BODY, PROPERTIES), args.messages, threads)
+        report("pooled", threads, args.messages, elapsed, latencies)
+        pool.close()
+
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.queue_delete(queue=BENCH_QUEUE)
+    channel.queue_delete(queue=f"{BENCH_QUEUE}.mp3")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
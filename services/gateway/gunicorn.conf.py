@@ -0,0 +1,102 @@
+# gunicorn.conf.py
+#
+# Production server for the gateway:  gunicorn -c gunicorn.conf.py main:server
+# Every setting can be overridden through the environment (or .env); `python main.py`
+# still starts the Flask development server for local work.
+
+import os
+import shutil
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- 1. Workers ---
+# Uploads and downloads mostly wait on the client socket, GridFS and RabbitMQ, so each
+# process serves several requests on threads ("gthread"). Set GUNICORN_WORKER_CLASS=gevent
+# (with gevent installed) for many more concurrent slow clients per process.
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000")) # gevent only
+# Sizing: every request in flight holds a thread (gthread), including GET /jobs/<id>?wait=
+# long polls, which hold one for up to JOBS_MAX_WAIT seconds while doing nothing. A pod
+# serves workers x threads requests at once (2 x 8 = 16), and JOBS_MAX_WAITERS of each
+# worker's threads may be long polls (4 of 8 by default), so uploads and downloads keep
+# the rest. Raise threads and JOBS_MAX_WAITERS together; with gevent, waiting is cheap
+# and JOBS_MAX_WAITERS can go up to a large fraction of worker_connections.
+# Recycle workers after this many requests (0 = never), with jitter so they don't all restart at once.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# --- 2. Preloading ---
+# The app is imported once in the master and forked, so workers start fast and share its
+# memory. Creating the app also creates the flask_pymongo MongoClients, and a MongoClient
+# must not be used across a fork, so post_fork gives each worker new ones before it serves
+# anything. The rest needs no help: no connection is opened while the app is created, the
+# RabbitMQ pool resets itself in a new process and the queue-depth thread starts lazily in
+# each worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "True").lower() == "true"
+
+# --- 3. Timeouts ---
+# `timeout` restarts a worker that stops heartbeating; with threaded workers a long upload
+# on one thread doesn't block the heartbeat, so it never cuts off a slow transfer.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Idle keep-alive; keep it above the ingress/load balancer's idle timeout (60s on most),
+# so the proxy, not gunicorn, closes idle connections and never reuses a closed one.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+# --- 4. Graceful shutdown ---
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+# (uploads, downloads, job long polls) before being killed. Keep the pod's
+# terminationGracePeriodSeconds above it.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+
+# --- 5. Logging ---
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "INFO").lower()
+
+# --- 6. Prometheus multiprocess mode ---
+# Each worker keeps its own metrics, so they write them to a shared directory that the
+# master merges and serves on METRICS_PORT, away from the public port. It must be set
+# before the app (and prometheus_client) is imported and start empty, hence a fresh
+# directory per server unless one is configured.
+_metrics_port = int(os.getenv("METRICS_PORT", "9101"))
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="gateway-metrics-")
+    _owns_metrics_dir = True
+else:
+    _owns_metrics_dir = False
+
+
+def when_ready(server):
+    if _metrics_port:
+        from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(_metrics_port, registry=registry)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.extensions import reset_mongo_clients
+        reset_mongo_clients(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    # Close pooled RabbitMQ connections cleanly instead of leaving them to time out on the broker.
+    from app.extensions import rabbitmq_publisher
+    rabbitmq_publisher.close()
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if _owns_metrics_dir:
+        shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
@@ -1,11 +1,15 @@
 import os
-from app import create_app
+from app import create_app, metrics
 from dotenv import load_dotenv
 
 load_dotenv()  # Load env vars from .env
 
 server = create_app()
 
+# Flask development server for local runs; the container runs gunicorn (gunicorn.conf.py).
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
+    # Only in the process that serves requests (with DEBUG, the reloader's child).
+    if server.config["METRICS_PORT"] and (not server.debug or os.environ.get("WERKZEUG_RUN_MAIN")):
+        metrics.start_metrics_server(server.config["METRICS_PORT"])
     server.run(host="0.0.0.0", port=port)
@@ -0,0 +1,10 @@
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def flask_app():
+    """A bare Flask app, for code that needs an app context (jsonify, current_app)."""
+    app = Flask("gateway-tests")
+    with app.app_context():
+        yield app
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+from app.services import auth_service
+
+RSA_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+ED_KEY = ed25519.Ed25519PrivateKey.generate()
+RSA_PUBLIC_PEM = RSA_KEY.public_key().public_bytes(
+    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+).decode()
+PAYLOAD = {"username": "alice@example.com", "admin": False, "exp": int(time.time()) + 3600}
+
+
+class _JWKSHandler(BaseHTTPRequestHandler):
+    jwks = {}
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        body = json.dumps(self.jwks).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def jwks_url():
+    rsa_jwk = RSAAlgorithm.to_jwk(RSA_KEY.public_key(), as_dict=True)
+    rsa_jwk.update({"kid": "rsa-1", "alg": "RS256", "use": "sig"})
+    ed_jwk = OKPAlgorithm.to_jwk(ED_KEY.public_key(), as_dict=True)
+    ed_jwk.update({"kid": "ed-1", "alg": "EdDSA", "use": "sig"})
+    _JWKSHandler.jwks = {"keys": [rsa_jwk, ed_jwk]}
+    _JWKSHandler.hits = 0
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    auth_service._jwks_client = None
+    auth_service._jwks_refreshed_at = 0.0
+    yield f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def allowed_algorithms(monkeypatch):
+    # What .env.example ships.
+    monkeypatch.setenv("JWT_ALGORITHMS", "HS256,RS256,EdDSA")
+
+
+def _status(result):
+    payload, error = result
+    return 200 if error is None else error[1]
+
+
+def test_jwks_accepts_rs256_and_eddsa_tokens(flask_app, jwks_url):
+    rs = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256", headers={"kid": "rsa-1"})
+    ed = jwt.encode(PAYLOAD, ED_KEY, algorithm="EdDSA", headers={"kid": "ed-1"})
+    assert auth_service._verify_locally(rs, jwks_url)[0]["username"] == PAYLOAD["username"]
+    assert auth_service._verify_locally(ed, jwks_url)[0]["username"] == PAYLOAD["username"]
+
+
+def test_jwks_rejects_hs256_token_claiming_a_known_kid(flask_app, jwks_url):
+    token = jwt.encode(PAYLOAD, "guessed-secret", algorithm="HS256", headers={"kid": "rsa-1"})
+    assert _status(auth_service._verify_locally(token, jwks_url)) == 401
+
+
+def test_jwks_rejects_key_confusion_between_rsa_and_ed25519(flask_app, jwks_url):
+    token = jwt.encode(PAYLOAD, ED_KEY, algorithm="EdDSA", headers={"kid": "rsa-1"})
+    assert _status(auth_service._verify_locally(token, jwks_url)) == 401
+
+
+def test_unknown_kid_is_401_and_refetches_at_most_once_per_interval(flask_app, jwks_url, monkeypatch):
+    monkeypatch.setenv("JWKS_MIN_REFRESH_INTERVAL", "60")
+    valid = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256", headers={"kid": "rsa-1"})
+    forged = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256", headers={"kid": "nope"})
+    assert _status(auth_service._verify_locally(valid, jwks_url)) == 200
+    hits = _JWKSHandler.hits
+
+    for _ in range(20):
+        assert _status(auth_service._verify_locally(forged, jwks_url)) == 401
+    assert _JWKSHandler.hits == hits + 1
+
+
+def test_unreachable_jwks_is_503(flask_app):
+    auth_service._jwks_client = None
+    token = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256", headers={"kid": "rsa-1"})
+    assert _status(auth_service._verify_locally(token, "http://127.0.0.1:9/jwks.json")) == 503
+
+
+def test_public_key_pins_the_algorithm(flask_app):
+    rs = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256")
+    assert _status(auth_service._verify_locally(rs, RSA_PUBLIC_PEM)) == 200
+
+    hs = jwt.encode(PAYLOAD, "guessed-secret", algorithm="HS256")
+    assert _status(auth_service._verify_locally(hs, RSA_PUBLIC_PEM)) == 401
+    ed = jwt.encode(PAYLOAD, ED_KEY, algorithm="EdDSA")
+    assert _status(auth_service._verify_locally(ed, RSA_PUBLIC_PEM)) == 401
+
+
+def test_shared_secret_only_accepts_hs256(flask_app):
+    hs = jwt.encode(PAYLOAD, "s3cret", algorithm="HS256")
+    assert _status(auth_service._verify_locally(hs, "s3cret")) == 200
+    rs = jwt.encode(PAYLOAD, RSA_KEY, algorithm="RS256")
+    assert _status(auth_service._verify_locally(rs, "s3cret")) == 401
+
+
+def test_malformed_and_expired_tokens_are_401(flask_app):
+    assert _status(auth_service._verify_locally("not-a-jwt", "s3cret")) == 401
+    expired = jwt.encode({**PAYLOAD, "exp": int(time.time()) - 10}, "s3cret", algorithm="HS256")
+    assert _status(auth_service._verify_locally(expired, "s3cret")) == 401
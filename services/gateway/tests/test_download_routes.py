@@ -0,0 +1,159 @@
+import datetime
+import os
+import resource
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+from flask import Flask
+from prometheus_client import REGISTRY
+from werkzeug.http import http_date
+
+from app.routes import download_routes
+
+UPLOAD_DATE = datetime.datetime(2025, 6, 1, 12, 0, 0)  # naive UTC, as pymongo returns it
+CHUNK_SIZE = 255 * 1024
+
+
+class FakeGridOut:
+    """A GridOut of `length` generated bytes: nothing is held in memory but the chunk being read."""
+
+    def __init__(self, length, md5="d41d8cd98f00b204e9800998ecf8427e"):
+        self._id = ObjectId()
+        self.length = length
+        self.chunk_size = CHUNK_SIZE
+        self.upload_date = UPLOAD_DATE
+        self.md5 = md5
+        self.filename = "song.mp3"
+        self.position = 0
+        self.closed = False
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size):
+        size = max(0, min(size, self.length - self.position))
+        self.position += size
+        return b"\xff" * size  # touched pages, so buffering would show up in RSS
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def grid_file():
+    return FakeGridOut(10 * CHUNK_SIZE + 123)
+
+
+@pytest.fixture
+def client(monkeypatch, grid_file):
+    app = Flask("download-tests")
+    app.extensions["pymongo"] = {"mongo_mp3": SimpleNamespace(db=object())}
+    app.register_blueprint(download_routes.download_bp)
+    files = {"current": grid_file}
+    monkeypatch.setattr(
+        download_routes.auth_service, "validate_token_and_get_payload",
+        lambda request: ({"username": "alice@example.com", "admin": True}, None),
+    )
+    monkeypatch.setattr(download_routes.gridfs, "GridFS", lambda db: SimpleNamespace(get=lambda fid: files["current"]))
+    client = app.test_client()
+    client.files = files
+    return client
+
+
+def _url(grid_file):
+    return f"/download/?fid={grid_file._id}"
+
+
+def test_full_download_is_inline_with_validators(client, grid_file):
+    response = client.get(_url(grid_file))
+    assert response.status_code == 200
+    assert len(response.data) == grid_file.length
+    assert response.headers["Content-Disposition"] == "inline; filename=song.mp3"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.get_etag() == (grid_file.md5, False)
+    assert grid_file.closed
+
+
+def test_single_range_is_206(client, grid_file):
+    response = client.get(_url(grid_file), headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert len(response.data) == 100
+    assert response.headers["Content-Range"] == f"bytes 100-199/{grid_file.length}"
+
+
+def test_unsatisfiable_range_is_416(client, grid_file):
+    response = client.get(_url(grid_file), headers={"Range": f"bytes={grid_file.length + 10}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{grid_file.length}"
+
+
+def test_multi_range_falls_back_to_the_whole_file(client, grid_file):
+    response = client.get(_url(grid_file), headers={"Range": "bytes=0-9,100-199"})
+    assert response.status_code == 200
+    assert len(response.data) == grid_file.length
+
+
+def test_if_none_match_uses_weak_comparison(client, grid_file):
+    assert client.get(_url(grid_file), headers={"If-None-Match": f'"{grid_file.md5}"'}).status_code == 304
+    assert client.get(_url(grid_file), headers={"If-None-Match": f'W/"{grid_file.md5}"'}).status_code == 304
+    assert client.get(_url(grid_file), headers={"If-None-Match": '"something-else"'}).status_code == 200
+
+
+@pytest.mark.parametrize("if_range, expected", [
+    (lambda f: f'"{f.md5}"', 206),
+    (lambda f: '"stale-etag"', 200),
+    (lambda f: http_date(UPLOAD_DATE.replace(tzinfo=datetime.timezone.utc)), 206),
+    (lambda f: http_date(UPLOAD_DATE.replace(tzinfo=datetime.timezone.utc) - datetime.timedelta(days=1)), 200),
+])
+def test_if_range(client, grid_file, if_range, expected):
+    response = client.get(_url(grid_file), headers={"Range": "bytes=0-99", "If-Range": if_range(grid_file)})
+    assert response.status_code == expected
+
+
+def _current_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def _peak_rss_growth(client, length):
+    """Streams a `length`-byte download and returns how far RSS rose above its starting point."""
+    grid_file = FakeGridOut(length)
+    client.files["current"] = grid_file
+    response = client.get(_url(grid_file), buffered=False)
+    baseline = peak = _current_rss()
+    received = 0
+    for i, chunk in enumerate(response.response):
+        received += len(chunk)
+        if i % 16 == 0:
+            peak = max(peak, _current_rss())
+    response.close()
+    assert received == length
+    return peak - baseline
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to sample RSS")
+def test_peak_rss_stays_flat_with_file_size(client):
+    small = _peak_rss_growth(client, 16 * 1024 * 1024)
+    large = _peak_rss_growth(client, 512 * 1024 * 1024)
+    # Buffering the file (the old BytesIO(out.read())) would grow RSS by the whole 512 MiB.
+    assert large < 16 * 1024 * 1024
+    assert large - small < 8 * 1024 * 1024
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"Range": "bytes=100-199"},
+    {"Range": f"bytes={20 * CHUNK_SIZE}-"},  # 416
+    {"If-None-Match": '"d41d8cd98f00b204e9800998ecf8427e"'},  # 304
+])
+def test_gridfs_get_is_observed_once_per_download(client, grid_file, headers):
+    def observations():
+        return REGISTRY.get_sample_value("gateway_gridfs_duration_seconds_count", {"operation": "get"}) or 0
+
+    before = observations()
+    response = client.get(_url(grid_file), headers=headers)
+    response.get_data()
+    response.close()
+
+    assert observations() - before == 1
@@ -0,0 +1,81 @@
+import threading
+
+from flask import Flask
+
+from app import extensions
+
+
+def _app():
+    app = Flask("extensions-tests")
+    app.config.update(
+        MONGO_URI_VIDEO="mongodb://localhost:1/videos",
+        MONGO_URI_MP3="mongodb://localhost:1/mp3s",
+    )
+    return app
+
+
+def _pymongo_threads():
+    return [t.name for t in threading.enumerate() if "pymongo" in t.name.lower()]
+
+
+def test_reset_gives_the_process_new_clients_without_connecting():
+    app = _app()
+    extensions.mongo_video.init_app(app, uri=app.config["MONGO_URI_VIDEO"], connect=False)
+    extensions.mongo_mp3.init_app(app, uri=app.config["MONGO_URI_MP3"], connect=False)
+    inherited = extensions.mongo_video.cx, extensions.mongo_mp3.cx
+
+    # What post_fork does in each gunicorn worker when the app was preloaded in the master.
+    extensions.reset_mongo_clients(app)
+
+    assert extensions.mongo_video.cx is not inherited[0]
+    assert extensions.mongo_mp3.cx is not inherited[1]
+    assert extensions.mongo_video.db.name == "videos"
+    assert extensions.mongo_mp3.db.name == "mp3s"
+    # Nothing is opened until first use, so the master never holds sockets or monitor threads.
+    assert _pymongo_threads() == []
+
+
+class _FakeChannel:
+    is_closed = False
+
+    def __init__(self, error):
+        self.error = error
+
+    def basic_publish(self, **kwargs):
+        raise self.error
+
+
+class _FakeConnection:
+    is_closed = False
+    is_open = True
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def test_unexpected_publish_error_gives_the_slot_back(monkeypatch):
+    pool = extensions.RabbitMQPublisherPool()
+    pool.parameters, pool.pool_size, pool.acquire_timeout = object(), 1, 0.01
+    connections = []
+
+    def connect():
+        connections.append(_FakeConnection())
+        return connections[-1], _FakeChannel(TypeError("bad properties"))
+
+    monkeypatch.setattr(pool, "_connect", connect)
+
+    # With a pool of one, a leaked slot would make the second publish fail with "exhausted".
+    for _ in range(2):
+        try:
+            pool.publish("video", b"{}")
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("publish swallowed the error")
+
+    assert len(connections) == 2
+    assert not connections[0].is_open
+    assert pool._created == 0
@@ -0,0 +1,99 @@
+import datetime
+import threading
+import time
+
+import mongomock
+import pytest
+from flask import Flask
+
+from app.services import job_service as jobs
+
+ACCESS = {"username": "alice@example.com", "admin": False}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().videos
+    monkeypatch.setattr(jobs, "mongo_video", type("Mongo", (), {"db": database})())
+    monkeypatch.setattr(jobs, "_indexes_ready", False)
+    monkeypatch.setattr(jobs, "_waiters", None)
+    database.jobs.insert_one({"_id": "job-1", "username": ACCESS["username"], "state": jobs.STATE_QUEUED})
+    return database
+
+
+@pytest.fixture
+def app(db):
+    app = Flask("job-tests")
+    app.config.update(JOBS_MAX_WAIT=5, JOBS_POLL_INTERVAL=0.02, JOBS_MAX_WAITERS=1, JOBS_TTL=0)
+    return app
+
+
+def _long_poll(app, results, wait):
+    with app.app_context():
+        results.append(jobs.get_job("job-1", ACCESS, wait=wait))
+
+
+def test_long_polls_beyond_the_limit_get_429(app, db):
+    results = []
+    waiter = threading.Thread(target=_long_poll, args=(app, results, 5))
+    waiter.start()
+    time.sleep(0.1)  # the first poll now holds the only slot
+
+    with app.app_context():
+        assert jobs.get_job("job-1", ACCESS, wait=5)[1] == 429
+        # Without wait there is nothing to hold, so it is always answered.
+        assert jobs.get_job("job-1", ACCESS)[1] == 200
+
+    db.jobs.update_one({"_id": "job-1"}, {"$set": {"state": jobs.STATE_CONVERTING}})
+    waiter.join(timeout=5)
+    assert results[0][0]["state"] == jobs.STATE_CONVERTING
+
+    # The slot is free again.
+    with app.app_context():
+        assert jobs.get_job("job-1", ACCESS, wait=0.05)[1] == 200
+
+
+def test_finished_job_does_not_take_a_slot(app, db):
+    db.jobs.update_one({"_id": "job-1"}, {"$set": {"state": jobs.STATE_DONE}})
+    with app.app_context():
+        jobs._waiter_slots().acquire()
+        assert jobs.get_job("job-1", ACCESS, wait=5)[1] == 200
+
+
+def test_job_deleted_while_waiting_is_404_and_frees_the_slot(app, db):
+    results = []
+    waiter = threading.Thread(target=_long_poll, args=(app, results, 5))
+    waiter.start()
+    time.sleep(0.1)
+    db.jobs.delete_one({"_id": "job-1"})
+    waiter.join(timeout=5)
+
+    assert results[0][1] == 404
+    with app.app_context():
+        assert jobs._waiter_slots().acquire(blocking=False)
+
+
+def test_pages_split_jobs_created_in_the_same_millisecond(app, db):
+    owner = {"username": "bob@example.com", "admin": False}
+    created_at = datetime.datetime(2026, 1, 1, 12, 0, 0, 123000)
+    older = created_at - datetime.timedelta(seconds=1)
+    for job_id in ["a", "b", "c", "d", "e"]:
+        db.jobs.insert_one({"_id": job_id, "username": owner["username"], "state": jobs.STATE_QUEUED, "created_at": created_at})
+    db.jobs.insert_one({"_id": "z", "username": owner["username"], "state": jobs.STATE_QUEUED, "created_at": older})
+
+    seen, before = [], None
+    with app.app_context():
+        while True:
+            page, status = jobs.list_jobs(owner, limit=2, before=before)
+            assert status == 200
+            seen += [job["job_id"] for job in page["jobs"]]
+            before = page["next_before"]
+            if before is None:
+                break
+
+    assert seen == ["e", "d", "c", "b", "a", "z"]
+    with app.app_context():
+        # A bare timestamp (the old cursor) still pages by time alone.
+        page, _ = jobs.list_jobs(owner, before=created_at.isoformat())
+        assert [job["job_id"] for job in page["jobs"]] == ["z"]
+        assert jobs.list_jobs(owner, before="yesterday")[1] == 400
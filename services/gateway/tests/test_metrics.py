@@ -0,0 +1,59 @@
+import time
+
+from flask import Flask
+
+from app import metrics
+
+
+def _client(instrumented, metrics_port=9101):
+    app = Flask("metrics-tests")
+    app.config["METRICS_PORT"] = metrics_port
+
+    @app.route("/ping")
+    def ping():
+        return "ok"
+
+    if instrumented:
+        metrics.init_metrics(app)
+    return app.test_client()
+
+
+def _seconds_per_request(client, requests=1000, rounds=5):
+    # Best of several rounds, so a busy machine doesn't fail the comparison.
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get("/ping").close()
+        best = min(best, (time.perf_counter() - started) / requests)
+    return best
+
+
+def test_instrumentation_overhead_per_request_is_small():
+    bare = _seconds_per_request(_client(instrumented=False))
+    instrumented = _seconds_per_request(_client(instrumented=True))
+
+    # About 40us per request when measured; the bound leaves room for slow CI machines.
+    assert instrumented - bare < 250e-6
+
+
+def test_requests_are_recorded():
+    client = _client(instrumented=True)
+    before = metrics.REGISTRY.get_sample_value(
+        "gateway_request_duration_seconds_count", {"route": "/ping", "method": "GET", "status": "200"}) or 0
+
+    client.get("/ping").close()
+
+    after = metrics.REGISTRY.get_sample_value(
+        "gateway_request_duration_seconds_count", {"route": "/ping", "method": "GET", "status": "200"})
+    assert after - before == 1
+
+
+def test_metrics_stay_off_the_public_port():
+    assert _client(instrumented=True).get("/metrics").status_code == 404
+
+
+def test_metrics_on_the_public_port_when_no_separate_port():
+    response = _client(instrumented=True, metrics_port=0).get("/metrics")
+    assert response.status_code == 200
+    assert b"gateway_request_duration_seconds" in response.data
@@ -0,0 +1,39 @@
+import pytest
+from bson.objectid import ObjectId
+from flask import Flask
+
+from app.services import storage_service
+
+ACCESS = {"username": "alice@example.com", "admin": False}
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, routing_key, body, properties=None):
+        self.published.append((routing_key, properties))
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(storage_service, "rabbitmq_publisher", fake)
+    monkeypatch.setattr(storage_service.job_service, "create_job", lambda *args, **kwargs: None)
+    # Any fs.files lookup would fail: the tier must come from the size the caller passes.
+    monkeypatch.setattr(storage_service, "mongo_video", None)
+    app = Flask("storage-tests")
+    app.config.update(VIDEO_QUEUE="video", VIDEO_BULK_QUEUE="video.bulk", VIDEO_BULK_BYTES=100)
+    with app.app_context():
+        yield fake
+
+
+@pytest.mark.parametrize("size, queue", [(99, "video"), (100, "video.bulk"), (None, "video")])
+def test_queue_video_picks_the_tier_from_the_size(publisher, size, queue):
+    message, status, _ = storage_service.queue_video(object(), ObjectId(), ACCESS, size=size)
+
+    assert status == 202
+    routing_key, properties = publisher.published[0]
+    assert routing_key == queue
+    # No queue is declared with x-max-priority, so no priority is sent.
+    assert properties.priority is None
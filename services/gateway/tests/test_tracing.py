@@ -0,0 +1,23 @@
+import json
+
+from app import tracing
+
+
+def test_span_is_a_trace_line_like_the_other_services(capsys, monkeypatch):
+    monkeypatch.delenv("TRACE_FILE", raising=False)
+    tracing.record_span("gateway.publish", "job-1", 100.0, 100.25, queue="video")
+
+    line = capsys.readouterr().out
+    assert line.startswith("TRACE {") and line.endswith("}\n")
+    assert json.loads(line[len("TRACE "):]) == {
+        "trace_id": "job-1", "span": "gateway.publish", "service": "gateway",
+        "start": 100.0, "duration_ms": 250.0, "queue": "video",
+    }
+
+
+def test_trace_file_gets_bare_json_lines(tmp_path, monkeypatch):
+    trace_file = tmp_path / "spans.jsonl"
+    monkeypatch.setenv("TRACE_FILE", str(trace_file))
+    tracing.record_span("gateway.request", "job-1", 100.0, 101.0, status=202)
+
+    assert json.loads(trace_file.read_text())["span"] == "gateway.request"
@@ -0,0 +1,239 @@
+import hashlib
+import io
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import pytest
+from bson.objectid import ObjectId
+from flask import Flask
+
+from app import extensions, tracing
+from app.routes import upload_routes
+from app.services import storage_service
+
+ADMIN = {"username": "alice@example.com", "admin": True}
+VIDEO = bytes(range(256)) * 3  # several UPLOAD_CHUNK_SIZE blocks, not a multiple of one
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+        self.fail = False
+
+    def publish(self, routing_key, body, properties=None):
+        if self.fail:
+            raise ConnectionError("RabbitMQ publish failed")
+        self.published.append((routing_key, json.loads(body)))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongomock.gridfs.enable_gridfs_integration()
+    database = mongomock.MongoClient().videos
+    monkeypatch.setattr(storage_service, "mongo_video", SimpleNamespace(db=database))
+    return database
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(storage_service, "rabbitmq_publisher", fake)
+    monkeypatch.setattr(storage_service.job_service, "create_job", lambda *args, **kwargs: None)
+    monkeypatch.setattr(storage_service.job_service, "mark_failed", lambda *args, **kwargs: None)
+    return fake
+
+
+@pytest.fixture
+def app(db, publisher, monkeypatch):
+    app = Flask("upload-tests")
+    app.config.update(UPLOAD_MODE="stream", UPLOAD_CHUNK_SIZE=100, UPLOAD_MAX_BYTES=4000, VIDEO_QUEUE="video")
+    app.register_blueprint(upload_routes.upload_bp)
+    monkeypatch.setattr(upload_routes.validate, "validate_token_and_get_payload", lambda request: (ADMIN, None))
+    return app
+
+
+def _stored(db, video_fid):
+    return gridfs.GridFS(db).get(ObjectId(video_fid))
+
+
+def _assert_nothing_stored(db, publisher):
+    assert db["fs.files"].count_documents({}) == 0
+    assert db["fs.chunks"].count_documents({}) == 0
+    assert publisher.published == []
+
+
+def test_raw_body_is_stored_and_hashed(app, db, publisher):
+    response = app.test_client().post("/upload/?filename=clip.mp4", data=VIDEO, content_type="video/mp4")
+
+    assert response.status_code == 202
+    stored = _stored(db, response.json["video_fid"])
+    assert stored.read() == VIDEO
+    file_doc = db["fs.files"].find_one({"_id": stored._id})
+    assert (file_doc["filename"], file_doc["contentType"]) == ("clip.mp4", "video/mp4")
+    digest = hashlib.sha256(VIDEO).hexdigest()
+    assert db.video_hashes.find_one({"_id": digest})["video_fid"] == stored._id
+    routing_key, message = publisher.published[0]
+    assert routing_key == "video"
+    assert (message["content_hash"], message["size"]) == (digest, len(VIDEO))
+
+
+def test_multipart_file_part_is_stored_and_other_fields_skipped(app, db, publisher):
+    response = app.test_client().post("/upload/", data={
+        "note": "before the file",
+        "file": (io.BytesIO(VIDEO), "clip.mp4", "video/mp4"),
+    })
+
+    assert response.status_code == 202
+    stored = _stored(db, response.json["video_fid"])
+    assert stored.read() == VIDEO
+    file_doc = db["fs.files"].find_one({"_id": stored._id})
+    assert (file_doc["filename"], file_doc["contentType"]) == ("clip.mp4", "video/mp4")
+    assert publisher.published[0][1]["content_hash"] == hashlib.sha256(VIDEO).hexdigest()
+
+
+def test_second_file_part_is_rejected_and_nothing_kept(app, db, publisher):
+    response = app.test_client().post("/upload/", data={
+        "first": (io.BytesIO(VIDEO), "a.mp4"),
+        "second": (io.BytesIO(VIDEO), "b.mp4"),
+    })
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Malformed upload: Exactly one file is required per upload"
+    _assert_nothing_stored(db, publisher)
+
+
+def test_multipart_without_a_file_is_400(app, db, publisher):
+    response = app.test_client().post("/upload/", data={"note": "no file"}, content_type="multipart/form-data")
+
+    assert response.status_code == 400
+    assert response.json["error"] == "No file provided"
+    _assert_nothing_stored(db, publisher)
+
+
+def test_empty_body_is_400(app, db, publisher):
+    response = app.test_client().post("/upload/?filename=clip.mp4", data=b"", content_type="video/mp4")
+
+    assert response.status_code == 400
+    _assert_nothing_stored(db, publisher)
+
+
+def test_declared_length_over_the_limit_is_413_before_reading(app, db, publisher):
+    response = app.test_client().post("/upload/", data=b"x" * 4001, content_type="video/mp4")
+
+    assert response.status_code == 413
+    _assert_nothing_stored(db, publisher)
+
+
+def test_chunked_body_over_the_limit_is_413_and_aborted(app, db, publisher):
+    # No Content-Length (chunked transfer): the limit is enforced while streaming.
+    response = app.test_client().post(
+        "/upload/", input_stream=io.BytesIO(b"x" * 4001), content_type="video/mp4",
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+
+    assert response.status_code == 413
+    _assert_nothing_stored(db, publisher)
+
+
+def test_duplicate_upload_reuses_the_first_video(app, db, publisher):
+    client = app.test_client()
+    first = client.post("/upload/?filename=a.mp4", data=VIDEO, content_type="video/mp4").json["video_fid"]
+    second = client.post("/upload/?filename=b.mp4", data=VIDEO, content_type="video/mp4").json["video_fid"]
+
+    assert second == first
+    assert db["fs.files"].count_documents({}) == 1
+    assert [message["video_fid"] for _, message in publisher.published] == [first, first]
+
+
+def test_hash_is_not_claimed_by_an_upload_whose_publish_failed(app, db, publisher):
+    client = app.test_client()
+    publisher.fail = True
+    assert client.post("/upload/", data=VIDEO, content_type="video/mp4").status_code == 503
+    # The failed upload's video is gone and nothing points at it.
+    assert db["fs.files"].count_documents({}) == 0
+    assert db.video_hashes.count_documents({}) == 0
+
+    publisher.fail = False
+    response = client.post("/upload/", data=VIDEO, content_type="video/mp4")
+    assert response.status_code == 202
+    assert _stored(db, response.json["video_fid"]).read() == VIDEO
+
+
+@pytest.fixture
+def monitor(app, monkeypatch):
+    """The real QueueDepthMonitor with its refresh thread replaced by a settable reading."""
+    monitor = extensions.QueueDepthMonitor()
+    monitor.parameters, monitor.refresh_interval = object(), 5.0
+    monitor._pid = os.getpid()  # as if this process's refresh thread were running
+
+    def reading(depth, age):
+        monitor._depth, monitor._updated_at = depth, time.monotonic() - age
+
+    monitor.reading = reading
+    monkeypatch.setattr(storage_service, "queue_depth_monitor", monitor)
+    app.config.update(QUEUE_DEPTH_LIMIT=100, QUEUE_DEPTH_RETRY_AFTER=30)
+    return monitor
+
+
+def test_full_backlog_rejects_before_the_body_is_read(app, db, publisher, monitor):
+    monitor.reading(depth=100, age=1)
+    response = app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    _assert_nothing_stored(db, publisher)
+
+
+def test_backlog_below_the_limit_is_admitted(app, db, publisher, monitor):
+    monitor.reading(depth=99, age=1)
+    assert app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4").status_code == 202
+
+
+def test_stale_depth_fails_open(app, db, publisher, monitor):
+    # Older than three refresh intervals: the broker may be unreachable, so don't shed.
+    monitor.reading(depth=10_000, age=16)
+    assert monitor.depth() is None
+    assert app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4").status_code == 202
+
+
+def test_unknown_depth_fails_open(app, db, publisher, monitor):
+    monitor.reading(depth=None, age=0)
+    assert app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4").status_code == 202
+
+
+def _traces(capsys):
+    return [json.loads(line[len("TRACE "):]) for line in capsys.readouterr().out.splitlines() if line.startswith("TRACE ")]
+
+
+@pytest.mark.parametrize("rejection", ["unauthenticated", "not_admin", "backlog_full"])
+def test_rejected_upload_starts_no_job(app, db, publisher, monitor, monkeypatch, capsys, rejection):
+    tracing.init_tracing(app)
+    monkeypatch.setenv("TRACING_ENABLED", "True")
+    monkeypatch.delenv("TRACE_FILE", raising=False)
+    monitor.reading(depth=100 if rejection == "backlog_full" else 0, age=1)
+    if rejection != "backlog_full":
+        payload, error = ({"username": "bob@example.com", "admin": False}, None) if rejection == "not_admin" else (None, ("Unauthorized", 401))
+        monkeypatch.setattr(upload_routes.validate, "validate_token_and_get_payload", lambda request: (payload, error))
+
+    response = app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4")
+
+    assert response.status_code in (401, 403, 503)
+    assert _traces(capsys) == []
+
+
+def test_accepted_upload_traces_its_job(app, db, publisher, monitor, monkeypatch, capsys):
+    tracing.init_tracing(app)
+    monkeypatch.setenv("TRACING_ENABLED", "True")
+    monkeypatch.delenv("TRACE_FILE", raising=False)
+    monitor.reading(depth=0, age=1)
+
+    response = app.test_client().post("/upload/", data=VIDEO, content_type="video/mp4")
+
+    assert response.status_code == 202
+    [span] = [span for span in _traces(capsys) if span["span"] == "gateway.request"]
+    assert span["trace_id"] == response.json["job_id"] == publisher.published[0][1]["job_id"]
@@ -0,0 +1,158 @@
+import datetime
+import hashlib
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import pytest
+from flask import Flask
+from pymongo.errors import AutoReconnect
+
+from app.services import storage_service, upload_session_service as sessions
+
+ACCESS = {"username": "alice@example.com", "admin": False}
+CHUNK = 4
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongomock.gridfs.enable_gridfs_integration()
+    database = mongomock.MongoClient().videos
+    mongo = type("Mongo", (), {"db": database})()
+    monkeypatch.setattr(sessions, "mongo_video", mongo)
+    monkeypatch.setattr(storage_service, "mongo_video", mongo)
+    monkeypatch.setattr(sessions, "_indexes_ready", False)
+    monkeypatch.setattr(storage_service, "get_video_fs", lambda: gridfs.GridFS(database))
+    monkeypatch.setattr(sessions.tracing, "job_id", lambda: "job-1")
+    return database
+
+
+@pytest.fixture
+def app_ctx():
+    app = Flask("session-tests")
+    app.config.update(RESUMABLE_CHUNK_SIZE=CHUNK, RESUMABLE_FINALIZE_TIMEOUT=300)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def published(monkeypatch):
+    calls = []
+
+    def queue_video(fs, fid, access, size=None, delete_on_failure=True, content_hash=None):
+        calls.append((fid, size))
+        return "queued", 202, str(fid)
+
+    monkeypatch.setattr(storage_service, "queue_video", queue_video)
+    return calls
+
+
+def _complete_session(db, data=b"x" * CHUNK):
+    view, status = sessions.create_session(ACCESS, "clip.mp4", 2 * CHUNK)
+    assert status == 201
+    session = db.upload_sessions.find_one({"_id": sessions.ObjectId(view["session_id"])})
+    for n in range(2):
+        db["fs.chunks"].insert_one({"files_id": session["file_id"], "n": n, "data": data})
+    return view["session_id"], session
+
+
+def _claim(db, session, age_seconds):
+    db.upload_sessions.update_one({"_id": session["_id"]}, {"$set": {
+        "state": sessions.STATE_FINALIZING,
+        "finalizing_since": datetime.datetime.utcnow() - datetime.timedelta(seconds=age_seconds),
+    }})
+
+
+def test_finalize_publishes_once_and_completes(db, app_ctx, published):
+    session_id, _ = _complete_session(db)
+    result, status = sessions.finalize(session_id, ACCESS)
+    assert status == 202 and result["job_id"] == "job-1"
+    assert sessions.finalize(session_id, ACCESS)[1] == 202
+    assert len(published) == 1 and published[0][1] == 2 * CHUNK
+    stored = db.upload_sessions.find_one()
+    assert stored["state"] == sessions.STATE_COMPLETE and "finalizing_since" not in stored
+
+
+def test_live_claim_blocks_finalize_and_abort(db, app_ctx, published):
+    session_id, session = _complete_session(db)
+    _claim(db, session, age_seconds=10)
+    assert sessions.finalize(session_id, ACCESS)[1] == 409
+    assert sessions.abort(session_id, ACCESS)[1] == 409
+    assert published == []
+
+
+def test_stale_claim_is_taken_over_by_finalize(db, app_ctx, published):
+    session_id, session = _complete_session(db)
+    _claim(db, session, age_seconds=301)
+    assert sessions.finalize(session_id, ACCESS)[1] == 202
+    assert len(published) == 1
+
+
+def test_claim_without_timestamp_counts_as_stale(db, app_ctx, published):
+    session_id, session = _complete_session(db)
+    db.upload_sessions.update_one({"_id": session["_id"]}, {"$set": {"state": sessions.STATE_FINALIZING}})
+    assert sessions.finalize(session_id, ACCESS)[1] == 202
+
+
+def test_stale_claim_can_be_aborted(db, app_ctx, published):
+    session_id, session = _complete_session(db)
+    _claim(db, session, age_seconds=301)
+    assert sessions.abort(session_id, ACCESS)[1] == 200
+    assert db.upload_sessions.count_documents({}) == 0
+    assert db["fs.chunks"].count_documents({}) == 0
+
+
+def test_incomplete_upload_releases_the_claim(db, app_ctx, published):
+    session_id, session = _complete_session(db)
+    db["fs.chunks"].delete_one({"files_id": session["file_id"], "n": 1})
+    result, status = sessions.finalize(session_id, ACCESS)
+    assert status == 409 and result["error"] == "Upload is incomplete"
+    assert db.upload_sessions.find_one()["state"] == sessions.STATE_OPEN
+
+
+def test_mongo_errors_are_500_not_unhandled(db, app_ctx, published, monkeypatch):
+    session_id, session = _complete_session(db)
+
+    def unavailable(*args, **kwargs):
+        raise AutoReconnect("primary stepped down")
+
+    monkeypatch.setattr(db.upload_sessions, "find_one_and_update", unavailable)
+    assert sessions.finalize(session_id, ACCESS)[1] == 500
+
+    monkeypatch.setattr(db.upload_sessions, "find_one", unavailable)
+    for call in (sessions.get_session, sessions.finalize, sessions.abort):
+        assert call(session_id, ACCESS)[1] == 500
+
+
+def test_finalize_records_the_hash_of_the_assembled_file(db, app_ctx, published):
+    session_id, session = _complete_session(db, data=b"ab" * (CHUNK // 2))
+    assert sessions.finalize(session_id, ACCESS)[1] == 202
+
+    record = db.video_hashes.find_one()
+    assert record["_id"] == hashlib.sha256(b"ab" * CHUNK).hexdigest()
+    assert record["video_fid"] == session["file_id"]
+
+
+def test_duplicate_session_reuses_the_earlier_video(db, app_ctx, published):
+    first_id, first = _complete_session(db)
+    sessions.finalize(first_id, ACCESS)
+    second_id, second = _complete_session(db)
+
+    result, status = sessions.finalize(second_id, ACCESS)
+
+    assert status == 202 and result["video_fid"] == str(first["file_id"])
+    assert published[-1][0] == first["file_id"]
+    assert db["fs.chunks"].count_documents({"files_id": second["file_id"]}) == 0
+    # A repeated finalize reports the video that was actually queued.
+    assert sessions.finalize(second_id, ACCESS)[0]["video_fid"] == str(first["file_id"])
+
+
+def test_failed_reuse_keeps_the_duplicate_for_a_retried_finalize(db, app_ctx, published, monkeypatch):
+    first_id, first = _complete_session(db)
+    sessions.finalize(first_id, ACCESS)
+    second_id, second = _complete_session(db)
+    monkeypatch.setattr(storage_service, "queue_video", lambda *args, **kwargs: ("RabbitMQ error", 503, None))
+
+    assert sessions.finalize(second_id, ACCESS)[1] == 503
+    assert db["fs.chunks"].count_documents({"files_id": second["file_id"]}) == 2
+    assert db.upload_sessions.find_one({"_id": second["_id"]})["state"] == sessions.STATE_OPEN
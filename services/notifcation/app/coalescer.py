@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+
+
+class DigestCoalescer:
+    """
+    Groups pending notifications per username into digest batches.
+
+    The first message for a user opens a window; the batch is released when the
+    window has been open for `window` seconds or when it holds `max_items`
+    messages, whichever comes first. With window=0 every message is its own batch.
+
+    Not thread-safe: only used from the pika connection thread.
+    """
+
+    def __init__(self, window, max_items, clock=time.monotonic):
+        self.window = window
+        self.max_items = max(1, max_items)
+        self._clock = clock
+        # username -> (opened_at, [item, ...]); dict order is window-opening order.
+        self._pending = OrderedDict()
+
+    def add(self, username, item):
+        """
+        Buffers an item for a user.
+
+        Returns:
+            list or None: the user's full batch if this item filled it (or windows are off), else None.
+        """
+        opened_at, items = self._pending.setdefault(username, (self._clock(), []))
+        items.append(item)
+        if self.window <= 0 or len(items) >= self.max_items:
+            del self._pending[username]
+            return items
+        return None
+
+    def due(self):
+        """Pops and returns (username, items) for every window that has expired."""
+        now = self._clock()
+        expired = [user for user, (opened_at, _) in self._pending.items() if now - opened_at >= self.window]
+        return [(user, self._pending.pop(user)[1]) for user in expired]
+
+    def drain(self):
+        """Pops and returns every pending batch regardless of age."""
+        batches = [(user, items) for user, (_, items) in self._pending.items()]
+        self._pending.clear()
+        return batches
+
+    def pending(self):
+        return sum(len(items) for _, items in self._pending.values())
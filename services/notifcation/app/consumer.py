@@ -1,22 +1,172 @@
-import pika, os
-from app.notifier import send_notification
+import pika, os, json, time, functools
+from concurrent.futures import ThreadPoolExecutor
+from app.notifier import send_digest, is_permanent
+from app.coalescer import DigestCoalescer
+from app import tracing
 
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 MP3_QUEUE = os.getenv("MP3_QUEUE", "mp3")
+# Notifications sent at once (each mostly waits on SMTP, so match SMTP_POOL_SIZE).
+NOTIFICATION_CONCURRENCY = int(os.getenv("NOTIFICATION_CONCURRENCY", os.getenv("SMTP_POOL_SIZE", "2")))
+# Ready MP3s for the same user within this many seconds (up to the cap) go out as one digest email.
+NOTIFICATION_DIGEST_WINDOW = float(os.getenv("NOTIFICATION_DIGEST_WINDOW", "30"))
+NOTIFICATION_DIGEST_MAX = int(os.getenv("NOTIFICATION_DIGEST_MAX", "50"))
+# Buffered messages stay unacked until their digest is sent, so prefetch bounds how much can be coalesced.
+NOTIFICATION_PREFETCH = int(os.getenv("NOTIFICATION_PREFETCH", str(max(NOTIFICATION_DIGEST_MAX * 2, NOTIFICATION_CONCURRENCY * 2))))
+
+# A notification that couldn't be mailed waits in mp3.retry.<n> (a queue with a TTL of
+# NOTIFICATION_RETRY_DELAY x 2^(n-1) seconds and no consumer) until the broker dead-letters it
+# back onto the mp3 queue; after NOTIFICATION_MAX_RETRIES it is parked on mp3.dead. The same
+# scheme as the converter's video queues, kept separate because the services deploy separately.
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", "5"))
+NOTIFICATION_RETRY_DELAY = int(os.getenv("NOTIFICATION_RETRY_DELAY", "30")) # seconds, doubled per attempt
+RETRY_COUNT_HEADER = "x-retry-count"
+
+
+def _retry_queue_name(queue, attempt):
+    return f"{queue}.retry.{attempt}"
+
+
+def _dead_letter_queue_name(queue):
+    return f"{queue}.dead"
+
+
+def declare_retry_queues(channel, queue):
+    """Declares mp3.retry.1..NOTIFICATION_MAX_RETRIES and mp3.dead (see above)."""
+    for attempt in range(1, NOTIFICATION_MAX_RETRIES + 1):
+        channel.queue_declare(
+            queue=_retry_queue_name(queue, attempt),
+            durable=True,
+            arguments={
+                "x-message-ttl": NOTIFICATION_RETRY_DELAY * 1000 * 2 ** (attempt - 1),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue,
+            },
+        )
+    channel.queue_declare(queue=_dead_letter_queue_name(queue), durable=True)
+
+
+def handle_failure(channel, delivery_tag, properties, body, error, permanent=False):
+    """
+    Moves one mp3 message on after its notification failed: to its next delay queue, or
+    to mp3.dead once it is out of retries or the failure is permanent (see is_permanent).
+
+    A digest that fails is handled per message, so each one backs off on its own count and
+    may land in a different digest when it comes back. Messages whose mp3_fid went out in
+    an earlier, partly sent digest are then skipped by the sent log rather than re-mailed.
+    The message is acked only after it is republished, so a crash in between leaves a
+    redelivery, not a lost notification.
+    """
+    headers = dict((properties.headers or {}) if properties else {})
+    attempt = int(headers.get(RETRY_COUNT_HEADER, 0)) + 1
+    headers[RETRY_COUNT_HEADER] = attempt
+    # notification.queue_wait on the way back then covers the backoff, not the original publish.
+    headers[tracing.PUBLISHED_AT_HEADER] = time.time()
+    job_id = headers.get(tracing.JOB_ID_HEADER)
+
+    if permanent or attempt > NOTIFICATION_MAX_RETRIES:
+        try:
+            message = json.loads(body)
+        except ValueError:
+            message = {"raw_body": body.decode("utf-8", "replace")}
+        if not isinstance(message, dict):
+            message = {"raw_body": message}
+        message["error"] = str(error)
+        message["retries"] = attempt - 1
+        headers["x-error"] = str(error)[:1000]
+        routing_key = _dead_letter_queue_name(MP3_QUEUE)
+        body = json.dumps(message)
+        job_id = job_id or message.get("job_id")
+        print(f"Giving up on notifying {message.get('username')} after {attempt - 1} retries, dead-lettering: {error}")
+    else:
+        routing_key = _retry_queue_name(MP3_QUEUE, attempt)
+        print(f"Notification failed, retry {attempt}/{NOTIFICATION_MAX_RETRIES} in {NOTIFICATION_RETRY_DELAY * 2 ** (attempt - 1)}s: {error}")
+
+    channel.basic_publish(
+        exchange="",
+        routing_key=routing_key,
+        body=body,
+        properties=pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE, headers=headers)
+    )
+    channel.basic_ack(delivery_tag=delivery_tag)
+    now = time.time()
+    tracing.record_span("notification.failure", job_id, now, now, queue=routing_key, attempt=attempt, error=str(error)[:200])
+
 
 def start_consumer():
     connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     channel = connection.channel()
+    channel.queue_declare(queue=MP3_QUEUE, durable=True)
+    declare_retry_queues(channel, MP3_QUEUE)
+    channel.basic_qos(prefetch_count=NOTIFICATION_PREFETCH)
+
+    executor = ThreadPoolExecutor(max_workers=NOTIFICATION_CONCURRENCY, thread_name_prefix="notifier")
+    coalescer = DigestCoalescer(NOTIFICATION_DIGEST_WINDOW, NOTIFICATION_DIGEST_MAX)
+
+    def on_sent(ch, items, dispatched_at, future):
+        # Runs on the connection thread (scheduled via add_callback_threadsafe).
+        # The whole digest is acked together, only once the email has gone out;
+        # on failure each delivery moves on to its own next retry step.
+        error = future.exception()
+        for tag, properties, body, message, _ in items:
+            tracing.record_span(
+                "notification.send", message.get("job_id"), dispatched_at,
+                digest_size=len(items), ok=error is None,
+            )
+            if error is None:
+                ch.basic_ack(delivery_tag=tag)
+            else:
+                handle_failure(ch, tag, properties, body, error, permanent=is_permanent(error))
+
+    def dispatch(ch, username, items):
+        dispatched_at = time.time()
+        for _, _, _, message, received_at in items:
+            # Time held in the digest window.
+            tracing.record_span("notification.coalesced", message.get("job_id"), received_at, dispatched_at, digest_size=len(items))
+        future = executor.submit(send_digest, username, [message for _, _, _, message, _ in items])
+        future.add_done_callback(
+            lambda f: connection.add_callback_threadsafe(functools.partial(on_sent, ch, items, dispatched_at, f))
+        )
+
+    # Windows are checked on a short timer on the connection thread, so a digest goes out
+    # at most about a second after its window closes.
+    tick = min(1.0, NOTIFICATION_DIGEST_WINDOW)
+
+    def flush_due():
+        for username, items in coalescer.due():
+            dispatch(channel, username, items)
+        connection.call_later(tick, flush_due)
 
     def callback(ch, method, properties, body):
         print("Received message")
-        err = send_notification(body)
-        if err:
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-        else:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        received_at = time.time()
+        try:
+            message = json.loads(body)
+            username = message["username"]
+            message["mp3_fid"]
+        except (ValueError, KeyError, TypeError) as e:
+            handle_failure(ch, method.delivery_tag, properties, body, f"Malformed message: {e!r}", permanent=True)
+            return
+
+        job_id = tracing.job_id_of(message, properties)
+        if job_id:
+            message["job_id"] = job_id
+        tracing.record_queue_wait(
+            "notification.queue_wait", job_id, properties, received_at,
+            queue=MP3_QUEUE, redelivered=method.redelivered,
+            attempt=int((properties.headers or {}).get(RETRY_COUNT_HEADER, 0)),
+        )
+
+        batch = coalescer.add(username, (method.delivery_tag, properties, body, message, received_at))
+        if batch is not None:
+            dispatch(ch, username, batch)
 
+    if NOTIFICATION_DIGEST_WINDOW > 0:
+        connection.call_later(tick, flush_due)
     channel.basic_consume(queue=MP3_QUEUE, on_message_callback=callback)
-    print("Waiting for messages. To exit press CTRL+C")
-    channel.start_consuming()
+    print(f"Waiting for messages ({NOTIFICATION_CONCURRENCY} concurrent, {NOTIFICATION_DIGEST_WINDOW}s digest window). To exit press CTRL+C")
+    try:
+        channel.start_consuming()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
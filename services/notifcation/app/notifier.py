@@ -1,45 +1,132 @@
-import smtplib
 import os
-import json
+import smtplib
+import threading
 from email.message import EmailMessage
+from app.smtp_pool import SMTPSessionPool
+from app.sent_log import SentLog
+
+# One pool per process, created on first use once the credentials are known.
+_smtp_pool = None
+_smtp_pool_lock = threading.Lock()
+_sent_log = None
+_sent_log_lock = threading.Lock()
+
+
+class NotificationConfigError(EnvironmentError):
+    """Required notification settings are missing; retrying will not help."""
+
+
+# RCPT replies that reject the address itself: mailbox unavailable, mailbox name not allowed.
+RECIPIENT_REJECTED_CODES = {550, 553}
+
+
+def is_permanent(error):
+    """
+    True for failures a retry cannot fix: missing configuration, a malformed message,
+    or a recipient address the SMTP server rejected outright. Every other SMTP error
+    is retried with backoff, including 5xx replies that aren't about the recipient
+    (e.g. 535 authentication failed, 554 relay denied): those come from our own account
+    or the server's configuration, and dead-lettering would throw away every message
+    until someone fixes it.
+    """
+    if isinstance(error, (NotificationConfigError, KeyError, ValueError, TypeError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(
+            code in RECIPIENT_REJECTED_CODES for code, _ in error.recipients.values()
+        )
+    return False
+
+
+def _get_config():
+    sender_address = os.environ.get("EMAIL_SENDER_ADDRESS")
+    mailjet_api_key = os.environ.get("MAILJET_API_KEY")
+    mailjet_secret_key = os.environ.get("MAILJET_SECRET_KEY")
+
+    # Validate required environment variables
+    if not sender_address:
+        raise NotificationConfigError("Missing EMAIL_SENDER_ADDRESS")
+    if not mailjet_api_key or not mailjet_secret_key:
+        raise NotificationConfigError("Missing MAILJET_API_KEY or MAILJET_SECRET_KEY")
+    return sender_address, mailjet_api_key, mailjet_secret_key
+
+
+def get_smtp_pool():
+    global _smtp_pool
+    with _smtp_pool_lock:
+        if _smtp_pool is None:
+            _, mailjet_api_key, mailjet_secret_key = _get_config()
+            print(f"Creating SMTP session pool as {mailjet_api_key}...")
+            _smtp_pool = SMTPSessionPool(mailjet_api_key, mailjet_secret_key)
+        return _smtp_pool
 
 
-def send_notification(message):
-    print("Raw message received:", message)
+def get_sent_log():
+    global _sent_log
+    with _sent_log_lock:
+        if _sent_log is None:
+            _sent_log = SentLog.from_env()
+        return _sent_log
 
+
+def build_notification(message):
+    """Builds the 'MP3 ready' email for a parsed mp3 queue message."""
+    sender_address, _, _ = _get_config()
+
+    msg = EmailMessage()
+    msg.set_content(f"mp3 file_id: {message['mp3_fid']} is now ready!")
+    msg["Subject"] = "MP3 Download"
+    msg["From"] = sender_address
+    msg["To"] = message["username"]
+    return msg
+
+
+def build_digest(username, messages):
+    """Builds one email listing every MP3 in a coalesced batch for a single user."""
+    if len(messages) == 1:
+        return build_notification(messages[0])
+
+    sender_address, _, _ = _get_config()
+
+    lines = [f"{len(messages)} of your mp3 files are now ready:", ""]
+    lines += [f"- mp3 file_id: {message['mp3_fid']}" for message in messages]
+
+    msg = EmailMessage()
+    msg.set_content("\n".join(lines))
+    msg["Subject"] = f"MP3 Download ({len(messages)} files)"
+    msg["From"] = sender_address
+    msg["To"] = username
+    return msg
+
+
+def send_digest(username, messages):
+    """
+    Sends a single email covering all parsed mp3 queue messages for one user.
+
+    MP3s that were already notified (a redelivery, or the retry of a batch that
+    went out before its ack) are left out; if nothing is left, no mail is sent.
+    """
     try:
-        message = json.loads(message)
-        print("Parsed message:", message)
-
-        mp3_fid = message["mp3_fid"]
-        receiver_address = message["username"]
-
-        sender_address = os.environ.get("EMAIL_SENDER_ADDRESS")
-        mailjet_api_key = os.environ.get("MAILJET_API_KEY")
-        mailjet_secret_key = os.environ.get("MAILJET_SECRET_KEY")
-
-        # Validate required environment variables
-        if not sender_address:
-            raise EnvironmentError("Missing EMAIL_SENDER_ADDRESS")
-        if not mailjet_api_key or not mailjet_secret_key:
-            raise EnvironmentError("Missing MAILJET_API_KEY or MAILJET_SECRET_KEY")
-
-        msg = EmailMessage()
-        msg.set_content(f"mp3 file_id: {mp3_fid} is now ready!")
-        msg["Subject"] = "MP3 Download"
-        msg["From"] = sender_address
-        msg["To"] = receiver_address
-
-        print(f"Connecting to SMTP server as {mailjet_api_key}...")
-
-        session = smtplib.SMTP("in-v3.mailjet.com", 587)
-        session.set_debuglevel(1)  # Enable SMTP debug output
-        session.starttls()
-        session.login(mailjet_api_key, mailjet_secret_key)
-        session.send_message(msg)
-        session.quit()
-        print("Mail Sent")
+        sent_log = get_sent_log()
+        already_sent = sent_log.already_sent({message["mp3_fid"] for message in messages})
+        pending = {}
+        for message in messages:
+            if message["mp3_fid"] not in already_sent:
+                pending.setdefault(message["mp3_fid"], message)
+        if not pending:
+            print(f"Skipping duplicate notification for {username} ({len(messages)} file(s) already sent)")
+            return
+
+        msg = build_digest(username, list(pending.values()))
+        get_smtp_pool().send_message(msg)
+        print(f"Mail Sent to {username} ({len(pending)} file(s))")
 
     except Exception as e:
-        print("Error sending email:", e)
+        print(f"Error sending digest to {username}:", e)
         raise
+
+    try:
+        sent_log.mark_sent(list(pending), username)
+    except Exception as e:
+        # The mail is out; failing the batch now would only cause a duplicate on retry.
+        print(f"Could not record sent notifications for {username}:", e)
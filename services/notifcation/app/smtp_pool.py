@@ -0,0 +1,162 @@
+import os, smtplib, threading, time, queue
+
+SMTP_HOST = os.getenv("SMTP_HOST", "in-v3.mailjet.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+# Sessions are recycled after this many messages or seconds, before the server drops them.
+SMTP_MAX_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", "100"))
+SMTP_MAX_SESSION_AGE = float(os.getenv("SMTP_MAX_SESSION_AGE", "300"))
+# Idle sessions are NOOP-checked before reuse after this many seconds.
+SMTP_HEALTHCHECK_AFTER = float(os.getenv("SMTP_HEALTHCHECK_AFTER", "30"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Longest a send waits for a session when all SMTP_POOL_SIZE are in use.
+SMTP_POOL_TIMEOUT = float(os.getenv("SMTP_POOL_TIMEOUT", "30"))
+SMTP_DEBUG = int(os.getenv("SMTP_DEBUG", "0"))
+
+# Errors after which the session is thrown away and the send retried on a fresh one.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, OSError)
+
+
+class _SMTP(smtplib.SMTP):
+    """smtplib.SMTP that records when a message's DATA phase starts (see send_message)."""
+
+    data_started = False
+
+    def data(self, msg):
+        self.data_started = True
+        return super().data(msg)
+
+
+class _Session:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.sent = 0
+
+
+class SMTPSessionPool:
+    """
+    Thread-safe pool of logged-in SMTP sessions.
+
+    Each session does STARTTLS and login once and then sends many messages. Sessions
+    idle for a while are checked with NOOP before reuse, sessions past their message
+    or age budget are closed, and a send that finds its connection dead is retried
+    once on a new session, unless the message may already have been accepted.
+    """
+
+    def __init__(self, username=None, password=None, host=SMTP_HOST, port=SMTP_PORT, size=SMTP_POOL_SIZE,
+                 acquire_timeout=SMTP_POOL_TIMEOUT):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = _SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        smtp.set_debuglevel(SMTP_DEBUG)
+        try:
+            smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        print(f"Opened SMTP session to {self.host}:{self.port}")
+        return _Session(smtp)
+
+    def _is_usable(self, session):
+        now = time.monotonic()
+        if session.sent >= SMTP_MAX_MESSAGES_PER_SESSION or now - session.created_at >= SMTP_MAX_SESSION_AGE:
+            return False
+        if now - session.last_used >= SMTP_HEALTHCHECK_AFTER:
+            try:
+                return session.smtp.noop()[0] == 250
+            except CONNECTION_ERRORS + (smtplib.SMTPException,):
+                return False
+        return True
+
+    def _acquire(self):
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = None
+
+            if session is None:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    session = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise ConnectionError("SMTP session pool exhausted.")
+
+            if self._is_usable(session):
+                return session
+            self._discard(session)
+
+    def _release(self, session):
+        session.last_used = time.monotonic()
+        self._idle.put(session)
+
+    def _discard(self, session):
+        with self._lock:
+            self._created -= 1
+        try:
+            session.smtp.quit()
+        except Exception:
+            session.smtp.close()
+
+    def send_message(self, message):
+        """
+        Sends one EmailMessage over a pooled session.
+
+        If the session turns out to be dead before the server has the message (MAIL,
+        RCPT or the DATA command itself fail), it is replaced and the send retried once.
+        A connection lost while the body is transferred or its reply awaited is raised
+        instead: the server may already have accepted the mail, and sending it again
+        would deliver it twice.
+        """
+        for attempt in (1, 2):
+            session = self._acquire()
+            session.smtp.data_started = False
+            try:
+                session.smtp.send_message(message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The server rejected this message; the session itself is fine.
+                self._release(session)
+                raise
+            except CONNECTION_ERRORS as e:
+                self._discard(session)
+                if attempt == 2 or session.smtp.data_started:
+                    raise
+                print(f"SMTP session failed ({e}), reconnecting")
+                continue
+            except Exception:
+                self._discard(session)
+                raise
+            session.sent += 1
+            self._release(session)
+            return
+
+    def close(self):
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(session)
@@ -0,0 +1,76 @@
+"""
+Notification emails per second: a new SMTP session per message (connect, STARTTLS,
+login, send, quit, as the notifier did before the pool) vs SMTPSessionPool.
+
+Sends to the SMTP stand-in from tests/conftest.py, which delays every reply by
+--latency ms to stand in for the round trip to the real server (TCP and TLS
+handshake round trips are not delayed, so the per-message numbers are optimistic).
+
+Run from services/notifcation:
+
+    python -m bench.send_rate --messages 200 --threads 1,2 --latency 0,20
+"""
+
+import argparse
+import smtplib
+import threading
+import time
+
+from app.smtp_pool import SMTPSessionPool
+from tests.conftest import SMTPStandIn
+from tests.test_smtp_pool import _message
+
+
+def send_per_message(server, message):
+    session = smtplib.SMTP(server.hostname, server.port)
+    session.starttls()
+    session.login("key", "secret")
+    session.send_message(message)
+    session.quit()
+
+
+def run(server, threads, messages, pooled):
+    pool = SMTPSessionPool("key", "secret", host=server.hostname, port=server.port, size=threads)
+    per_thread = messages // threads
+
+    def send(first):
+        for n in range(first, first + per_thread):
+            if pooled:
+                pool.send_message(_message(n))
+            else:
+                send_per_message(server, _message(n))
+
+    workers = [threading.Thread(target=send, args=(i * per_thread,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", default="1,2", help="comma-separated sender threads (NOTIFICATION_CONCURRENCY)")
+    parser.add_argument("--latency", default="0,20", help="comma-separated reply delays in ms")
+    args = parser.parse_args()
+
+    print(f"{'latency ms':>10} {'threads':>7} {'per-message msg/s':>18} {'pooled msg/s':>13} {'speedup':>8}")
+    for latency in [float(ms) for ms in args.latency.split(",")]:
+        server = SMTPStandIn(latency=latency / 1000)
+        server.start()
+        try:
+            for threads in [int(t) for t in args.threads.split(",")]:
+                # Fewer messages without the pool at high latency, to keep the run short.
+                unpooled = run(server, threads, max(args.messages // 4, threads), pooled=False)
+                pooled = run(server, threads, args.messages, pooled=True)
+                print(f"{latency:>10.0f} {threads:>7} {unpooled:>18.1f} {pooled:>13.1f} {pooled / unpooled:>7.1f}x")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
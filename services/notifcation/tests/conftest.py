@@ -0,0 +1,89 @@
+import asyncio
+import datetime
+import os
+import socket
+import ssl
+import tempfile
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, AuthResult
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+def _self_signed_context():
+    """Server TLS context with a throwaway certificate (smtplib's starttls() doesn't verify it)."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    with tempfile.TemporaryDirectory() as workdir:
+        cert_path, key_path = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+        with open(cert_path, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, "wb") as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+class _SlowSMTP(SMTP):
+    """Delays every reply by `latency` seconds: one network round trip per SMTP command."""
+
+    latency = 0.0
+
+    async def push(self, status):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await super().push(status)
+
+
+class SMTPStandIn(Controller):
+    """
+    Local SMTP server shaped like Mailjet's submission port: STARTTLS, then AUTH (any
+    credentials), then mail. Counts logins (one per session) and accepted messages.
+    With drop_after_data set, that many accepted messages get no reply: the connection
+    is closed instead, as when it drops at the very end of a send.
+    """
+
+    def __init__(self, latency=0.0):
+        self.logins = 0
+        self.messages = []
+        self.drop_after_data = 0
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        super().__init__(self, hostname="127.0.0.1", port=port, tls_context=_self_signed_context(),
+                         authenticator=self._authenticate, auth_require_tls=True)
+        self.latency = latency
+
+    def factory(self):
+        smtp = _SlowSMTP(self.handler, **self.SMTP_kwargs)
+        smtp.latency = self.latency
+        return smtp
+
+    def _authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=True)
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        if self.drop_after_data:
+            self.drop_after_data -= 1
+            server.transport.close()
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,48 @@
+import json
+
+import pika
+import pytest
+
+from app import consumer
+
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+        self.acked = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties.headers))
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+
+BODY = json.dumps({"mp3_fid": "m1", "username": "alice@example.com"}).encode()
+
+
+@pytest.mark.parametrize("retries_so_far, queue", [(0, "mp3.retry.1"), (2, "mp3.retry.3")])
+def test_transient_failure_backs_off_one_step(retries_so_far, queue):
+    channel = FakeChannel()
+    properties = pika.BasicProperties(headers={consumer.RETRY_COUNT_HEADER: retries_so_far})
+
+    consumer.handle_failure(channel, 7, properties, BODY, TimeoutError("smtp timed out"))
+
+    routing_key, body, headers = channel.published[0]
+    assert (routing_key, body) == (queue, BODY)
+    assert headers[consumer.RETRY_COUNT_HEADER] == retries_so_far + 1
+    assert channel.acked == [7]
+
+
+@pytest.mark.parametrize("permanent, retries_so_far", [(True, 0), (False, consumer.NOTIFICATION_MAX_RETRIES)])
+def test_permanent_or_exhausted_failure_is_dead_lettered(permanent, retries_so_far):
+    channel = FakeChannel()
+    properties = pika.BasicProperties(headers={consumer.RETRY_COUNT_HEADER: retries_so_far})
+
+    consumer.handle_failure(channel, 7, properties, BODY, "550 no such user", permanent=permanent)
+
+    routing_key, body, _ = channel.published[0]
+    assert routing_key == "mp3.dead"
+    assert json.loads(body) == {"mp3_fid": "m1", "username": "alice@example.com",
+                                "error": "550 no such user", "retries": retries_so_far}
+    assert channel.acked == [7]
@@ -0,0 +1,24 @@
+import smtplib
+
+import pytest
+
+from app import notifier
+
+
+def _refused(code):
+    return smtplib.SMTPRecipientsRefused({"alice@example.com": (code, b"rejected")})
+
+
+@pytest.mark.parametrize("error, permanent", [
+    (_refused(550), True),  # no such mailbox
+    (_refused(553), True),  # mailbox name not allowed
+    (_refused(450), False),  # mailbox busy / greylisted
+    (smtplib.SMTPAuthenticationError(535, b"authentication failed"), False),
+    (smtplib.SMTPSenderRefused(553, b"sender not allowed", "noreply@example.com"), False),
+    (smtplib.SMTPDataError(554, b"relay access denied"), False),
+    (smtplib.SMTPServerDisconnected("connection lost"), False),
+    (notifier.NotificationConfigError("Missing EMAIL_SENDER_ADDRESS"), True),
+    (KeyError("mp3_fid"), True),
+])
+def test_only_rejected_recipients_are_permanent(error, permanent):
+    assert notifier.is_permanent(error) == permanent
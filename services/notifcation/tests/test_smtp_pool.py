@@ -0,0 +1,86 @@
+import smtplib
+import threading
+from email.message import EmailMessage
+
+import pytest
+
+from app.smtp_pool import SMTPSessionPool
+
+
+def _message(n):
+    msg = EmailMessage()
+    msg.set_content(f"mp3 file_id: {n} is now ready!")
+    msg["Subject"] = "MP3 Download"
+    msg["From"] = "sender@example.com"
+    msg["To"] = f"user{n}@example.com"
+    return msg
+
+
+def _pool(server, **kwargs):
+    return SMTPSessionPool("key", "secret", host=server.hostname, port=server.port, **kwargs)
+
+
+def test_concurrent_sends_share_logged_in_sessions(smtp_server):
+    pool = _pool(smtp_server, size=2)
+
+    def send(start):
+        for n in range(start, start + 10):
+            pool.send_message(_message(n))
+
+    threads = [threading.Thread(target=send, args=(n * 10,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    assert len(smtp_server.messages) == 40
+    assert smtp_server.logins <= 2
+
+
+def test_sequential_sends_reuse_one_session(smtp_server):
+    pool = _pool(smtp_server)
+
+    for n in range(5):
+        pool.send_message(_message(n))
+    pool.close()
+
+    assert smtp_server.logins == 1
+    assert [e.rcpt_tos for e in smtp_server.messages] == [[f"user{n}@example.com"] for n in range(5)]
+
+
+def test_exhausted_pool_times_out(smtp_server):
+    pool = _pool(smtp_server, size=1, acquire_timeout=0.1)
+    held = pool._acquire()
+
+    with pytest.raises(ConnectionError, match="exhausted"):
+        pool.send_message(_message(1))
+
+    pool._release(held)
+    pool.send_message(_message(2))
+    pool.close()
+    assert len(smtp_server.messages) == 1
+
+
+def test_dropped_session_is_replaced(smtp_server):
+    pool = _pool(smtp_server, size=1)
+    session = pool._acquire()
+    session.smtp.close()  # e.g. the server timed out the idle connection
+    pool._release(session)
+
+    pool.send_message(_message(1))
+    pool.close()
+
+    assert smtp_server.logins == 2
+    assert len(smtp_server.messages) == 1
+
+
+def test_connection_lost_after_data_is_not_resent(smtp_server):
+    pool = _pool(smtp_server, size=1)
+    smtp_server.drop_after_data = 1  # accepts the message, then drops before replying
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        pool.send_message(_message(1))
+    pool.close()
+
+    assert len(smtp_server.messages) == 1